@@ -1,13 +1,79 @@
 # flake8: noqa
-from .data import (
-    bed,
-    bed_uncertainty,
-    gl04c_to_wgs84,
-    icemask,
-    load_data,
-    rockmask,
-    surface,
-    thickness,
-)
+"""
+The public functions are imported lazily from their submodules on first
+access so that `import bedmap2` doesn't import rasterio, scipy, matplotlib
+or asyncio until they are needed.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, List
 
 __version__ = "0.0.1"
+
+# the submodule that defines each public function
+_exports: Dict[str, str] = {
+    "asample": "aio",
+    "bed": "data",
+    "bed_uncertainty": "data",
+    "classify": "data",
+    "contours": "contouring",
+    "gl04c_to_wgs84": "data",
+    "icemask": "data",
+    "load_data": "data",
+    "nearest_feature": "data",
+    "normal": "data",
+    "register_layer": "data",
+    "rockmask": "data",
+    "sample": "data",
+    "surface": "data",
+    "thickness": "data",
+    "unregister_layer": "data",
+    "stats": "instrument",
+    "Sampler": "sampler",
+    "grid_points": "gridding",
+    "random_points": "montecarlo",
+    "ice_path_length": "raytrace",
+    "render_tile": "tiles",
+    "viewshed": "viewshed",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name: str) -> Any:
+    if name in _exports:
+        value = getattr(import_module(f".{_exports[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
+
+
+if TYPE_CHECKING:
+    from .aio import asample
+    from .contouring import contours
+    from .data import (
+        bed,
+        bed_uncertainty,
+        classify,
+        gl04c_to_wgs84,
+        icemask,
+        load_data,
+        nearest_feature,
+        normal,
+        register_layer,
+        rockmask,
+        sample,
+        surface,
+        thickness,
+        unregister_layer,
+    )
+    from .gridding import grid_points
+    from .instrument import stats
+    from .montecarlo import random_points
+    from .raytrace import ice_path_length
+    from .sampler import Sampler
+    from .tiles import render_tile
+    from .viewshed import viewshed
@@ -0,0 +1,257 @@
+"""
+An asyncio front end that coalesces concurrent sampling requests.
+"""
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+
+# the key used to group requests into batches
+BatchKey = Tuple[Tuple[str, ...], str]
+
+# a single pending request - the coordinates and the future for its result
+Request = Tuple[np.ndarray, np.ndarray, "asyncio.Future[Dict[str, ma.masked_array]]"]
+
+
+class Coalescer:
+    """
+    Coalesce sampling requests that arrive within `window` seconds of each
+    other into a single vectorized call to `data.sample`.
+
+    Requests for the same layers and mode are concatenated, sampled in
+    `executor` (the event loop's default executor if None) so neither
+    loading layers nor sampling blocks the event loop, and the results
+    are split back out to each request.
+
+    Parameters
+    ----------
+    window: float
+        The time (in seconds) to wait for other requests before sampling.
+    maxsize: int
+        Sample immediately once this many points are waiting.
+    executor: Optional[Executor]
+        The executor used to load and sample the layers.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.002,
+        maxsize: int = 1_000_000,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.window = window
+        self.maxsize = maxsize
+        self.executor = executor
+
+        # the pending requests and the number of waiting points for each key
+        self.pending: Dict[BatchKey, List[Request]] = {}
+        self.npoints: Dict[BatchKey, int] = {}
+
+        # the handle of the scheduled flush for each key
+        self.timers: Dict[BatchKey, asyncio.TimerHandle] = {}
+
+        # the number of batches and requests that have been sampled
+        self.batches = 0
+        self.requests = 0
+
+    async def sample(
+        self,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        layers: Sequence[str],
+        mode: str = "latlon",
+    ) -> Dict[str, ma.masked_array]:
+        """
+        Sample `layers` at each point - see `data.sample`.
+
+        Parameters
+        ----------
+        lat or x: np.ndarray
+            The latitude of each point in degrees or PS coordinate in meters.
+        lon or y: np.ndarray
+            The longitude of each point in degrees or PS coordinate in meters.
+        layers: Sequence[str]
+            The names of the datasets to load.
+        mode: str
+            Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+        Returns
+        -------
+        values: Dict[str, ma.masked_array]
+            The values of each dataset at each location.
+        """
+        if mode not in ("latlon", "xy"):
+            raise ValueError(f"{mode} is an invalid dataset access mode.")
+
+        loop = asyncio.get_running_loop()
+
+        # flatten the coordinates so they can be concatenated
+        lat, lon = np.broadcast_arrays(lat, lon)
+        shape = lat.shape
+
+        # add this request to the pending batch for these layers
+        key = (tuple(layers), mode)
+        future = loop.create_future()
+        self.pending.setdefault(key, []).append((lat.ravel(), lon.ravel(), future))
+        self.npoints[key] = self.npoints.get(key, 0) + lat.size
+
+        # and sample now if the batch is full, or schedule the batch
+        if self.npoints[key] >= self.maxsize:
+            self.flush(key)
+        elif key not in self.timers:
+            self.timers[key] = loop.call_later(self.window, self.flush, key)
+
+        # wait for our results and restore the shape of the inputs
+        values = await future
+        return {name: value.reshape(shape) for name, value in values.items()}
+
+    def flush(self, key: BatchKey) -> None:
+        """
+        Sample all the pending requests for `key` as a single batch.
+        """
+
+        # cancel the scheduled flush and take the pending requests
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        requests = self.pending.pop(key, [])
+        self.npoints.pop(key, None)
+        if not requests:
+            return
+
+        # concatenate the coordinates of every request
+        lat = np.concatenate([request[0] for request in requests])
+        lon = np.concatenate([request[1] for request in requests])
+
+        # and sample them all in the executor
+        layers, mode = key
+        batch = asyncio.ensure_future(self.run(lat, lon, layers, mode))
+        batch.add_done_callback(lambda batch: self.split(requests, batch))
+
+        self.batches += 1
+        self.requests += len(requests)
+
+    async def run(
+        self, lat: np.ndarray, lon: np.ndarray, layers: Sequence[str], mode: str
+    ) -> Dict[str, ma.masked_array]:
+        """
+        Sample a batch in the executor once all of its layers are loaded.
+        """
+
+        # batches for different keys share the loads of their layers
+        await asyncio.gather(*(aload(name, self.executor) for name in set(layers)))
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, data.sample, lat, lon, layers, mode
+        )
+
+    @staticmethod
+    def split(requests: List[Request], batch: "asyncio.Future") -> None:
+        """
+        Split the results of a batch back out to each request.
+        """
+
+        # forward any error to every request
+        if batch.exception() is not None:
+            for _, _, future in requests:
+                if not future.done():
+                    future.set_exception(batch.exception())  # type: ignore
+            return
+
+        # otherwise give each request its slice of the results
+        values = batch.result()
+        start = 0
+        for lat, _, future in requests:
+            stop = start + lat.size
+            if not future.done():
+                future.set_result({k: v[start:stop] for k, v in values.items()})
+            start = stop
+
+
+# the default coalescer for each event loop
+coalescers: "WeakKeyDictionary[asyncio.AbstractEventLoop, Coalescer]" = (
+    WeakKeyDictionary()
+)
+
+
+async def asample(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    layers: Sequence[str],
+    mode: str = "latlon",
+) -> Dict[str, ma.masked_array]:
+    """
+    Asynchronously sample `layers` at each point.
+
+    Concurrent requests on the same event loop that arrive within a short
+    window are coalesced into a single vectorized batch that is sampled in
+    the default executor - see `Coalescer`.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    layers: Sequence[str]
+        The names of the datasets to load.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+    Returns
+    -------
+    values: Dict[str, ma.masked_array]
+        The values of each dataset at each location.
+    """
+
+    # get the coalescer for the current event loop
+    loop = asyncio.get_running_loop()
+    if loop not in coalescers:
+        coalescers[loop] = Coalescer()
+
+    # and sample the points
+    return await coalescers[loop].sample(lat, lon, layers, mode)
+
+
+# the layers that are being loaded on each event loop
+loading: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+    WeakKeyDictionary()
+)
+
+
+async def aload(name: str, executor: Optional[Executor] = None) -> ma.masked_array:
+    """
+    Load a BEDMAP data file without blocking the event loop - see `load_data`.
+
+    Concurrent loads of the same layer on an event loop share a single
+    call to `load_data` so each layer is only decoded once.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP data file to load.
+    executor: Optional[Executor]
+        The executor used to load the layer (the default executor if None).
+
+    Returns
+    -------
+    data: ma.masked_array
+        The loaded datafile as a numpy masked array.
+    """
+    loop = asyncio.get_running_loop()
+    inflight = loading.setdefault(loop, {})
+
+    # start loading the layer if it isn't already being loaded
+    if name not in inflight:
+        future = loop.run_in_executor(executor, data.load_data, name)
+        inflight[name] = future
+        future.add_done_callback(lambda _: inflight.pop(name, None))
+
+    # and don't cancel the shared load if this waiter is cancelled
+    return await asyncio.shield(inflight[name])
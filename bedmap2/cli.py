@@ -0,0 +1,381 @@
+"""
+Command-line tools for bulk sampling of the BEDMAP2 layers.
+"""
+import argparse
+import itertools
+import os.path as op
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+from typing import IO, Deque, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+
+# the formats that we can read and write
+formats = ["csv", "npy", "bin"]
+
+# the character that starts a comment in a CSV file
+comments = "#"
+
+
+def guess_format(filename: str, fmt: Optional[str]) -> str:
+    """
+    Return `fmt` if it is given, otherwise guess the format from the
+    extension of `filename` (defaulting to CSV).
+
+    Parameters
+    ----------
+    filename: str
+        The name of the file.
+    fmt: Optional[str]
+        The user-specified format.
+
+    Returns
+    -------
+    fmt: str
+        One of 'csv', 'npy' or 'bin'.
+    """
+    if fmt is not None:
+        return fmt
+
+    # get the extension without the leading period
+    ext = op.splitext(filename)[1].lstrip(".").lower()
+
+    # and treat anything unknown as CSV
+    return ext if ext in formats else "csv"
+
+
+def has_data(line: str) -> bool:
+    """
+    Return True if a line of a CSV file contains data - `np.loadtxt`
+    ignores blank lines and anything after a comment character.
+    """
+    return bool(line.split(comments, 1)[0].strip())
+
+
+def read_chunks(
+    filename: str,
+    fmt: str,
+    columns: Sequence[int],
+    chunksize: int,
+    delimiter: str = ",",
+    skiprows: int = 0,
+    ncols: int = 2,
+    dtype: str = "float64",
+) -> Iterator[np.ndarray]:
+    """
+    Read the coordinates from `filename` in chunks of `chunksize` rows.
+
+    NPY files are memory-mapped and raw binary files are treated as
+    a C-ordered array of `ncols` columns of `dtype` so only one chunk
+    is ever held in memory.
+
+    Parameters
+    ----------
+    filename: str
+        The name of the input file.
+    fmt: str
+        The format of the input file ('csv', 'npy' or 'bin').
+    columns: Sequence[int]
+        The two columns that contain the coordinates.
+    chunksize: int
+        The number of rows in each chunk.
+    delimiter: str
+        The delimiter between columns of a CSV file.
+    skiprows: int
+        The number of header rows to skip in a CSV file.
+    ncols: int
+        The number of columns in a raw binary file.
+    dtype: str
+        The data type of a raw binary file.
+
+    Returns
+    -------
+    chunk: Iterator[np.ndarray]
+        A (N, 2) array of coordinates for each chunk.
+    """
+
+    # the CSV files are parsed a chunk of lines at a time
+    if fmt == "csv":
+        with open(filename, "r") as f:
+            for line in itertools.islice(f, skiprows):
+                pass
+            rows = filter(has_data, f)
+            while True:
+                lines = list(itertools.islice(rows, chunksize))
+                if not lines:
+                    return
+                yield np.loadtxt(
+                    lines,
+                    delimiter=delimiter,
+                    comments=comments,
+                    usecols=columns,
+                    ndmin=2,
+                    dtype=float,
+                )
+
+    # NPY and raw binary files are memory-mapped
+    if fmt == "npy":
+        values = np.load(filename, mmap_mode="r")
+    elif fmt == "bin":
+        values = np.memmap(filename, dtype=dtype, mode="r").reshape((-1, ncols))
+    else:
+        raise ValueError(f"{fmt} is not a valid input format")
+
+    # and copy out one chunk of the requested columns at a time
+    for start in range(0, values.shape[0], chunksize):
+        stop = start + chunksize
+        yield np.asarray(values[start:stop][:, columns], dtype=float)
+
+
+def count_rows(
+    filename: str, fmt: str, skiprows: int = 0, ncols: int = 2, dtype: str = "float64"
+) -> int:
+    """
+    Count the number of rows in `filename` without loading it.
+
+    Parameters
+    ----------
+    filename: str
+        The name of the input file.
+    fmt: str
+        The format of the input file ('csv', 'npy' or 'bin').
+    skiprows: int
+        The number of header rows to skip in a CSV file.
+    ncols: int
+        The number of columns in a raw binary file.
+    dtype: str
+        The data type of a raw binary file.
+
+    Returns
+    -------
+    nrows: int
+        The number of rows in the file.
+    """
+    if fmt == "csv":
+        with open(filename, "r") as f:
+            # skip the header rows and count the lines that np.loadtxt reads
+            for line in itertools.islice(f, skiprows):
+                pass
+            return sum(1 for line in f if has_data(line))
+    elif fmt == "npy":
+        return np.load(filename, mmap_mode="r").shape[0]
+    else:
+        return np.memmap(filename, dtype=dtype, mode="r").size // ncols
+
+
+def source_spec(value: str) -> Tuple[str, str]:
+    """
+    Parse a NAME=PATH command-line argument into a (name, path) pair.
+    """
+    name, sep, path = value.partition("=")
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError(f"{value} is not of the form NAME=PATH")
+    return name, path
+
+
+def register_sources(specs: Sequence[Tuple[str, str]]) -> None:
+    """
+    Register each (name, path) raster as a layer if it isn't already
+    registered - this is also used to initialize each worker process.
+    """
+    for name, path in specs:
+        if name not in data.sources:
+            data.register_layer(name, path)
+
+
+def sample_chunk(args: Tuple[np.ndarray, Sequence[str], str]) -> np.ndarray:
+    """
+    Sample `layers` at a (N, 2) chunk of coordinates and return a
+    (N, 2 + len(layers)) array of the coordinates and the layer values
+    with NaN wherever a layer is missing data.
+
+    Parameters
+    ----------
+    args: Tuple[np.ndarray, Sequence[str], str]
+        The chunk of coordinates, the names of the layers, and the mode.
+
+    Returns
+    -------
+    values: np.ndarray
+        The coordinates and the value of each layer at each point.
+    """
+    coords, layers, mode = args
+
+    # allocate the output array and copy in the coordinates
+    values = np.empty((coords.shape[0], 2 + len(layers)))
+    values[:, :2] = coords
+
+    # sample all the layers at once
+    sampled = data.sample(coords[:, 0], coords[:, 1], layers, mode=mode)
+
+    # and fill the missing data with NaN
+    for i, name in enumerate(layers):
+        values[:, 2 + i] = ma.filled(
+            ma.masked_array(sampled[name], dtype=float), np.nan
+        )
+
+    return values
+
+
+class Writer:
+    """
+    Stream chunks of rows into an output file of the given format.
+    """
+
+    def __init__(
+        self, filename: str, fmt: str, header: List[str], nrows: Optional[int]
+    ) -> None:
+        self.fmt = fmt
+        self.nrows = nrows
+        self.row = 0
+        self.file: Optional[IO] = None
+        self.array: Optional[np.memmap] = None
+
+        if fmt == "csv":
+            self.file = open(filename, "w")
+            self.file.write(",".join(header) + "\n")
+        elif fmt == "bin":
+            self.file = open(filename, "wb")
+        elif fmt == "npy":
+            # NPY files need their shape up front so we write into a memmap
+            self.array = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=float, shape=(nrows, len(header))
+            )
+        else:
+            raise ValueError(f"{fmt} is not a valid output format")
+
+    def write(self, values: np.ndarray) -> None:
+        """
+        Write a chunk of rows to the output.
+        """
+        if self.array is not None:
+            start, stop = self.row, self.row + values.shape[0]
+            self.array[start:stop] = values
+        elif self.fmt == "csv":
+            np.savetxt(self.file, values, delimiter=",", fmt="%.10g")  # type: ignore
+        else:
+            self.file.write(np.ascontiguousarray(values).tobytes())  # type: ignore
+        self.row += values.shape[0]
+
+    def close(self) -> None:
+        """
+        Flush and close the output.
+
+        Raises a ValueError if the output was sized for a different
+        number of rows than were written.
+        """
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.nrows is not None and self.row != self.nrows:
+            raise ValueError(f"wrote {self.row} rows but expected {self.nrows}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Sample BEDMAP2 layers at the coordinates in a file.
+
+    This is installed as the `bedmap2-sample` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="bedmap2-sample",
+        description="Sample BEDMAP2 layers at the coordinates in a file.",
+    )
+    parser.add_argument("input", help="the CSV, NPY or raw binary input file")
+    parser.add_argument("output", help="the CSV, NPY or raw binary output file")
+    parser.add_argument(
+        "-l", "--layers", nargs="+", default=["bed", "surface", "thickness"]
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        type=source_spec,
+        default=[],
+        help="register the raster at PATH as the layer NAME",
+        metavar="NAME=PATH",
+    )
+    parser.add_argument("-m", "--mode", choices=["latlon", "xy"], default="latlon")
+    parser.add_argument("-c", "--columns", nargs=2, type=int, default=[0, 1])
+    parser.add_argument("--input-format", choices=formats, default=None)
+    parser.add_argument("--output-format", choices=formats, default=None)
+    parser.add_argument("--delimiter", default=",")
+    parser.add_argument("--skiprows", type=int, default=0)
+    parser.add_argument("--ncols", type=int, default=2, help="columns in binary input")
+    parser.add_argument("--dtype", default="float64", help="dtype of binary input")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    # register any extra rasters
+    register_sources(args.source)
+
+    # work out the input and output formats
+    infmt = guess_format(args.input, args.input_format)
+    outfmt = guess_format(args.output, args.output_format)
+
+    # NPY outputs need to know the number of rows up front
+    nrows = None
+    if outfmt == "npy":
+        nrows = count_rows(args.input, infmt, args.skiprows, args.ncols, args.dtype)
+
+    # the names of the output columns
+    coords = ["lat", "lon"] if args.mode == "latlon" else ["x", "y"]
+    writer = Writer(args.output, outfmt, coords + list(args.layers), nrows)
+
+    # the chunks of coordinates that we sample
+    chunks = (
+        (chunk, list(args.layers), args.mode)
+        for chunk in read_chunks(
+            args.input,
+            infmt,
+            args.columns,
+            args.chunksize,
+            args.delimiter,
+            args.skiprows,
+            args.ncols,
+            args.dtype,
+        )
+    )
+
+    start = time.perf_counter()
+    try:
+        if args.workers > 1:
+            with Pool(args.workers, register_sources, (args.source,)) as pool:
+                # keep a bounded number of chunks in flight and write in order
+                pending: Deque = deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(sample_chunk, (chunk,)))
+                    if len(pending) >= 2 * args.workers:
+                        writer.write(pending.popleft().get())
+                while pending:
+                    writer.write(pending.popleft().get())
+        else:
+            for values in map(sample_chunk, chunks):
+                writer.write(values)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    # and report the throughput
+    if not args.quiet:
+        print(
+            f"Sampled {writer.row} points in {elapsed:.2f} s "
+            f"({writer.row / max(elapsed, 1e-9):.0f} points/s).",
+            file=sys.stderr,
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
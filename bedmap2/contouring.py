@@ -0,0 +1,350 @@
+"""
+Extract contour lines and feature boundaries from the BEDMAP2 layers.
+"""
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.ma as ma
+from cachetools import cached
+
+import bedmap2.data as data
+import bedmap2.instrument as instrument
+import bedmap2.transform as transform
+
+# the type of a window - (xmin, xmax, ymin, ymax) in meters
+Window = Tuple[float, float, float, float]
+
+# the (col, row) offset of each corner (a, b, c, d) of a square of cells
+corners = np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]])
+
+# the corners at the ends of each edge (top, right, bottom, left) of a square
+edges = [(0, 1), (1, 2), (3, 2), (0, 3)]
+
+# the (row, col) offset of each edge and whether it is horizontal
+edge_rows = np.array([0, 0, 1, 0])
+edge_cols = np.array([0, 1, 0, 0])
+edge_horizontal = np.array([True, False, True, False])
+
+
+class Contour(NamedTuple):
+    """
+    A single contour line of a layer.
+    """
+
+    # the level of the contour
+    level: float
+
+    # the polar stereographic coordinates of each vertex (m)
+    x: np.ndarray
+    y: np.ndarray
+
+    # the latitude and longitude of each vertex (degrees)
+    lat: np.ndarray
+    lon: np.ndarray
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the contour is a closed loop.
+        """
+        return self.x.size > 2 and self.x[0] == self.x[-1] and self.y[0] == self.y[-1]
+
+
+def segment_table() -> np.ndarray:
+    """
+    Build the marching squares table of the segments in each square.
+
+    `table[case, center]` gives up to two (start, stop) pairs of edges
+    (padded with -1) where `case` has a bit set for each corner that is
+    above the level (a = 8, b = 4, c = 2, d = 1) and `center` is whether
+    the center of a saddle square is above the level. Every segment is
+    oriented so that the cells above the level are on the same side
+    of it, so that the segments join head-to-tail into polylines.
+
+    Returns
+    -------
+    table: np.ndarray
+        The (16, 2, 2, 2) table of segments.
+    """
+
+    # the midpoint of each edge
+    midpoints = np.array([corners[p] + corners[q] for p, q in edges]) / 2.0
+
+    table = np.full((16, 2, 2, 2), -1, dtype=np.int8)
+    for case in range(16):
+        above = [bool(case & bit) for bit in (8, 4, 2, 1)]
+        crossed = [e for e, (p, q) in enumerate(edges) if above[p] != above[q]]
+        for center in (0, 1):
+            # saddles cut off the two corners that differ from the center
+            if len(crossed) == 4:
+                cut = above[0] != bool(center)
+                pairs = [(0, 3), (1, 2)] if cut else [(0, 1), (2, 3)]
+            else:
+                pairs = [(crossed[0], crossed[1])] if crossed else []
+
+            for k, (start, stop) in enumerate(pairs):
+                # the corner of the start edge that is above the level
+                p, q = edges[start]
+                corner = corners[p if above[p] else q]
+
+                # and orient the segment so this corner is on its right
+                d = midpoints[stop] - midpoints[start]
+                v = corner - midpoints[start]
+                if d[0] * v[1] - d[1] * v[0] < 0:
+                    start, stop = stop, start
+                table[case, center, k] = start, stop
+
+    return table
+
+
+# the marching squares table
+table = segment_table()
+
+
+def trace(z: np.ndarray, level: float) -> List[np.ndarray]:
+    """
+    Trace the contours of `z` at `level` with marching squares.
+
+    The squares are classified and their segments are built with array
+    operations over the whole grid. Squares with a NaN corner are skipped
+    so contours end at missing data. Saddles are resolved with the mean
+    of the four corners of the square.
+
+    Parameters
+    ----------
+    z: np.ndarray
+        The (nrows, ncols) values with NaN where there is no data.
+    level: float
+        The level of the contours.
+
+    Returns
+    -------
+    polylines: List[np.ndarray]
+        Each contour as a (N, 2) array of fractional (col, row) indices
+        into `z` - closed contours repeat their first vertex.
+    """
+    nrows, ncols = z.shape
+    if nrows < 2 or ncols < 2:
+        return []
+
+    # classify every square by the corners that are above the level
+    with np.errstate(invalid="ignore"):
+        above = (z >= level).astype(np.uint8)
+    finite = np.isfinite(z)
+    case = (above[:-1, :-1] << 3) | (above[:-1, 1:] << 2)
+    case |= (above[1:, 1:] << 1) | above[1:, :-1]
+    valid = finite[:-1, :-1] & finite[:-1, 1:] & finite[1:, 1:] & finite[1:, :-1]
+
+    # find the squares that the contour passes through
+    rows, cols = np.nonzero(valid & (case != 0) & (case != 15))
+    case = case[rows, cols]
+
+    # resolve the saddles with the mean of the corners
+    center = np.zeros(rows.size, dtype=np.intp)
+    saddle = (case == 5) | (case == 10)
+    r, c = rows[saddle], cols[saddle]
+    mean = (z[r, c] + z[r, c + 1] + z[r + 1, c + 1] + z[r + 1, c]) / 4.0
+    center[saddle] = mean >= level
+
+    # get the segments in each square
+    segments = table[case, center]
+    square, k = np.nonzero(segments[:, :, 0] >= 0)
+    local = segments[square, k].astype(np.intp)
+    r, c = rows[square, None] + edge_rows[local], cols[square, None] + edge_cols[local]
+
+    # and give every edge of the grid a unique id
+    nhorizontal = nrows * (ncols - 1)
+    ids = np.where(
+        edge_horizontal[local], r * (ncols - 1) + c, nhorizontal + r * ncols + c
+    ).astype(np.int64)
+    start, stop = ids[:, 0], ids[:, 1]
+
+    # find the segment that starts where each segment stops
+    order = np.argsort(start, kind="stable")
+    position = np.minimum(np.searchsorted(start[order], stop), start.size - 1)
+    found = start[order[position]] == stop
+    following = np.where(found, order[position], -1)
+    has_previous = np.zeros(start.size, dtype=bool)
+    has_previous[following[found]] = True
+
+    # and follow the segments from each head (and then around each loop)
+    following_list = following.tolist()
+    visited = bytearray(start.size)
+    sequence: List[int] = []
+    lengths = []
+    heads = np.flatnonzero(~has_previous).tolist() + list(range(start.size))
+    for head in heads:
+        if visited[head]:
+            continue
+        first = len(sequence)
+        segment = head
+        while segment >= 0 and not visited[segment]:
+            visited[segment] = 1
+            sequence.append(segment)
+            segment = following_list[segment]
+        lengths.append(len(sequence) - first)
+    if not lengths:
+        return []
+
+    # the edges along each polyline - the start of its first segment
+    # followed by the stop of every segment
+    chained = np.asarray(sequence)
+    counts = np.asarray(lengths)
+    chain = np.repeat(np.arange(counts.size), counts)
+    firsts = np.cumsum(counts) - counts
+    flat = np.empty(chained.size + counts.size, dtype=np.int64)
+    flat[np.arange(chained.size) + chain + 1] = stop[chained]
+    flat[firsts + np.arange(counts.size)] = start[chained[firsts]]
+
+    # interpolate the crossing point along each edge
+    horizontal = flat < nhorizontal
+    i, j = np.divmod(flat, ncols - 1)
+    vi, vj = np.divmod(flat - nhorizontal, ncols)
+    i, j = np.where(horizontal, i, vi), np.where(horizontal, j, vj)
+    z0 = z[i, j].astype(float)
+    z1 = z[i + ~horizontal, j + horizontal].astype(float)
+    t = (level - z0) / (z1 - z0)
+    points = np.column_stack((j + t * horizontal, i + t * ~horizontal))
+
+    # and split them into each polyline
+    splits = np.cumsum(counts + 1)[:-1]
+    return np.split(points, splits)
+
+
+def cell_centers(
+    name: str, col: np.ndarray, row: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert fractional (col, row) indices of the layer `name` into (x, y) (m).
+    """
+    grid = data.layer_grid(name)
+    if grid == transform.bedmap_grid:
+        return transform.index_to_xy(col, row)
+    x = grid.x0 + (np.asarray(col) + 0.5) * grid.resolution
+    y = grid.y0 - (np.asarray(row) + 0.5) * grid.resolution
+    return x, y
+
+
+def load_values(name: str) -> np.ndarray:
+    """
+    Load the layer `name` - or the mask of a feature for the
+    `distance_features` - so that it can be contoured.
+    """
+    if name in data.distance_features:
+        return data.feature_mask(name)
+    return data.load_data(name)
+
+
+@cached(cache={}, key=data.layer_hashkey)
+def load_contours(name: str, level: float, window: Optional[Window]) -> np.ndarray:
+    """
+    Load the contours of the layer `name` at `level`.
+
+    The contours are traced once and memory-mapped from the on-disk cache.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer or feature.
+    level: float
+        The level of the contours.
+    window: Optional[Window]
+        The (xmin, xmax, ymin, ymax) window (m) to contour.
+
+    Returns
+    -------
+    contours: np.ndarray
+        A (N, 4) array of the (x, y, lat, lon) of each vertex
+        where each contour is followed by a row of NaN.
+    """
+
+    def build() -> np.ndarray:
+        layer = load_values(name)
+        nrows, ncols = layer.shape
+
+        # the cells that cover the window (with a cell of padding)
+        row0, col0 = 0, 0
+        if window is not None:
+            xmin, xmax, ymin, ymax = window
+            x0, y0 = cell_centers(name, np.asarray(0.0), np.asarray(0.0))
+            resolution = data.layer_grid(name).resolution
+            col0 = int(np.clip(np.floor((xmin - x0) / resolution), 0, ncols))
+            col1 = int(np.clip(np.ceil((xmax - x0) / resolution) + 1, 0, ncols))
+            row0 = int(np.clip(np.floor((y0 - ymax) / resolution), 0, nrows))
+            row1 = int(np.clip(np.ceil((y0 - ymin) / resolution) + 1, 0, nrows))
+            layer = layer[row0:row1, col0:col1]
+
+        # trace the contours over the window
+        z = ma.filled(ma.masked_array(layer, dtype=np.float32), np.nan)
+        with instrument.stage("contours.trace"):
+            polylines = trace(z, level)
+
+        # and convert each polyline into (x, y) and (lat, lon)
+        rows = []
+        for line in polylines:
+            x, y = cell_centers(name, line[:, 0] + col0, line[:, 1] + row0)
+            lat, lon = transform.xy_to_latlon(x, y)
+            rows.append(np.column_stack((x, y, lat, lon)))
+            rows.append(np.full((1, 4), np.nan))
+
+        return np.concatenate(rows) if rows else np.zeros((0, 4))
+
+    # the cached file is keyed by layer, level and window
+    key = f"{data.cache_key(name)}_{level!r}"
+    if window is not None:
+        key += "_" + "_".join(repr(float(edge)) for edge in window)
+
+    return data.load_cached(f"contours_{key}.npy", build)
+
+
+def contours(
+    name: str,
+    levels: Union[float, Sequence[float]],
+    window: Optional[Window] = None,
+) -> List[Contour]:
+    """
+    Extract the contours of a layer at one or more levels.
+
+    The contours are traced with vectorized marching squares between the
+    centers of the cells of the layer, and are cached on disk by layer,
+    level and window. Contours end where the layer has no data.
+
+    The boundaries of the `distance_features` can be extracted by passing
+    the name of the feature and a level of 0.5, i.e. 'grounding_line' for
+    the edge of the grounded ice and 'ice_edge' for the ice-shelf front
+    and the coastline.
+
+    Parameters
+    ----------
+    name: str
+        The name of a layer or of one of the `data.distance_features`.
+    levels: Union[float, Sequence[float]]
+        The level (or levels) to contour.
+    window: Optional[Window]
+        If given, only contour the (xmin, xmax, ymin, ymax) window (in m).
+
+    Returns
+    -------
+    contours: List[Contour]
+        Every contour line at every level.
+    """
+    if window is not None:
+        window = (
+            float(window[0]),
+            float(window[1]),
+            float(window[2]),
+            float(window[3]),
+        )
+
+    result = []
+    for level in np.atleast_1d(np.asarray(levels, dtype=float)).tolist():
+        # load the contours at this level - these are cached
+        lines = load_contours(name, level, window)
+
+        # and split them at the rows of NaN
+        breaks = np.flatnonzero(np.isnan(lines[:, 0])) + 1
+        for line in np.split(lines, breaks)[:-1]:
+            line = line[:-1]
+            result.append(Contour(level, *(line[:, k] for k in range(4))))
+
+    return result
@@ -1,13 +1,16 @@
+import hashlib
+import json
 import os
 from os.path import abspath, dirname, join
-from typing import Any
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
 import numpy as np
 import numpy.ma as ma
-import rasterio
 from cachetools import cached
+from cachetools.keys import hashkey
 
 import bedmap2.downloader as downloader
+import bedmap2.instrument as instrument
 import bedmap2.transform as transform
 
 # the default directory if BEDMAP_DATA is not defined
@@ -18,8 +21,420 @@ default_bedmap_dir = join(
 # if BEDMAP_DATA is defined, use that - otherwise use the default directory.
 bedmap_dir = os.environ.get("BEDMAP2_DATA", default_bedmap_dir)
 
+# if BEDMAP2_FORMAT is 'npy', layers are converted into memory-mappable NPY
+# files when they are extracted - otherwise the GeoTIFFs are extracted.
+layer_format = os.environ.get("BEDMAP2_FORMAT", "tif")
 
-@cached(cache={})
+# the layers that are stored in the BEDMAP2 archive
+archive_layers = [
+    "bed",
+    "coverage",
+    "grounded_bed_uncertainty",
+    "rockmask",
+    "icemask_grounded_and_shelves",
+    "lakemask_vostok",
+    "surface",
+    "thickness",
+    "thickness_uncertainty_5km",
+    "gl04c_geiod_to_WGS84",
+]
+
+# the layers that we derive from the gradient of a BEDMAP layer
+gradient_layers = [
+    f"{layer}_{kind}"
+    for layer in ("surface", "bed")
+    for kind in ("dx", "dy", "slope", "aspect")
+]
+
+# the features that we can compute distance fields to
+distance_features = ["grounding_line", "ice_edge", "rock"]
+
+# the layers that we derive from the distance to each feature
+distance_layers = [
+    f"{kind}_to_{feature}"
+    for feature in distance_features
+    for kind in ("distance", "signed_distance")
+]
+
+# the layer that each distance feature is derived from
+feature_layers = {
+    "grounding_line": "icemask_grounded_and_shelves",
+    "ice_edge": "icemask_grounded_and_shelves",
+    "rock": "rockmask",
+}
+
+# the layers that the packed classification layer is derived from
+classification_layers = ["icemask_grounded_and_shelves", "rockmask", "lakemask_vostok"]
+
+# the bit flags used in the packed classification layer
+OCEAN = 0
+GROUNDED = 1
+FLOATING = 2
+ROCK = 4
+VOSTOK = 8
+
+
+class Source(NamedTuple):
+    """
+    A raster registered as a layer with `register_layer`.
+    """
+
+    # the path to the GeoTIFF or NPY file
+    path: str
+
+    # the value used for missing data (or None if there is none)
+    nodata: Optional[float]
+
+    # the geometry of the raster
+    grid: transform.Grid
+
+    # identifies this version of the file in the on-disk cache
+    key: str
+
+
+# the rasters that have been registered with `register_layer`
+sources: Dict[str, Source] = {}
+
+
+def cache_dir() -> str:
+    """
+    Return the directory where derived layers are cached on disk.
+
+    If BEDMAP2_CACHE is defined, use that - otherwise use
+    a `derived` directory inside the BEDMAP data directory.
+
+    Returns
+    -------
+    directory: str
+        The directory used to cache derived layers.
+    """
+    return os.environ.get("BEDMAP2_CACHE", join(bedmap_dir, "derived"))
+
+
+def load_cached(filename: str, build: Callable[[], np.ndarray]) -> np.ndarray:
+    """
+    Load a derived array from the on-disk cache, building it
+    with `build` and saving it to the cache if it does not exist.
+
+    The array is saved atomically so that concurrent processes
+    never see a partially written file.
+
+    Parameters
+    ----------
+    filename: str
+        The name of the cached file (in `cache_dir()`).
+    build: Callable[[], np.ndarray]
+        A function to build the array if it is not cached.
+
+    Returns
+    -------
+    data: np.ndarray
+        The cached array - memory-mapped read-only from disk.
+    """
+
+    # the full path to the cached file
+    path = join(cache_dir(), filename)
+
+    # if the file doesn't exist, build it and save it
+    if not os.path.exists(path):
+        os.makedirs(cache_dir(), exist_ok=True)
+
+        # write to a temporary file and atomically move into place
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, build())
+            os.replace(tmp, path)
+        finally:
+            # don't leave a partial file behind if the build failed
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    # and load the file as a memory-map
+    return np.load(path, mmap_mode="r")
+
+
+def builtin_layers() -> List[str]:
+    """
+    Return the names of the layers that are provided by bedmap2.
+
+    Returns
+    -------
+    names: List[str]
+        The archive layers and the layers derived from them.
+    """
+    return archive_layers + gradient_layers + distance_layers + ["classification"]
+
+
+def raster_grid(raster: Any) -> transform.Grid:
+    """
+    Return the geometry of an open rasterio dataset.
+
+    Rasters without a geotransform are assumed to be on the BEDMAP2 grid.
+
+    Parameters
+    ----------
+    raster: rasterio.DatasetReader
+        The open raster.
+
+    Returns
+    -------
+    grid: transform.Grid
+        The geometry of the raster.
+    """
+    affine = raster.transform
+
+    # the raster is not georeferenced
+    if (affine.a, affine.b, affine.c, affine.d, affine.e, affine.f) == (
+        1,
+        0,
+        0,
+        0,
+        1,
+        0,
+    ):
+        return transform.bedmap_grid
+
+    # we only support north-up rasters with square cells
+    if affine.b != 0 or affine.d != 0 or affine.a != -affine.e:
+        raise ValueError(f"{raster.name} must be north-up with square cells")
+
+    return transform.Grid(affine.c, affine.f, affine.a, raster.height, raster.width)
+
+
+def register_layer(
+    name: str,
+    path: str,
+    nodata: Optional[float] = None,
+    grid: Optional[transform.Grid] = None,
+) -> Source:
+    """
+    Register a South Polar Stereographic raster as the layer `name`.
+
+    Registered layers can be used everywhere that a BEDMAP2 layer can, i.e.
+    `load_data`, `dataset`, `sample` and the command-line tools, and are
+    cached and memory-mapped in the same way. The raster must be in the
+    same projection as BEDMAP2 but it can have its own extent and
+    resolution - points that are off the raster are masked.
+
+    Parameters
+    ----------
+    name: str
+        The name of the new layer.
+    path: str
+        The path to a GeoTIFF (or any raster that GDAL can read) or NPY file.
+    nodata: Optional[float]
+        The value used for missing data - by default, this is read from
+        the raster (NPY files have no missing data by default).
+    grid: Optional[transform.Grid]
+        The geometry of the raster - by default, this is read from the
+        geotransform of the raster (NPY files are on the BEDMAP2 grid).
+
+    Returns
+    -------
+    source: Source
+        The registered raster.
+    """
+    if name in builtin_layers() or name in sources:
+        raise ValueError(f"{name} is already a layer")
+
+    # read the shape (and the geometry and nodata if not given) from the file
+    path = abspath(path)
+    if path.endswith(".npy"):
+        shape = np.load(path, mmap_mode="r").shape
+        grid = transform.bedmap_grid if grid is None else grid
+    else:
+        import rasterio
+
+        with rasterio.open(path) as raster:
+            shape = (raster.count, raster.height, raster.width)
+            nodata = raster.nodata if nodata is None else nodata
+            grid = raster_grid(raster) if grid is None else grid
+
+        # we only read the first band
+        shape = shape[1:]
+
+    # check that the file matches its grid
+    if shape != (grid.nrows, grid.ncols):
+        raise ValueError(f"{path} has shape {shape} which does not match {grid}")
+
+    # derived layers are cached on disk by this key so they are
+    # rebuilt if the file is replaced
+    source = Source(path, nodata, grid, f"{name}-{file_key(path)}")
+
+    sources[name] = source
+    return source
+
+
+def unregister_layer(name: str) -> None:
+    """
+    Remove a layer registered with `register_layer`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the registered layer.
+    """
+    if name not in sources:
+        raise ValueError(f"{name} is not a registered layer")
+
+    # drop the layer from the in-memory caches - some of these
+    # are keyed by the source so we do this before removing it
+    for function in (load_data, load_gradient, load_integral):
+        cache = function.cache
+        if cache is not None:
+            cache.pop(function.cache_key(name), None)
+
+    del sources[name]
+
+
+def layer_grid(name: str) -> transform.Grid:
+    """
+    Return the geometry of the layer `name`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+
+    Returns
+    -------
+    grid: transform.Grid
+        The geometry of the layer.
+    """
+    return sources[name].grid if name in sources else transform.bedmap_grid
+
+
+def file_key(path: str) -> str:
+    """
+    Return a short digest of the path, size and modification time of a file.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+
+def cache_key(name: str) -> str:
+    """
+    Return the name used for the layer (or distance feature) `name`
+    in the on-disk cache.
+
+    The key changes whenever any of the files that the layer is
+    loaded or derived from are replaced, so that a shared cache
+    directory never serves stale derived data.
+    """
+    if name in sources:
+        return sources[name].key
+    elif name in archive_layers:
+        return f"{name}-{file_key(layer_path(name))}"
+
+    # derived layers are keyed by the layers that they are derived from
+    if name in gradient_layers:
+        parents = [name.rsplit("_", 1)[0]]
+    elif name in distance_layers:
+        parents = [feature_layers[name.split("_to_")[1]]]
+    elif name in distance_features:
+        parents = [feature_layers[name]]
+    elif name == "classification":
+        parents = classification_layers
+    else:
+        return name
+    keys = ":".join(cache_key(parent) for parent in parents)
+    return f"{name}-{hashlib.sha1(keys.encode()).hexdigest()[:12]}"
+
+
+def layer_hashkey(name: str, *args: Any, **kwargs: Any) -> Tuple[Any, ...]:
+    """
+    Return the in-memory cache key of a function of the layer `name`.
+
+    This uses `cache_key(name)` so that results cached in memory are
+    rebuilt (like the on-disk cache) when a layer is registered again
+    or its file is replaced.
+    """
+    return hashkey(cache_key(name), *args, **kwargs)
+
+
+def load_source(source: Source) -> ma.masked_array:
+    """
+    Load a raster registered with `register_layer`.
+
+    NPY files are memory-mapped directly. If BEDMAP2_FORMAT is 'npy',
+    other rasters are converted into the on-disk cache the first time
+    that they are loaded and are then memory-mapped.
+
+    Parameters
+    ----------
+    source: Source
+        The registered raster.
+
+    Returns
+    -------
+    data: ma.masked_array
+        The raster as a numpy masked array.
+    """
+
+    def read() -> np.ndarray:
+        import rasterio
+
+        with rasterio.open(source.path) as raster:
+            return raster.read(1)
+
+    # load the values of the raster
+    if source.path.endswith(".npy"):
+        with instrument.stage("load_data.mmap"):
+            values = np.load(source.path, mmap_mode="r")
+    elif layer_format == "npy":
+        with instrument.stage("load_data.mmap"):
+            values = load_cached(f"source_{source.key}.npy", read)
+    else:
+        with instrument.stage("load_data.decode"):
+            values = read()
+
+    # and mask the missing data
+    layer: ma.masked_array
+    if source.nodata is None:
+        layer = ma.masked_array(values)
+    elif np.isnan(source.nodata):
+        layer = ma.masked_invalid(values)
+    else:
+        layer = ma.masked_equal(values, source.nodata)
+    instrument.count("bytes_loaded", layer.nbytes)
+
+    return layer
+
+
+def layer_path(name: str) -> str:
+    """
+    Return the path to the file of the BEDMAP layer `name`, extracting
+    the layer from the archive if it is not available.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP layer.
+
+    Returns
+    -------
+    path: str
+        The converted NPY file if it exists, else the original GeoTIFF.
+    """
+
+    # check that we have a valid name
+    if name not in archive_layers:
+        raise ValueError(f"{name} is not a valid BEDMAP layer")
+
+    # if this layer is not available, extract just this layer from the archive
+    if not downloader.data_exists(name, bedmap_dir):
+        downloader.extract_layer(name, bedmap_dir, convert=layer_format == "npy")
+
+    # get the full filename
+    filename = join(bedmap_dir, downloader.layer_filename(name))
+    stem = os.path.splitext(filename)[0]
+
+    return f"{stem}.npy" if os.path.exists(f"{stem}.npy") else filename
+
+
+@cached(cache=instrument.Cache("load_data"))
 def load_data(name: str) -> ma.masked_array:
     """
     Load a BEDMAP data file specified by `name` in the BEDMAP data directory.
@@ -38,45 +453,611 @@ def load_data(name: str) -> ma.masked_array:
         The loaded datafile as a numpy masked array.
     """
 
-    # if the data is not download it, download it
-    if not downloader.data_exists():
-        downloader.download_data()
+    # derived layers are computed from the other layers
+    if name in gradient_layers:
+        layer, kind = name.rsplit("_", 1)
+        return gradient_layer(layer, kind)
+    elif name in distance_layers:
+        kind, feature = name.split("_to_")
+        return distance_layer(feature, kind)
+    elif name == "classification":
+        return ma.masked_array(load_classification())
 
-    # check that we have a valid name
-    if name not in [
-        "bed",
-        "coverage",
-        "grounded_bed_uncertainty",
-        "rockmask",
-        "icemask_grounded_and_shelves",
-        "lakemask_vostok",
-        "surface",
-        "thickness",
-        "thickness_uncertainty_5km",
-        "gl04c_geiod_to_WGS84",
-    ]:
-        raise ValueError(f"{name} is not a valid BEDMAP layer")
+    # registered layers are loaded from their own file
+    if name in sources:
+        return load_source(sources[name])
+
+    return load_layer(name)
+
+
+def load_layer(name: str) -> ma.masked_array:
+    """
+    Load the BEDMAP layer `name` from the archive without caching it.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP layer to load.
+
+    Returns
+    -------
+    data: np.ndarray
+        The loaded layer as a numpy masked array.
+    """
+
+    # get the file for this layer - extracting it if necessary
+    filename = layer_path(name)
+    stem = os.path.splitext(filename)[0]
+
+    # converted layers are memory-mapped with their nodata value alongside
+    if filename.endswith(".npy"):
+        with open(f"{stem}.json", "r") as f:
+            nodata = json.load(f)["nodata"]
+        with instrument.stage("load_data.mmap"):
+            layer = ma.masked_equal(np.load(f"{stem}.npy", mmap_mode="r"), nodata)
+        instrument.count("bytes_loaded", layer.nbytes)
+        return layer
+
+    # rasterio (and GDAL) are slow to import so only import them when needed
+    import rasterio
+
+    with instrument.stage("load_data.decode"):
+        # load the file
+        dataset = rasterio.open(filename)
+
+        # get the value used for nodata
+        nodata = dataset.meta["nodata"]
+
+        # and read the data layer from the dataset
+        layer = ma.masked_equal(dataset.read(1), nodata)
+    instrument.count("bytes_loaded", layer.nbytes)
+
+    return layer
+
+
+@cached(cache={}, key=layer_hashkey)
+def load_gradient(name: str) -> Tuple[ma.masked_array, ma.masked_array]:
+    """
+    Compute the horizontal gradient of the BEDMAP layer specified by `name`.
+
+    The gradient is computed with central differences where both neighbours
+    of a cell have valid data, and one-sided differences where only one
+    neighbour is valid, so the gradient is defined up to the edges of the
+    data. Cells without data, or without any valid neighbours, are masked.
+
+    The results of this function are cached.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP data file to differentiate.
+
+    Returns
+    -------
+    dzdx, dzdy: Tuple[ma.masked_array, ma.masked_array]
+        The gradient along the x- and y-axes (in meters per meter).
+    """
+
+    # load the layer and replace missing data with NaN
+    z = ma.filled(ma.masked_array(load_data(name), dtype=np.float32), np.nan)
+
+    # the BEDMAP grid spacing in meters
+    spacing = np.float32(1e3)
+
+    # compute the difference along each axis of the grid
+    dzdx = _difference(z, axis=1) / spacing
+
+    # NOTE: the rows of the dataset go from +y to -y
+    dzdy = _difference(z, axis=0) / -spacing
+
+    # and mask the cells where we could not compute a difference
+    return ma.masked_invalid(dzdx, copy=False), ma.masked_invalid(dzdy, copy=False)
+
+
+def _difference(z: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Compute the central difference of `z` along `axis`, falling back to a
+    one-sided difference where one of the neighbours is NaN.
+    """
+
+    # move the axis that we are differentiating to the end
+    z = np.moveaxis(z, axis, -1)
+
+    # start with the forward difference at every cell
+    diff = np.full_like(z, np.nan)
+    diff[..., :-1] = z[..., 1:] - z[..., :-1]
+
+    # use the backward difference where the forward difference is missing
+    backward = z[..., 1:] - z[..., :-1]
+    missing = np.isnan(diff[..., 1:])
+    diff[..., 1:][missing] = backward[missing]
+
+    # and use the central difference where both neighbours are valid
+    central = 0.5 * (z[..., 2:] - z[..., :-2])
+    valid = ~np.isnan(central)
+    diff[..., 1:-1][valid] = central[valid]
+
+    # cells without data of their own do not have a gradient
+    diff[np.isnan(z)] = np.nan
+
+    # and move the axis back to where it was
+    return np.moveaxis(diff, -1, axis)
+
+
+def gradient_layer(name: str, kind: str) -> ma.masked_array:
+    """
+    Compute a layer derived from the gradient of the BEDMAP layer `name`.
+
+    `kind` is one of `dx` or `dy` (the gradient along each axis in meters
+    per meter), `slope` (the slope in degrees) or `aspect` (the direction
+    of steepest descent in degrees, measured counter-clockwise from the
+    +x axis of the South Polar Stereographic Projection).
+
+    These are available as layers named `{name}_{kind}` in `load_data`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP data file to differentiate.
+    kind: str
+        The kind of gradient layer to compute.
+
+    Returns
+    -------
+    data: ma.masked_array
+        The gradient layer as a numpy masked array.
+    """
+
+    # get the gradient - this is cached
+    dzdx, dzdy = load_gradient(name)
+
+    # and compute the requested layer
+    if kind == "dx":
+        return dzdx
+    elif kind == "dy":
+        return dzdy
+    elif kind == "slope":
+        return np.degrees(np.arctan(ma.hypot(dzdx, dzdy)))
+    elif kind == "aspect":
+        return ma.mod(np.degrees(ma.arctan2(-dzdy, -dzdx)), 360.0)
+    else:
+        raise ValueError(f"{kind} is not a valid gradient layer")
+
+
+def feature_mask(feature: str) -> np.ndarray:
+    """
+    Return a boolean grid that is True on every cell of `feature`.
+
+    The `grounding_line` feature is the grounded ice, the `ice_edge`
+    feature is all ice (grounded and floating) and the `rock`
+    feature is the exposed rock.
+
+    Parameters
+    ----------
+    feature: str
+        The name of the feature.
+
+    Returns
+    -------
+    mask: np.ndarray
+        True on every cell of the feature.
+    """
+    if feature == "grounding_line":
+        return load_data("icemask_grounded_and_shelves").filled(1) == 0
+    elif feature == "ice_edge":
+        return ~ma.getmaskarray(load_data("icemask_grounded_and_shelves"))
+    elif feature == "rock":
+        return ~ma.getmaskarray(load_data("rockmask"))
+    else:
+        raise ValueError(f"{feature} is not a valid distance feature")
 
-    # we have a valid name for the data
 
-    # get the full filename - prepend bedmap2_ to most filenames
-    if name != "gl04c_geiod_to_WGS84":
-        name = f"bedmap2_{name}.tif"
+def load_distance(feature: str) -> np.ndarray:
+    """
+    Load the signed distance (in meters) from each cell to the
+    boundary of `feature`.
+
+    The distance is positive outside of the feature and negative
+    inside of it and is measured between cell centers using an exact
+    Euclidean distance transform. This is computed once and cached on disk.
+
+    Parameters
+    ----------
+    feature: str
+        One of 'grounding_line', 'ice_edge' or 'rock'.
+
+    Returns
+    -------
+    distance: np.ndarray
+        The signed distance (in meters) memory-mapped from disk.
+    """
+
+    def build() -> np.ndarray:
+        from scipy import ndimage
+
+        # get the cells that make up the feature
+        mask = feature_mask(feature)
+
+        # the distance to the feature from outside, and to its edge from inside
+        distance = ndimage.distance_transform_edt(~mask)
+        distance -= ndimage.distance_transform_edt(mask)
+
+        # and convert from cells into meters
+        return (1e3 * distance).astype(np.float32)
+
+    return load_cached(f"signed_distance_to_{cache_key(feature)}.npy", build)
+
+
+def load_nearest(feature: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the (ix, iy) indices of the nearest cell of `feature` to each cell.
+
+    Cells inside the feature are their own nearest cell. This
+    is computed once and cached on disk.
+
+    Parameters
+    ----------
+    feature: str
+        One of 'grounding_line', 'ice_edge' or 'rock'.
+
+    Returns
+    -------
+    ix, iy: Tuple[np.ndarray, np.ndarray]
+        The indices of the nearest feature cell memory-mapped from disk.
+    """
+
+    def build() -> np.ndarray:
+        from scipy import ndimage
+
+        # find the index of the nearest feature cell
+        indices = ndimage.distance_transform_edt(
+            ~feature_mask(feature), return_distances=False, return_indices=True
+        )
+
+        # the grid is small enough to store the indices as int16
+        return indices.astype(np.int16)
+
+    # and load the indices - NOTE: these are stored as (iy, ix)
+    iy, ix = load_cached(f"nearest_{cache_key(feature)}.npy", build)
+
+    return ix, iy
+
+
+def distance_layer(feature: str, kind: str) -> ma.masked_array:
+    """
+    Load a layer of the distance to the boundary of `feature`.
+
+    `kind` is either `distance` (the unsigned distance in meters) or
+    `signed_distance` (positive outside the feature, negative inside).
+
+    These are available as layers named `{kind}_to_{feature}` in `load_data`.
+
+    Parameters
+    ----------
+    feature: str
+        One of 'grounding_line', 'ice_edge' or 'rock'.
+    kind: str
+        The kind of distance layer to load.
+
+    Returns
+    -------
+    data: ma.masked_array
+        The distance layer as a numpy masked array.
+    """
+
+    # load the signed distance - this is cached on disk
+    distance = load_distance(feature)
+
+    # and compute the requested layer
+    if kind == "signed_distance":
+        return ma.masked_array(distance)
+    elif kind == "distance":
+        return ma.masked_array(np.abs(distance))
     else:
-        name = f"{name}.tif"
+        raise ValueError(f"{kind} is not a valid distance layer")
+
+
+def nearest_feature(
+    lat: np.ndarray, lon: np.ndarray, feature: str, mode: str = "latlon"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the (x, y) coordinates (in meters) of the center of the nearest
+    cell of `feature` to each point.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    feature: str
+        One of 'grounding_line', 'ice_edge' or 'rock'.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+    Returns
+    -------
+    x, y: Tuple[np.ndarray, np.ndarray]
+        The location of the nearest feature cell (in meters).
+    """
+
+    # get the indices of each point into the dataset
+    ix, iy = _index(lat, lon, mode)
+
+    # get the nearest feature cell - this is cached on disk
+    nearestx, nearesty = load_nearest(feature)
+
+    # and convert back into (x, y)
+    return transform.index_to_xy(nearestx[iy, ix], nearesty[iy, ix])
+
+
+@cached(cache={})
+def load_classification() -> np.ndarray:
+    """
+    Load the packed classification layer.
+
+    Each cell is a single byte combining the GROUNDED, FLOATING, ROCK and
+    VOSTOK bit flags (a cell with no flags set is OCEAN) derived from the
+    `icemask_grounded_and_shelves`, `rockmask` and `lakemask_vostok` layers.
+    This is built once (without keeping the source layers in memory) and
+    memory-mapped from the on-disk cache.
+
+    Returns
+    -------
+    classification: np.ndarray
+        The uint8 classification of every grid cell.
+    """
+
+    def build() -> np.ndarray:
+        # start with the ice mask - 0 is grounded, 1 is floating
+        icemask = load_layer("icemask_grounded_and_shelves")
+        classes = np.where(icemask.filled(-1) == 0, GROUNDED, OCEAN).astype(np.uint8)
+        classes[icemask.filled(-1) == 1] = FLOATING
+
+        # and add the rock and lake flags
+        classes[~ma.getmaskarray(load_layer("rockmask"))] |= ROCK
+        classes[~ma.getmaskarray(load_layer("lakemask_vostok"))] |= VOSTOK
+
+        return classes
+
+    # the cached file is keyed by the layers that it is built from
+    return load_cached(cache_key("classification") + ".npy", build)
+
+
+def classify(lat: np.ndarray, lon: np.ndarray, mode: str = "latlon") -> np.ndarray:
+    """
+    Classify the surface type at each point.
+
+    This uses a single projection and a single byte gather from the packed
+    classification layer. Test the result against the bit flags, i.e.
+    `classify(lat, lon) & bedmap2.data.ROCK`, or compare against
+    `bedmap2.data.OCEAN` to find open ocean.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+    Returns
+    -------
+    classes: np.ndarray
+        The uint8 classification bit flags at each location.
+    """
+
+    # get the indices of each point into the dataset
+    ix, iy = _index(lat, lon, mode)
+
+    # and gather the classification - this is memory-mapped
+    return load_classification()[iy, ix]
+
+
+@cached(cache={})
+def load_integral(name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the summed-area tables of the layer specified by `name`.
+
+    These are the cumulative sums over both axes of the value and of the
+    number of valid cells (masked cells count as zero) padded with a
+    leading row and column of zeros, so the sum over any box of cells
+    is given by four lookups. These are built once and memory-mapped
+    from the on-disk cache.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+
+    Returns
+    -------
+    total, count: Tuple[np.ndarray, np.ndarray]
+        The (nrows + 1, ncols + 1) float64 sum and int32 count tables.
+    """
 
-    # load the file
-    dataset = rasterio.open(join(bedmap_dir, name))
+    def table(values: np.ndarray, dtype: type) -> np.ndarray:
+        # pad with zeros and accumulate along both axes in place
+        padded: np.ndarray = np.zeros(
+            (values.shape[0] + 1, values.shape[1] + 1), dtype=dtype
+        )
+        padded[1:, 1:] = values
+        np.cumsum(padded, axis=0, out=padded)
+        np.cumsum(padded, axis=1, out=padded)
+        return padded
 
-    # get the value used for nodata
-    nodata = dataset.meta["nodata"]
+    def build_total() -> np.ndarray:
+        return table(ma.filled(load_data(name), 0), np.float64)
 
-    # and return the data layer from the dataset
-    return ma.masked_equal(dataset.read(1), nodata)
+    def build_count() -> np.ndarray:
+        return table(~ma.getmaskarray(load_data(name)), np.int32)
+
+    return (
+        load_cached(f"integral_{cache_key(name)}.npy", build_total),
+        load_cached(f"integral_count_{cache_key(name)}.npy", build_count),
+    )
+
+
+def box_mean(
+    name: str, ix: np.ndarray, iy: np.ndarray, halfwidth: int
+) -> ma.masked_array:
+    """
+    Compute the mean of the valid cells of a layer in a box of
+    (2 * halfwidth + 1) x (2 * halfwidth + 1) cells centered
+    on each cell (ix, iy) - the box is clipped to the grid.
+
+    This takes four lookups into each summed-area table per point.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+    ix, iy: np.ndarray
+        The indices of the center of each box.
+    halfwidth: int
+        The half-width of the box in cells.
+
+    Returns
+    -------
+    mean: ma.masked_array
+        The mean in each box - masked where there are no valid cells.
+    """
+
+    # get the summed-area tables - these are cached
+    total, count = load_integral(name)
+
+    # the corners of each box in the padded tables
+    nrows, ncols = total.shape[0] - 1, total.shape[1] - 1
+    x0 = np.clip(ix - halfwidth, 0, ncols)
+    x1 = np.clip(ix + halfwidth + 1, 0, ncols)
+    y0 = np.clip(iy - halfwidth, 0, nrows)
+    y1 = np.clip(iy + halfwidth + 1, 0, nrows)
+
+    # the sum and number of valid cells in each box
+    sums = total[y1, x1] - total[y0, x1] - total[y1, x0] + total[y0, x0]
+    valid = count[y1, x1] - count[y0, x1] - count[y1, x0] + count[y0, x0]
+
+    # and the mean over the valid cells
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ma.masked_array(sums / valid, mask=valid == 0)
+
+
+def _index(
+    lat: np.ndarray, lon: np.ndarray, mode: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert coordinates in `mode` ('latlon' or 'xy') into dataset indices.
+    """
+    # check if we have to convert
+    if mode == "latlon":
+        # get x and y indices into coordinates
+        return transform.latlon_to_index(lat, lon)
+    elif mode == "xy":
+        # convert x,y to indices
+        return transform.xy_to_index(lat, lon)
+    else:
+        raise ValueError(f"{mode} is an invalid dataset access mode.")
+
+
+def _locate(
+    lat: np.ndarray, lon: np.ndarray, mode: str, grid: transform.Grid
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert coordinates in `mode` ('latlon' or 'xy') into indices into a
+    layer on `grid` along with the points that are off the layer (this is
+    None for the BEDMAP2 grid where every point is assumed to be on the grid).
+
+    Every layer with the BEDMAP2 geometry (including registered rasters)
+    is indexed with `transform.xy_to_index` so that it matches the BEDMAP2
+    layers. Its cells are offset by half a cell from the geotransform used
+    by `Grid.locate` for every other grid, and it mirrors points that are
+    past the edge of the grid instead of reporting them as outside.
+    """
+    if grid == transform.bedmap_grid:
+        ix, iy = _index(lat, lon, mode)
+        return ix, iy, None
+
+    # convert into polar stereographic - we mask the points ourselves
+    if mode == "latlon":
+        x, y = (ma.getdata(c) for c in transform.latlon_to_xy(lat, lon))
+    elif mode == "xy":
+        x, y = lat, lon
+    else:
+        raise ValueError(f"{mode} is an invalid dataset access mode.")
+
+    # and find the index of each point on the grid
+    ix, iy, valid = grid.locate(x, y)
+    return ix, iy, ~valid
+
+
+def _mask_outside(values: Any, outside: Optional[np.ndarray]) -> Any:
+    """
+    Mask the `values` that are `outside` of a layer - these are set
+    to NaN if `values` is not a masked array but is floating point.
+    """
+    if outside is None or not np.any(outside):
+        return values
+    if np.ndim(values) == 0:
+        return ma.masked
+    if isinstance(values, ma.MaskedArray):
+        values[outside] = ma.masked
+    elif np.issubdtype(values.dtype, np.floating):
+        values[outside] = np.nan
+    return values
+
+
+def _gather(
+    layer: ma.masked_array, iy: np.ndarray, ix: np.ndarray, out: np.ndarray
+) -> np.ndarray:
+    """
+    Gather `layer` at the indices (iy, ix) into `out`.
+
+    If `out` is a masked array, the mask of the layer is gathered into its
+    mask. Otherwise, masked values are set to NaN if `out` is floating point.
+    """
+    # the flat index of each point into the layer
+    flat = iy * layer.shape[1] + ix
+
+    # gather directly into the output if we don't have to cast
+    values = ma.getdata(layer).reshape(-1)
+    buffer = ma.getdata(out)
+    if buffer.dtype == values.dtype:
+        np.take(values, flat, out=buffer)
+    else:
+        buffer[...] = np.take(values, flat)
+
+    # and gather the mask
+    mask = ma.getmask(layer)
+    if isinstance(out, ma.MaskedArray):
+        out.mask = False
+        if mask is not ma.nomask:
+            np.take(mask.reshape(-1), flat, out=ma.getmaskarray(out))
+    elif mask is not ma.nomask and np.issubdtype(buffer.dtype, np.floating):
+        buffer[np.take(mask.reshape(-1), flat)] = np.nan
+
+    return out
+
+
+def _store(values: ma.masked_array, out: np.ndarray) -> np.ndarray:
+    """
+    Store `values` into `out` in the same way as `_gather`.
+    """
+    ma.getdata(out)[...] = ma.getdata(values)
+    if isinstance(out, ma.MaskedArray):
+        out.mask = ma.getmaskarray(values)
+    elif np.issubdtype(out.dtype, np.floating):
+        out[ma.getmaskarray(values)] = np.nan
+    return out
 
 
 def dataset(
-    lat: np.ndarray, lon: np.ndarray, name: str, mode: str = "latlon"
+    lat: np.ndarray,
+    lon: np.ndarray,
+    name: str,
+    mode: str = "latlon",
+    out: Optional[np.ndarray] = None,
+    footprint: Optional[float] = None,
 ) -> np.ndarray:
     """
     Return the value of a given dataset at a specified set
@@ -86,6 +1067,12 @@ def dataset(
     longitude in decimal degrees. If `mode` is `xy`, arguments are treated
     as (x, y) coordinates (in meters) in the South Polar Stereographic Projection.
 
+    If `footprint` is given, the mean of the valid cells in a square box
+    of half-width `footprint` (in meters, rounded to whole cells) around
+    each point is returned instead - see `box_mean`.
+
+    Points that are off a layer registered with `register_layer` are masked.
+
     Parameters
     ----------
     lat or x: np.ndarray
@@ -96,21 +1083,27 @@ def dataset(
         The name of the dataset to load.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` (see `_gather`) and return it.
+    footprint: Optional[float]
+        The half-width (in meters) of the box to average over.
 
     Returns
     -------
     value: np.ndarray
         The values of the dataset at each location.
     """
-    # check if we have to convert
-    if mode == "latlon":
-        # get x and y indices into coordinates
-        ix, iy = transform.latlon_to_index(lat, lon)
-    elif mode == "xy":
-        # convert x,y to indices
-        ix, iy = transform.xy_to_index(lat, lon)
-    else:
-        raise ValueError(f"{mode} is an invalid dataset access mode.")
+    # get the indices of each point into the dataset
+    grid = layer_grid(name)
+    ix, iy, outside = _locate(lat, lon, mode, grid)
+
+    # average over the footprint with the summed-area tables
+    if footprint is not None:
+        with instrument.stage("data.footprint"):
+            halfwidth = int(round(footprint / grid.resolution))
+            means = _mask_outside(box_mean(name, ix, iy, halfwidth), outside)
+        instrument.count("points_sampled", np.size(ix))
+        return means if out is None else _store(means, out)
 
     # make sure the data is loaded - this is cached.
     data = load_data(name)
@@ -118,7 +1111,64 @@ def dataset(
     # and return the corresponding data indices
     # NOTE the flip in ix and iy since the dataset
     # is indexed by iy and then ix.
-    return data[iy, ix]
+    with instrument.stage("data.gather"):
+        values = data[iy, ix] if out is None else _gather(data, iy, ix, out)
+    instrument.count("points_sampled", np.size(ix))
+
+    return _mask_outside(values, outside)
+
+
+def sample(
+    lat: np.ndarray, lon: np.ndarray, layers: Sequence[str], mode: str = "latlon"
+) -> Dict[str, ma.masked_array]:
+    """
+    Return the value of several datasets at a specified set
+    of `latitude` and `longitudes` or polar stereographic coordinates.
+
+    This is equivalent to calling `dataset` for each layer but the
+    coordinates are only converted into dataset indices once for
+    each grid (layers registered with `register_layer` can have
+    their own grid).
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    layers: Sequence[str]
+        The names of the datasets to load.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+    Returns
+    -------
+    values: Dict[str, ma.masked_array]
+        The values of each dataset at each location.
+    """
+    # the grid of each layer
+    grids = {name: layer_grid(name) for name in layers}
+
+    # only project the coordinates once if we have to index several grids
+    if mode == "latlon" and set(grids.values()) - {transform.bedmap_grid}:
+        lat, lon = (ma.getdata(c) for c in transform.latlon_to_xy(lat, lon))
+        mode = "xy"
+
+    # get the indices of each point into each grid
+    located = {grid: _locate(lat, lon, mode, grid) for grid in set(grids.values())}
+
+    # make sure every layer is loaded - this is cached.
+    loaded = {name: load_data(name) for name in layers}
+
+    # and gather each of the layers at these indices
+    with instrument.stage("data.gather"):
+        values = {}
+        for name, layer in loaded.items():
+            ix, iy, outside = located[grids[name]]
+            values[name] = _mask_outside(layer[iy, ix], outside)
+    instrument.count("points_sampled", np.size(lat))
+
+    return values
 
 
 def bed(*args: Any, **kwargs: Any) -> np.ndarray:
@@ -133,6 +1183,8 @@ def bed(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -154,6 +1206,8 @@ def surface(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees or PS coordinate in meters.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -175,6 +1229,8 @@ def thickness(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees or PS coordinate in meters.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -197,6 +1253,8 @@ def rockmask(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees or PS coordinate in meters.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -218,6 +1276,8 @@ def bed_uncertainty(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees or PS coordinate in meters.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -240,6 +1300,8 @@ def icemask(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -262,6 +1324,8 @@ def gl04c_to_wgs84(*args: Any, **kwargs: Any) -> np.ndarray:
         The longitude of each point in degrees or PS coordinate in meters.
     mode: str
         Whether the coordinates are 'latlon' or 'xy' coordinates.
+    out: Optional[np.ndarray]
+        If given, store the values in `out` and return it.
 
     Returns
     -------
@@ -269,3 +1333,44 @@ def gl04c_to_wgs84(*args: Any, **kwargs: Any) -> np.ndarray:
         The height to convert a value from GL04C to WGS84.
     """
     return dataset(*args, name="gl04c_geiod_to_WGS84", **kwargs)  # type: ignore
+
+
+def normal(
+    lat: np.ndarray, lon: np.ndarray, name: str = "surface", mode: str = "latlon"
+) -> Tuple[ma.masked_array, ma.masked_array, ma.masked_array]:
+    """
+    Sample the unit normal vector of a BEDMAP layer at each point.
+
+    The normal is given in the local (x, y, up) frame of the South Polar
+    Stereographic Projection. The coordinates are only projected once and
+    the normal is gathered from the cached gradient layers.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    name: str
+        The name of the layer ('surface' or 'bed').
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+    Returns
+    -------
+    nx, ny, nz: Tuple[ma.masked_array, ma.masked_array, ma.masked_array]
+        The components of the unit normal at each location.
+    """
+
+    # get the indices of each point into the dataset
+    ix, iy = _index(lat, lon, mode)
+
+    # get the gradient at each location - this is cached
+    dzdx, dzdy = load_gradient(name)
+    dzdx, dzdy = dzdx[iy, ix], dzdy[iy, ix]
+
+    # the length of the (un-normalized) normal vector
+    norm = ma.sqrt(dzdx * dzdx + dzdy * dzdy + 1.0)
+
+    # and return the normalized components
+    return -dzdx / norm, -dzdy / norm, 1.0 / norm
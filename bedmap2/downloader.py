@@ -1,38 +1,393 @@
 """
 Download and extract BEDMAP2 data as needed.
 """
+import contextlib
+import hashlib
+import json
+import os
 import os.path as op
+import shutil
+import threading
 import zipfile
+from typing import Iterator, Optional, Set, Tuple
 
-import wget
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
 
 # the URL where we download BEDMAP2
 BEDMAP2_URL = "https://secure.antarctica.ac.uk/data/bedmap2/bedmap2_tiff.zip"
 
+# the SHA-256 checksum of the BEDMAP2 archive - if this is not set (here
+# or with the BEDMAP2_SHA256 environment variable), the checksum is fetched
+# from BEDMAP2_SHA256_URL and the download fails if it is not available.
+BEDMAP2_SHA256: Optional[str] = os.environ.get("BEDMAP2_SHA256")
+
+# the URL of the published checksum of the BEDMAP2 archive
+BEDMAP2_SHA256_URL = f"{BEDMAP2_URL}.sha256"
+
 # the directory where we store the data
 DATA_DIR = op.join(op.dirname(op.dirname(__file__)), "data")
 
+# the size of each range request in bytes
+CHUNKSIZE = 8 * 1024 * 1024
+
+# the size of the buffer used when streaming data
+BUFSIZE = 1024 * 1024
+
+# the number of rows that are converted at once into NPY files
+ROWCHUNK = 256
+
+
+def layer_filename(name: str) -> str:
+    """
+    Return the name of the GeoTIFF in the BEDMAP2 archive for the layer `name`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP layer.
 
-def data_exists() -> bool:
+    Returns
+    -------
+    filename: str
+        The file name of the layer (without any directory).
+    """
+    # prepend bedmap2_ to most filenames
+    if name != "gl04c_geiod_to_WGS84":
+        return f"bedmap2_{name}.tif"
+    else:
+        return f"{name}.tif"
+
+
+def data_exists(name: str = "bed", directory: Optional[str] = None) -> bool:
     """
-    Check if the BEDMAP2 data exists.
+    Check if the BEDMAP2 layer `name` exists, either as the original
+    GeoTIFF or converted into a NPY file.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP layer to check.
+    directory: Optional[str]
+        The directory containing the layers (default: DATA_DIR/bedmap2_tiff).
 
     Returns
     -------
     exists: bool
-        If True, the BEDMAP2 data exists on the local disk.
+        If True, the BEDMAP2 layer exists on the local disk.
     """
-    return op.exists(f"{op.join(DATA_DIR, *('bedmap2_tiff', 'bedmap2_bed.tif'))}")
+    if directory is None:
+        directory = op.join(DATA_DIR, "bedmap2_tiff")
+    path = op.join(directory, layer_filename(name))
+    return op.exists(path) or op.exists(f"{op.splitext(path)[0]}.npy")
 
 
-def download_data() -> bool:
+@contextlib.contextmanager
+def lock(filename: str) -> Iterator[None]:
     """
-    Download the BEDMAP2 dataset and replace the existing files (if present).
+    Hold an exclusive lock on `filename`.lock so that concurrent
+    processes don't download or extract the same file at once.
+
+    The lock file is removed when the lock is released so that it
+    doesn't litter the data directory.
+
+    Parameters
+    ----------
+    filename: str
+        The file to lock.
+    """
+    path = f"{filename}.lock"
+    while True:
+        f = open(path, "a")
+        if fcntl is None:
+            break
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        # the previous holder may have removed the file while we waited
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+
+    try:
+        yield
+    finally:
+        # remove the lock file before we release it - any waiters will retry
+        if fcntl is not None:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        f.close()
+
+
+def probe(url: str, timeout: float = 60.0) -> Tuple[Optional[int], bool]:
+    """
+    Find the size of `url` and whether the server supports range requests.
+
+    Parameters
+    ----------
+    url: str
+        The URL to probe.
+    timeout: float
+        The timeout (in seconds) of the request.
 
     Returns
     -------
-    success: bool
-        A boolean indicating a succesful download.
+    size, ranges: Tuple[Optional[int], bool]
+        The size in bytes (if known) and whether range requests are supported.
+    """
+    import urllib.request
+
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        length = response.headers.get("Content-Length")
+        ranges = response.headers.get("Accept-Ranges", "none") == "bytes"
+        return (int(length) if length is not None else None), ranges
+
+
+def fetch_range(
+    url: str, fd: int, start: int, stop: int, timeout: float, retries: int
+) -> None:
+    """
+    Download the bytes [start, stop) of `url` into the file descriptor `fd`.
+    """
+    import urllib.request
+
+    for attempt in range(retries + 1):
+        try:
+            request = urllib.request.Request(
+                url, headers={"Range": f"bytes={start}-{stop - 1}"}
+            )
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if response.status != 206:
+                    raise IOError(f"{url} did not return a partial response")
+                offset = start
+                while offset < stop:
+                    block = response.read(min(BUFSIZE, stop - offset))
+                    if not block:
+                        raise IOError(f"{url} closed the connection early")
+                    offset += os.pwrite(fd, block, offset)
+            return
+        except (IOError, OSError):
+            if attempt == retries:
+                raise
+
+
+def fetch_checksum(url: str, timeout: float = 60.0) -> str:
+    """
+    Fetch a SHA-256 checksum published at `url`.
+
+    The checksum is the first field of the file, as written by `sha256sum`.
+
+    Parameters
+    ----------
+    url: str
+        The URL of the checksum file.
+    timeout: float
+        The timeout (in seconds) of the request.
+
+    Returns
+    -------
+    sha256: str
+        The checksum in lowercase hex.
+    """
+    import urllib.request
+
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            fields = response.read(4096).decode("ascii", "replace").split()
+    except (IOError, OSError) as error:
+        raise IOError(
+            f"unable to fetch the checksum from {url} - set BEDMAP2_SHA256 "
+            "to the SHA-256 checksum of the archive to download it"
+        ) from error
+
+    # check that this looks like a SHA-256 checksum
+    sha256 = fields[0].lower() if fields else ""
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise ValueError(f"{url} is not a SHA-256 checksum")
+
+    return sha256
+
+
+def download(
+    url: str,
+    filename: str,
+    sha256: Optional[str] = None,
+    connections: int = 4,
+    chunksize: int = CHUNKSIZE,
+    retries: int = 3,
+    timeout: float = 60.0,
+) -> str:
+    """
+    Download `url` into `filename` using parallel range requests.
+
+    The data is written into `filename`.part and the completed ranges are
+    recorded so an interrupted download resumes where it stopped. Once
+    complete (and verified if `sha256` is given), the file is atomically
+    renamed to `filename`. A lock file prevents concurrent processes from
+    downloading the same file. If the server does not support range
+    requests, the file is downloaded over a single connection.
+
+    Parameters
+    ----------
+    url: str
+        The URL to download.
+    filename: str
+        The file to download into.
+    sha256: Optional[str]
+        The expected SHA-256 checksum (in hex) of the file.
+    connections: int
+        The number of simultaneous connections.
+    chunksize: int
+        The size (in bytes) of each range request.
+    retries: int
+        The number of times to retry each range request.
+    timeout: float
+        The timeout (in seconds) of each request.
+
+    Returns
+    -------
+    filename: str
+        The name of the downloaded file.
+    """
+    # these are only needed when downloading so aren't imported at the top
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    with lock(filename):
+
+        # another process may have finished the download while we waited
+        if op.exists(filename):
+            return filename
+
+        # the partial download and the record of which chunks are complete
+        part = f"{filename}.part"
+        progress = f"{part}.json"
+
+        # find the size of the file and whether we can use range requests
+        size, ranges = probe(url, timeout)
+
+        if size is None or not ranges:
+            # fall back to a single streaming download
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                with open(part, "wb") as f:
+                    shutil.copyfileobj(response, f, BUFSIZE)
+        else:
+            # load the chunks that have already been downloaded
+            done: Set[int] = set()
+            if op.exists(part) and op.exists(progress):
+                with open(progress, "r") as fp:
+                    record = json.load(fp)
+                if record["size"] == size and record["chunksize"] == chunksize:
+                    done = set(record["done"])
+
+            # the chunks that we still need to download
+            nchunks = (size + chunksize - 1) // chunksize
+            todo = [i for i in range(nchunks) if i not in done]
+
+            # record a completed chunk - this is written atomically
+            mutex = threading.Lock()
+
+            def complete(i: int) -> None:
+                with mutex:
+                    done.add(i)
+                    state = {"size": size, "chunksize": chunksize, "done": sorted(done)}
+                    with open(f"{progress}.tmp", "w") as f:
+                        json.dump(state, f)
+                    os.replace(f"{progress}.tmp", progress)
+
+            def fetch(i: int) -> None:
+                start, stop = i * chunksize, min((i + 1) * chunksize, size)
+                fetch_range(url, fd, start, stop, timeout, retries)
+                complete(i)
+
+            # download the remaining chunks in parallel
+            fd = os.open(part, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                with ThreadPoolExecutor(max_workers=connections) as pool:
+                    list(pool.map(fetch, todo))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        # verify the checksum of the file
+        if sha256 is not None:
+            digest = hashlib.sha256()
+            with open(part, "rb") as fb:
+                for block in iter(lambda: fb.read(BUFSIZE), b""):
+                    digest.update(block)
+            if digest.hexdigest() != sha256.lower():
+                os.remove(part)
+                if op.exists(progress):
+                    os.remove(progress)
+                raise ValueError(f"the checksum of {url} does not match")
+
+        # and atomically move the completed file into place
+        os.replace(part, filename)
+        if op.exists(progress):
+            os.remove(progress)
+
+    return filename
+
+
+def extract(filename: str, directory: str) -> None:
+    """
+    Extract the members of the zip file `filename` into `directory`.
+
+    The archive is verified against its CRC-32 checksums and members that
+    have already been extracted (with the correct size) are skipped. Each
+    member is extracted to a temporary file and then renamed into place.
+
+    Parameters
+    ----------
+    filename: str
+        The zip file to extract.
+    directory: str
+        The directory to extract into.
+    """
+    with lock(filename), zipfile.ZipFile(filename, "r") as zf:
+
+        # check the integrity of the archive
+        bad = zf.testzip()
+        if bad is not None:
+            raise ValueError(f"{bad} in {filename} is corrupted")
+
+        for member in zf.infolist():
+            # the location of this member on disk
+            path = op.join(directory, *member.filename.split("/"))
+            if member.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+
+            # skip any members that have already been extracted
+            if op.exists(path) and op.getsize(path) == member.file_size:
+                continue
+
+            # and stream the member into place
+            os.makedirs(op.dirname(path), exist_ok=True)
+            with zf.open(member) as src, open(f"{path}.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, BUFSIZE)
+            os.replace(f"{path}.tmp", path)
+
+
+def download_archive() -> str:
+    """
+    Download the BEDMAP2 archive if it has not already been downloaded.
+
+    The archive is verified against `BEDMAP2_SHA256` or, if that is not
+    set, against the checksum published at `BEDMAP2_SHA256_URL`.
+
+    Returns
+    -------
+    filename: str
+        The location of the BEDMAP2 archive.
     """
 
     # construct the filename where we store the data
@@ -40,16 +395,135 @@ def download_data() -> bool:
 
     # check if the zip file is not present
     if not op.exists(filename):
+        # the archive is always verified against its checksum
+        sha256 = BEDMAP2_SHA256 or fetch_checksum(BEDMAP2_SHA256_URL)
+
         # and download the data
-        wget.download(BEDMAP2_URL, filename)
-    else:
-        # the file is already downloaded
-        print("BEDMAP2 is already downloaded.")
+        print("Downloading BEDMAP2...")
+        os.makedirs(DATA_DIR, exist_ok=True)
+        download(BEDMAP2_URL, filename, sha256=sha256)
+
+    return filename
+
+
+def extract_layer(
+    name: str, directory: Optional[str] = None, convert: bool = False
+) -> str:
+    """
+    Extract a single layer from the BEDMAP2 archive, downloading
+    the archive if necessary.
+
+    The layer is streamed out of the archive with a bounded buffer. If
+    `convert` is True, the layer is instead read directly out of the archive
+    and written into a NPY file (with its nodata value stored alongside in
+    a JSON file) that can be memory-mapped, without keeping the GeoTIFF.
+
+    Parameters
+    ----------
+    name: str
+        The name of the BEDMAP layer.
+    directory: Optional[str]
+        The directory to extract into (default: DATA_DIR/bedmap2_tiff).
+    convert: bool
+        If True, convert the layer into a NPY file.
+
+    Returns
+    -------
+    path: str
+        The location of the extracted layer.
+    """
+    if directory is None:
+        directory = op.join(DATA_DIR, "bedmap2_tiff")
+
+    # the archive and the location of this layer in the archive
+    filename = download_archive()
+    member = f"bedmap2_tiff/{layer_filename(name)}"
+
+    # and where we put the layer
+    path = op.join(directory, layer_filename(name))
+    if convert:
+        path = f"{op.splitext(path)[0]}.npy"
+    os.makedirs(directory, exist_ok=True)
+
+    with lock(path):
+
+        # another process may have extracted this layer while we waited
+        if op.exists(path):
+            return path
+
+        try:
+            with zipfile.ZipFile(filename, "r") as zf:
+                if not convert:
+                    # stream the member out of the archive - this checks its CRC
+                    with zf.open(member) as src, open(f"{path}.tmp", "wb") as dst:
+                        shutil.copyfileobj(src, dst, BUFSIZE)
+                else:
+                    # GDAL doesn't check the CRC so stream the member through
+                    # zipfile first - this raises BadZipFile if it is corrupted
+                    with zf.open(member) as src:
+                        while src.read(BUFSIZE):
+                            pass
+                    convert_member(filename, member, path)
+        except zipfile.BadZipFile as error:
+            if op.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+            raise ValueError(f"{member} in {filename} is corrupted") from error
+        except BaseException:
+            # don't leave a partial layer behind
+            if op.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+            raise
+
+        # and atomically move the layer into place
+        os.replace(f"{path}.tmp", path)
+
+    return path
+
+
+def convert_member(filename: str, member: str, path: str) -> None:
+    """
+    Read the GeoTIFF `member` straight out of the archive `filename` a chunk
+    of rows at a time into the NPY file `path`.tmp, and save its nodata
+    value into a JSON file next to `path`.
+    """
+    import numpy as np
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(f"/vsizip/{filename}/{member}") as dataset:
+        array = np.lib.format.open_memmap(
+            f"{path}.tmp",
+            mode="w+",
+            dtype=dataset.dtypes[0],
+            shape=(dataset.height, dataset.width),
+        )
+        for start in range(0, dataset.height, ROWCHUNK):
+            stop = min(start + ROWCHUNK, dataset.height)
+            window = Window(0, start, dataset.width, stop - start)
+            array[start:stop] = dataset.read(1, window=window)
+        array.flush()
+        del array
+
+        # save the nodata value next to the array
+        with open(f"{op.splitext(path)[0]}.json", "w") as f:
+            json.dump({"nodata": dataset.nodata}, f)
+
+
+def download_data() -> bool:
+    """
+    Download the BEDMAP2 dataset and extract any missing files.
+
+    Returns
+    -------
+    success: bool
+        A boolean indicating a succesful download.
+    """
+
+    # download the archive if it doesn't exist
+    filename = download_archive()
 
     # now expand the zip file
-    with zipfile.ZipFile(filename, "r") as zf:
-        # extract all the files into the data directory
-        zf.extractall(DATA_DIR)
+    extract(filename, DATA_DIR)
 
     # check that the data now exists
     return data_exists()
@@ -1,7 +1,30 @@
+from typing import Iterator, Optional, Tuple, Union
+
 import numpy as np
+from cachetools import cached
+
+import bedmap2.transform as transform
+
+# equatorial radius of the WGS84 ellipsoid (m)
+a = 6378137.0
+
+# flattening of the WGS84 ellipsoid
+f = 1.0 / (298.257223563)
+
+# the polar radius of the WGS84 ellipsoid (m)
+b = a * (1 - f)
+
+# the first eccentricity squared of the WGS84 ellipsoid
+e2 = f * (2.0 - f)
 
+# the second eccentricity squared of the WGS84 ellipsoid
+ep2 = e2 / (1.0 - e2)
 
-def radius(lat: np.ndarray) -> np.ndarray:
+# the number of grid rows that are converted at once when building grids
+rowchunk = 256
+
+
+def radius(lat: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Compute the geocentric radius of the WGS84 ellipsoid in meters.
 
@@ -9,6 +32,8 @@ def radius(lat: np.ndarray) -> np.ndarray:
     ----------
     lat: np.ndarray
         The set of latitudes (in degrees) at which to calculate the radius.
+    out: Optional[np.ndarray]
+        An optional array to store the radius in.
 
     Returns
     -------
@@ -16,18 +41,9 @@ def radius(lat: np.ndarray) -> np.ndarray:
         The geocentric radius at each latitude (in meters).
     """
 
-    # equatorial radius of the WGS84 ellipsoid
-    a = 6378137
-
-    # flattening of the WGS84 ellipsoid
-    f = 1.0 / (298.257223563)
-
-    # the polar radius of the WGS84 ellipsoid
-    b = a * (1 - f)
-
     # we need the cosine and sine of the latitude squared
     sin2 = np.sin(np.radians(lat)) ** 2.0
-    cos2 = np.cos(np.radians(lat)) ** 2.0
+    cos2 = 1.0 - sin2
 
     # and we need a^2 and b^2
     a2 = a * a
@@ -39,4 +55,209 @@ def radius(lat: np.ndarray) -> np.ndarray:
     )
 
     # and use that to compute the geocentric radius
-    return np.sqrt(r2)
+    return np.sqrt(r2, out=out)
+
+
+def geodetic_to_ecef(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    height: Union[float, np.ndarray] = 0.0,
+    out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convert geodetic latitude, longitude and height above the WGS84
+    ellipsoid into Earth-Centered Earth-Fixed (ECEF) coordinates.
+
+    Parameters
+    ----------
+    lat: np.ndarray
+        The geodetic latitude of each point (in degrees).
+    lon: np.ndarray
+        The longitude of each point (in degrees).
+    height: np.ndarray
+        The height of each point above the WGS84 ellipsoid (in meters).
+    out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+        Optional arrays to store the (X, Y, Z) coordinates in.
+
+    Returns
+    -------
+    X, Y, Z: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The ECEF coordinates of each point (in meters).
+    """
+
+    # allocate the outputs if they were not provided
+    if out is None:
+        shape = np.broadcast(lat, lon, height).shape
+        out = (np.empty(shape), np.empty(shape), np.empty(shape))
+    X, Y, Z = out
+
+    # the sine and cosine of the latitude and longitude
+    phi, lam = np.radians(lat), np.radians(lon)
+    sinphi, cosphi = np.sin(phi), np.cos(phi)
+
+    # the prime vertical radius of curvature
+    N = a / np.sqrt(1.0 - e2 * sinphi * sinphi)
+
+    # the distance from the rotation axis
+    p = (N + height) * cosphi
+
+    # and compute the coordinates
+    np.multiply(p, np.cos(lam), out=X)
+    np.multiply(p, np.sin(lam), out=Y)
+    np.multiply(N * (1.0 - e2) + height, sinphi, out=Z)
+
+    # and we are done
+    return X, Y, Z
+
+
+def ecef_to_geodetic(
+    X: np.ndarray,
+    Y: np.ndarray,
+    Z: np.ndarray,
+    out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convert Earth-Centered Earth-Fixed (ECEF) coordinates into geodetic
+    latitude, longitude and height above the WGS84 ellipsoid.
+
+    This uses Bowring's non-iterative method which is accurate
+    to well under a millimeter for points near the surface of the Earth.
+
+    Parameters
+    ----------
+    X, Y, Z: np.ndarray
+        The ECEF coordinates of each point (in meters).
+    out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+        Optional arrays to store the (lat, lon, height) in.
+
+    Returns
+    -------
+    lat, lon, height: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The latitude and longitude (in degrees) and height above
+        the WGS84 ellipsoid (in meters) of each point.
+    """
+
+    # allocate the outputs if they were not provided
+    if out is None:
+        shape = np.broadcast(X, Y, Z).shape
+        out = (np.empty(shape), np.empty(shape), np.empty(shape))
+    lat, lon, height = out
+
+    # the distance from the rotation axis
+    p = np.hypot(X, Y)
+
+    # the parametric latitude
+    theta = np.arctan2(Z * a, p * b)
+    sintheta, costheta = np.sin(theta), np.cos(theta)
+
+    # and Bowring's estimate of the geodetic latitude
+    phi = np.arctan2(Z + ep2 * b * sintheta ** 3.0, p - e2 * a * costheta ** 3.0)
+    sinphi, cosphi = np.sin(phi), np.cos(phi)
+
+    # the height is well-conditioned at all latitudes in this form
+    np.subtract(
+        p * cosphi + Z * sinphi,
+        a * np.sqrt(1.0 - e2 * sinphi * sinphi),
+        out=height,
+    )
+
+    # and convert the angles into degrees
+    np.degrees(phi, out=lat)
+    np.degrees(np.arctan2(Y, X), out=lon)
+
+    # and we are done
+    return lat, lon, height
+
+
+def _grid_chunks() -> Iterator[Tuple[slice, np.ndarray, np.ndarray]]:
+    """
+    Iterate over chunks of rows of the BEDMAP2 grid and yield the rows
+    along with the latitude and longitude (in degrees) of each cell center.
+    """
+
+    # the x-coordinate of every column
+    x, _ = transform.index_to_xy(np.arange(transform.ncols), 0)
+
+    # and convert a chunk of rows at a time to bound the temporaries
+    for start in range(0, transform.nrows, rowchunk):
+        rows = slice(start, min(start + rowchunk, transform.nrows))
+        _, y = transform.index_to_xy(0, np.arange(rows.start, rows.stop))
+        lat, lon = transform.xy_to_latlon(x[None, :], y[:, None])
+        yield rows, lat, lon
+
+
+@cached(cache={})
+def latlon_grid() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the latitude and longitude (in degrees) of the center of every
+    cell in the BEDMAP2 grid.
+
+    The results of this function are cached.
+
+    Returns
+    -------
+    lat, lon: Tuple[np.ndarray, np.ndarray]
+        The (nrows, ncols) latitude and longitude of each cell.
+    """
+
+    # allocate the output grids
+    lat = np.empty((transform.nrows, transform.ncols))
+    lon = np.empty((transform.nrows, transform.ncols))
+
+    # and fill them in chunks of rows
+    for rows, clat, clon in _grid_chunks():
+        lat[rows], lon[rows] = clat, clon
+
+    # and we are done
+    return lat, lon
+
+
+@cached(cache={})
+def radius_grid() -> np.ndarray:
+    """
+    Return the geocentric radius (in meters) of the WGS84 ellipsoid
+    at the center of every cell in the BEDMAP2 grid.
+
+    The results of this function are cached.
+
+    Returns
+    -------
+    radius: np.ndarray
+        The (nrows, ncols) geocentric radius of each cell.
+    """
+
+    # allocate the output grid
+    R = np.empty((transform.nrows, transform.ncols))
+
+    # and compute the radius in chunks of rows
+    for rows, lat, _ in _grid_chunks():
+        radius(lat, out=R[rows])
+
+    # and we are done
+    return R
+
+
+@cached(cache={})
+def ecef_grid() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the ECEF coordinates (in meters) of the WGS84 ellipsoid surface
+    at the center of every cell in the BEDMAP2 grid.
+
+    The results of this function are cached. Together, these arrays use
+    roughly 1 GB of memory.
+
+    Returns
+    -------
+    X, Y, Z: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The (nrows, ncols) ECEF coordinates of each cell.
+    """
+
+    # allocate the output grids
+    X, Y, Z = (np.empty((transform.nrows, transform.ncols)) for _ in range(3))
+
+    # and convert a chunk of rows at a time
+    for rows, lat, lon in _grid_chunks():
+        geodetic_to_ecef(lat, lon, out=(X[rows], Y[rows], Z[rows]))
+
+    # and we are done
+    return X, Y, Z
@@ -0,0 +1,261 @@
+"""
+Bin scattered observations onto the BEDMAP2 grid.
+"""
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+import bedmap2.transform as transform
+from bedmap2.sampler import Sampler
+
+# the statistics that we can compute in each cell
+statistics = ["count", "sum", "mean", "min", "max", "std"]
+
+
+class Bins(NamedTuple):
+    """
+    The statistics of the observations in a set of grid cells.
+    """
+
+    # the flat index of each cell
+    cells: np.ndarray
+
+    # the number of observations in each cell
+    total: np.ndarray
+
+    # the mean of the observations in each cell
+    mean: np.ndarray
+
+    # the sum of the squared deviations from the mean in each cell
+    m2: np.ndarray
+
+    # the minimum of the observations in each cell
+    minimum: np.ndarray
+
+    # the maximum of the observations in each cell
+    maximum: np.ndarray
+
+
+def reduce_bins(bins: Bins) -> Bins:
+    """
+    Merge all the entries of `bins` that are in the same cell.
+
+    The entries are sorted by cell and the statistics of each run of
+    entries are combined with `reduceat` using the pairwise update of
+    Chan et al. so the variance is computed without cancellation.
+
+    Parameters
+    ----------
+    bins: Bins
+        The statistics of each entry - the cells need not be unique.
+
+    Returns
+    -------
+    bins: Bins
+        The statistics in each unique cell in order of the cells.
+    """
+
+    # there is nothing to merge
+    if bins.cells.size == 0:
+        return bins
+
+    # sort the entries by cell
+    order = np.argsort(bins.cells, kind="stable")
+    cells = bins.cells[order]
+    count = bins.total[order]
+    mean = bins.mean[order]
+
+    # find the first entry in each cell
+    first = np.empty(cells.size, dtype=bool)
+    first[:1] = True
+    np.not_equal(cells[1:], cells[:-1], out=first[1:])
+    starts = np.flatnonzero(first)
+    sizes = np.diff(np.append(starts, cells.size))
+
+    # the total count and mean in each cell
+    total = np.add.reduceat(count, starts)
+    average = np.add.reduceat(count * mean, starts) / total
+
+    # and the combined sum of squared deviations
+    deviation = mean - np.repeat(average, sizes)
+    m2 = np.add.reduceat(bins.m2[order] + count * deviation ** 2.0, starts)
+
+    return Bins(
+        cells[starts],
+        total,
+        average,
+        m2,
+        np.minimum.reduceat(bins.minimum[order], starts),
+        np.maximum.reduceat(bins.maximum[order], starts),
+    )
+
+
+def grid_points(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    values: np.ndarray,
+    stats: Sequence[str] = ("count", "mean"),
+    mode: str = "latlon",
+    layer: Optional[str] = None,
+    sparse: bool = False,
+    chunksize: int = 1_000_000,
+) -> Dict[str, np.ndarray]:
+    """
+    Bin scattered observations onto the BEDMAP2 1 km grid.
+
+    The points are projected and binned `chunksize` points at a time so
+    memory is bounded by the size of the output (and not the input).
+    Points that are off the grid, or whose values are masked or not
+    finite, are ignored. The standard deviation is the population
+    standard deviation of the observations in each cell.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    values: np.ndarray
+        The observed value at each point.
+    stats: Sequence[str]
+        The statistics to compute - any of 'count', 'sum', 'mean',
+        'min', 'max' and 'std'.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+    layer: Optional[str]
+        If given, also return the 'residual' of the mean in each
+        cell against this layer.
+    sparse: bool
+        If True, only return the cells that contain observations.
+    chunksize: int
+        The number of points that are binned at once.
+
+    Returns
+    -------
+    grids: Dict[str, np.ndarray]
+        Each statistic as a (nrows, ncols) masked array that is masked
+        where there are no observations. If `sparse` is True, each
+        statistic is instead given for each occupied cell along with
+        the 'ix' and 'iy' indices of these cells.
+    """
+    for stat in stats:
+        if stat not in statistics:
+            raise ValueError(f"{stat} is not a valid statistic")
+    if layer is not None and data.layer_grid(layer) != transform.bedmap_grid:
+        raise ValueError(f"{layer} is not on the BEDMAP2 grid")
+
+    # flatten the inputs so we can iterate over chunks
+    lat, lon, values = (np.asarray(v).reshape(-1) for v in (lat, lon, values))
+    ncells = transform.nrows * transform.ncols
+
+    # the accumulators that the requested statistics need
+    need_mean = layer is not None or any(s in stats for s in ("sum", "mean", "std"))
+    need_m2 = "std" in stats
+    need_min, need_max = "min" in stats, "max" in stats
+
+    # the running statistics - either for every cell or for the occupied cells
+    # the dense grids only allocate the accumulators that we need
+    dense: Optional[Bins] = None
+    if not sparse:
+        dense = Bins(
+            np.zeros(0, dtype=np.int32),  # unused - we store every cell
+            np.zeros(ncells, dtype=np.int32),
+            np.zeros(ncells if need_mean else 0),
+            np.zeros(ncells if need_m2 else 0),
+            np.full(ncells if need_min else 0, np.inf),
+            np.full(ncells if need_max else 0, -np.inf),
+        )
+    state = Bins(
+        *(np.zeros(0, dtype=np.int32) for _ in range(2)),
+        *(np.zeros(0) for _ in range(4)),
+    )
+
+    for start in range(0, lat.size, chunksize):
+        stop = start + chunksize
+
+        # project this chunk of points and find the valid observations
+        sampler = Sampler(lat[start:stop], lon[start:stop], mode=mode)
+        chunk = ma.filled(ma.masked_array(values[start:stop], dtype=float), np.nan)
+        valid = sampler.valid & np.isfinite(chunk)
+        chunk = chunk[valid]
+
+        # and reduce the observations in each cell
+        bins = reduce_bins(
+            Bins(
+                sampler.index[valid],
+                np.ones(chunk.size, dtype=np.int32),
+                chunk,
+                np.zeros(chunk.size),
+                chunk,
+                chunk,
+            )
+        )
+
+        if dense is None:
+            # merge them into the occupied cells
+            state = reduce_bins(
+                Bins(*(np.concatenate(pair) for pair in zip(state, bins)))
+            )
+        else:
+            # merge them with the running statistics of these cells
+            # the cells in a reduced chunk are unique so we can index directly
+            cells = bins.cells
+            before = dense.total[cells]
+            total = before + bins.total
+            if need_mean:
+                delta = bins.mean - dense.mean[cells]
+                if need_m2:
+                    dense.m2[cells] += (
+                        bins.m2 + delta ** 2.0 * before * bins.total / total
+                    )
+                dense.mean[cells] += delta * bins.total / total
+            dense.total[cells] = total
+            if need_min:
+                dense.minimum[cells] = np.minimum(dense.minimum[cells], bins.minimum)
+            if need_max:
+                dense.maximum[cells] = np.maximum(dense.maximum[cells], bins.maximum)
+
+    # the statistics of the cells that we return
+    result = state if dense is None else dense
+    grids: Dict[str, np.ndarray] = {}
+
+    # the sparse grids give the index of each occupied cell
+    if dense is None:
+        iy, ix = np.divmod(state.cells, np.int32(transform.ncols))
+        grids["ix"], grids["iy"] = ix, iy
+
+    # and compute each statistic
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for stat in stats:
+            if stat == "count":
+                grids[stat] = result.total
+            elif stat == "sum":
+                grids[stat] = result.mean * result.total
+            elif stat == "mean":
+                grids[stat] = result.mean
+            elif stat == "min":
+                grids[stat] = result.minimum
+            elif stat == "max":
+                grids[stat] = result.maximum
+            elif stat == "std":
+                grids[stat] = np.sqrt(result.m2 / result.total)
+
+    # the residual of the mean against another layer
+    if layer is not None:
+        reference = data.load_data(layer)
+        if dense is None:
+            grids["residual"] = result.mean - reference[grids["iy"], grids["ix"]]
+        else:
+            grids["residual"] = result.mean.reshape(reference.shape) - reference
+
+    # the dense grids are masked where there are no observations
+    if dense is not None:
+        shape = (transform.nrows, transform.ncols)
+        empty = (dense.total == 0).reshape(shape)
+        for name, grid in grids.items():
+            grid = grid.reshape(shape)
+            grids[name] = grid if name == "count" else ma.masked_array(grid, empty)
+
+    return grids
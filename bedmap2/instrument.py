@@ -0,0 +1,224 @@
+"""
+Opt-in instrumentation of the hot paths in bedmap2.
+
+Instrumentation is disabled by default and can be enabled with `enable()`
+or by setting BEDMAP2_INSTRUMENT=1. While disabled, every instrumented
+function only pays for a single flag check.
+
+While enabled, we record the number of calls and the total and maximum
+time spent in each stage (i.e. 'load_data.decode', 'transform.latlon_to_xy'
+or 'data.gather') along with counters for the bytes loaded, the points
+sampled, and the cache hits and misses of each cache. A snapshot of these
+is returned by `stats()` and every measurement is also passed to each hook
+registered with `add_hook` as `hook(kind, name, value)` where `kind` is
+either 'time' (and `value` is in seconds) or 'count'.
+"""
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar, cast
+
+# the type of a function that we instrument
+F = TypeVar("F", bound=Callable[..., Any])
+
+# the type of a hook - hook(kind, name, value)
+Hook = Callable[[str, str, float], None]
+
+# whether instrumentation is enabled
+enabled = os.environ.get("BEDMAP2_INSTRUMENT", "0") not in ("", "0")
+
+# the registered hooks
+hooks: List[Hook] = []
+
+# the timings of each stage - name -> [calls, total, max]
+timings: Dict[str, List[float]] = {}
+
+# the value of each counter
+counters: Dict[str, float] = {}
+
+# protects the timings and counters
+lock = threading.Lock()
+
+
+def enable(flag: bool = True) -> None:
+    """
+    Enable (or disable) instrumentation.
+
+    Parameters
+    ----------
+    flag: bool
+        If True, enable instrumentation.
+    """
+    global enabled
+    enabled = flag
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Register `hook` to be called with every measurement.
+
+    Parameters
+    ----------
+    hook: Hook
+        A function called as `hook(kind, name, value)`.
+    """
+    hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Remove a hook registered with `add_hook`.
+
+    Parameters
+    ----------
+    hook: Hook
+        The hook to remove.
+    """
+    hooks.remove(hook)
+
+
+def record(name: str, elapsed: float) -> None:
+    """
+    Record `elapsed` seconds spent in the stage `name`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the stage.
+    elapsed: float
+        The time spent in the stage (in seconds).
+    """
+    with lock:
+        timing = timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+    for hook in hooks:
+        hook("time", name, elapsed)
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Add `value` to the counter `name` if instrumentation is enabled.
+
+    Parameters
+    ----------
+    name: str
+        The name of the counter.
+    value: float
+        The amount to add to the counter.
+    """
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+    for hook in hooks:
+        hook("count", name, value)
+
+
+class stage:
+    """
+    A context manager that records the time spent in the stage `name`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the stage.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start: Optional[float] = None
+
+    def __enter__(self) -> "stage":
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Decorate a function to record the time spent in it as the stage `name`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the stage.
+    """
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+class Cache(dict):
+    """
+    A dictionary for use with `cachetools.cached` that counts
+    its hits and misses as '{name}.hits' and '{name}.misses'.
+
+    Parameters
+    ----------
+    name: str
+        The name of the cache.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            count(f"{self.name}.misses")
+            raise
+        count(f"{self.name}.hits")
+        return value
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Return a snapshot of the instrumentation.
+
+    Returns
+    -------
+    stats: Dict[str, Any]
+        The 'enabled' flag, the 'timings' of each stage (as a dictionary
+        of 'calls', 'total' and 'max' seconds) and the 'counters'.
+    """
+    with lock:
+        return {
+            "enabled": enabled,
+            "timings": {
+                name: {"calls": int(calls), "total": total, "max": maximum}
+                for name, (calls, total, maximum) in timings.items()
+            },
+            "counters": dict(counters),
+        }
+
+
+def reset() -> None:
+    """
+    Reset all the timings and counters.
+    """
+    with lock:
+        timings.clear()
+        counters.clear()
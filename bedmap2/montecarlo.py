@@ -0,0 +1,228 @@
+"""
+Draw random points over the BEDMAP2 grid weighted by a layer.
+"""
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.ma as ma
+from cachetools import LRUCache, cached
+
+import bedmap2.data as data
+import bedmap2.geoid as geoid
+import bedmap2.transform as transform
+
+
+@cached(cache={})
+def cell_area() -> np.ndarray:
+    """
+    Return the true area (in square meters) of every BEDMAP2 grid cell
+    on the WGS84 ellipsoid, including the distortion of the projection.
+
+    The results of this function are cached.
+
+    Returns
+    -------
+    area: np.ndarray
+        The (nrows, ncols) area of each cell.
+    """
+
+    # allocate the output grid
+    area = np.empty((transform.nrows, transform.ncols), dtype=np.float32)
+
+    # and compute the area a chunk of rows at a time
+    for rows, lat, _ in geoid._grid_chunks():
+        area[rows] = 1e6 / transform.scale_factor(lat) ** 2.0
+
+    # and we are done
+    return area
+
+
+class WeightTable(NamedTuple):
+    """
+    The table used to draw grid cells in proportion to a set of weights.
+    """
+
+    # the flat index of each cell with a positive weight
+    cells: np.ndarray
+
+    # the cumulative weight over these cells
+    cdf: np.ndarray
+
+    # the first candidate cell for each of N equal slices of the weight
+    guide: np.ndarray
+
+
+def build_table(grid: np.ndarray, area: bool = True) -> WeightTable:
+    """
+    Build the table used to draw grid cells in proportion to `grid`.
+
+    This is the cumulative weight over every cell with a positive weight
+    along with a guide table (Chen & Asau's cutpoint method) that gives
+    the first candidate cell for each of N equal slices of the cumulative
+    weight, so drawing a cell takes (on average) about two lookups.
+
+    Parameters
+    ----------
+    grid: np.ndarray
+        The (nrows, ncols) weight of every BEDMAP2 grid cell.
+    area: bool
+        If True, multiply the weights by the true area of each cell.
+
+    Returns
+    -------
+    table: WeightTable
+        The table to draw cells from.
+    """
+    if np.shape(grid) != (transform.nrows, transform.ncols):
+        raise ValueError(
+            f"the weights have shape {np.shape(grid)} not the BEDMAP2 grid"
+        )
+
+    # missing data has zero weight
+    grid = ma.filled(ma.masked_array(grid, dtype=float), 0.0)
+
+    # include the area of each cell if requested
+    if area:
+        grid *= cell_area()
+
+    # we only draw from the cells that have a positive weight
+    flat = grid.ravel()
+    cells = np.flatnonzero(flat > 0).astype(np.int32)
+    if cells.size == 0:
+        raise ValueError("there are no grid cells with a positive weight")
+
+    # the cumulative weight over these cells
+    cdf = np.cumsum(flat[cells])
+
+    # and the first cell that could contain each slice of the weight
+    slices = np.arange(cells.size) * (cdf[-1] / cells.size)
+    guide = np.searchsorted(cdf, slices, side="right")
+    guide = np.minimum(guide, cells.size - 1).astype(np.int32)
+
+    # and we are done
+    return WeightTable(cells, cdf, guide)
+
+
+@cached(cache=LRUCache(maxsize=4), key=data.layer_hashkey)
+def layer_table(name: str, area: bool = True) -> WeightTable:
+    """
+    Build the table used to draw grid cells in proportion to the layer `name`.
+
+    The results of this function are cached by `data.cache_key` so the
+    table is rebuilt if the layer changes.
+    """
+    if data.layer_grid(name) != transform.bedmap_grid:
+        raise ValueError(f"{name} is not on the BEDMAP2 grid")
+    return build_table(data.load_data(name), area)
+
+
+def weight_table(
+    weights: Union[str, Callable[[], np.ndarray], WeightTable], area: bool = True
+) -> WeightTable:
+    """
+    Return the table used to draw grid cells in proportion to `weights`.
+
+    The tables of layers are cached. The tables of functions are built on
+    every call, so a table that is used repeatedly should be built once
+    with this function and passed to `random_points` in place of the weights.
+
+    Parameters
+    ----------
+    weights: Union[str, Callable[[], np.ndarray], WeightTable]
+        Either the name of a layer, a function returning the weight of
+        every grid cell as a (nrows, ncols) array - these must be on the
+        BEDMAP2 grid - or an existing table (which is returned as is).
+    area: bool
+        If True, multiply the weights by the true area of each cell.
+
+    Returns
+    -------
+    table: WeightTable
+        The flat index of each weighted cell, the cumulative weight,
+        and the guide table into the cumulative weight.
+    """
+    if isinstance(weights, WeightTable):
+        return weights
+    elif isinstance(weights, str):
+        return layer_table(weights, area)
+    else:
+        return build_table(weights(), area)
+
+
+def random_points(
+    n: int,
+    weights: Union[str, Callable[[], np.ndarray], WeightTable] = "thickness",
+    area: bool = True,
+    layers: Sequence[str] = (),
+    seed: Optional[Union[int, np.random.Generator]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, ma.masked_array]]:
+    """
+    Draw `n` random points distributed in proportion to `weights`.
+
+    By default, the points are distributed in proportion to the ice volume
+    (the thickness times the true area of each cell). Each point is drawn
+    from a grid cell without rejection and then uniformly jittered within
+    that cell.
+
+    Parameters
+    ----------
+    n: int
+        The number of points to draw.
+    weights: Union[str, Callable[[], np.ndarray], WeightTable]
+        Either the name of a layer or a function returning the weight of
+        every grid cell as a (nrows, ncols) array on the BEDMAP2 grid.
+        Missing data and non-positive weights are never drawn. Functions
+        are evaluated on every call - pass the `weight_table` of a function
+        to reuse it.
+    area: bool
+        If True, multiply the weights by the true area of each cell
+        (this is ignored if `weights` is a `WeightTable`).
+    layers: Sequence[str]
+        The layers to sample at each point - these can be on any grid.
+    seed: Optional[Union[int, np.random.Generator]]
+        The seed (or generator) used to draw the points.
+
+    Returns
+    -------
+    lat, lon, x, y, values: Tuple[np.ndarray, ...]
+        The latitude and longitude (in degrees), the (x, y) polar
+        stereographic coordinates (in m) and a dictionary of the value
+        of each layer at every point.
+    """
+
+    # get the table to draw from - this is cached for layers
+    cells, cdf, guide = weight_table(weights, area)
+
+    # the random number generator
+    rng = np.random.default_rng(seed)
+
+    # draw the target cumulative weight of each point - rounding can't
+    # take the target to the end of the last cell
+    u = rng.random(n)
+    target = np.minimum(u * cdf[-1], np.nextafter(cdf[-1], 0.0))
+
+    # start from the first candidate given by the guide table
+    k = guide[np.minimum((u * cells.size).astype(np.intp), cells.size - 1)]
+
+    # and walk forward until we reach the cell containing the target
+    active = np.flatnonzero(cdf[k] <= target)
+    while active.size > 0:
+        k[active] += 1
+        active = active[cdf[k[active]] <= target[active]]
+
+    # convert the flat cell indices into indices into the grid
+    iy, ix = np.divmod(cells[k], transform.ncols)
+
+    # and jitter each point uniformly within its cell
+    x, y = transform.index_to_xy(ix, iy)
+    x += 1e3 * (rng.random(n) - 0.5)
+    y += 1e3 * (rng.random(n) - 0.5)
+
+    # convert the points back into latitude and longitude
+    lat, lon = transform.xy_to_latlon(x, y)
+
+    # and sample each of the requested layers at the jittered points
+    values = data.sample(x, y, layers, mode="xy")
+
+    # and we are done
+    return lat, lon, x, y, values
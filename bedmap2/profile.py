@@ -1,13 +1,16 @@
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 
 import bedmap2.data as data
 import bedmap2.geoid as geoid
+import bedmap2.instrument as instrument
 import bedmap2.transform as transform
 
+# matplotlib is slow to import so it is only imported when we plot
+if TYPE_CHECKING:
+    import matplotlib.figure
+
 
 def xy_along_path(
     latstart: float,
@@ -69,9 +72,10 @@ def xy_along_path(
         return x, y
 
 
+@instrument.timed("profile.flat_profile")
 def flat_profile(
     latstart: float, lonstart: float, latend: float, lonend: float
-) -> matplotlib.figure.Figure:
+) -> "matplotlib.figure.Figure":
     """
     Produce a figure containing the BEDMAP2 profile between
     (latstart, lonstart) and (latend, lonend).
@@ -108,6 +112,8 @@ def flat_profile(
     thickness = data.thickness(x, y, mode="xy") / 1000.0
 
     # create the figure and plot
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
 
     # compute the range along this trajectory [in km]
@@ -139,9 +145,10 @@ def flat_profile(
     return fig
 
 
+@instrument.timed("profile.curved_profile")
 def curved_profile(
     latstart: float, lonstart: float, latend: float, lonend: float, curved: bool = False
-) -> matplotlib.figure.Figure:
+) -> "matplotlib.figure.Figure":
     """
     Produce a figure containing the BEDMAP2 profile between
     (latstart, lonstart) and (latend, lonend).
@@ -196,6 +203,8 @@ def curved_profile(
     thickness = data.thickness(x, y, mode="xy") / 1000.0
 
     # create the figure and plot
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
 
     # compute the minimum value of the plot
@@ -0,0 +1,141 @@
+"""
+A reusable sampler for repeatedly sampling layers at a fixed set of points.
+"""
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+import bedmap2.instrument as instrument
+import bedmap2.transform as transform
+
+
+class Sampler:
+    """
+    Sample layers at a fixed set of points without reprojecting them.
+
+    The points are projected once into int32 flat indices into the
+    BEDMAP2 grid along with a mask of the points that lie on the grid,
+    so sampling each layer is a single `np.take`. Points that are off
+    the grid are masked in every sampled layer. A sampler can be saved
+    to disk with `save` and reloaded with `Sampler.load`.
+
+    Parameters
+    ----------
+    lat or x: np.ndarray
+        The latitude of each point in degrees or PS coordinate in meters.
+    lon or y: np.ndarray
+        The longitude of each point in degrees or PS coordinate in meters.
+    mode: str
+        Whether the coordinates are 'latlon' or 'xy' coordinates.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, mode: str = "latlon") -> None:
+
+        # convert the points into polar stereographic
+        x: np.ndarray
+        y: np.ndarray
+        if mode == "latlon":
+            x, y = transform.latlon_to_xy(np.asarray(lat), np.asarray(lon))
+        elif mode == "xy":
+            x, y = np.asarray(lat), np.asarray(lon)
+        else:
+            raise ValueError(f"{mode} is an invalid dataset access mode.")
+        x, y = np.broadcast_arrays(x, y)
+
+        # find the (fractional) location of each point in the grid
+        u, v = transform.xy_to_grid(x, y)
+        with np.errstate(invalid="ignore"):
+            valid = (u >= 0) & (u < transform.ncols) & (v >= 0) & (v < transform.nrows)
+
+        # and store the flat index of each point - invalid points use cell 0
+        ix = np.floor(u, where=valid, out=np.zeros(u.shape)).astype(np.int32)
+        iy = np.floor(v, where=valid, out=np.zeros(v.shape)).astype(np.int32)
+        self.index = (iy * np.int32(transform.ncols) + ix).ravel()
+        self.valid = valid.ravel()
+        self.shape: Tuple[int, ...] = x.shape
+
+    def __len__(self) -> int:
+        return self.index.size
+
+    def gather(self, layer: Union[str, np.ndarray]) -> ma.masked_array:
+        """
+        Sample a single layer at each point.
+
+        Parameters
+        ----------
+        layer: Union[str, np.ndarray]
+            The name of a layer or a (nrows, ncols) array over the grid,
+            i.e. a perturbed copy of a layer.
+
+        Returns
+        -------
+        values: ma.masked_array
+            The value of the layer at each point.
+        """
+        if isinstance(layer, str) and data.layer_grid(layer) != transform.bedmap_grid:
+            raise ValueError(f"{layer} is not on the BEDMAP2 grid")
+        grid = data.load_data(layer) if isinstance(layer, str) else layer
+        if np.shape(grid) != (transform.nrows, transform.ncols):
+            raise ValueError("the layer must cover the BEDMAP2 grid")
+
+        with instrument.stage("data.gather"):
+            # gather the values (and the mask if there is one)
+            values = np.take(ma.getdata(grid).reshape(-1), self.index)
+            mask = ~self.valid
+            if ma.getmask(grid) is not ma.nomask:
+                mask |= np.take(ma.getmask(grid).reshape(-1), self.index)
+        instrument.count("points_sampled", self.index.size)
+
+        return ma.masked_array(values, mask=mask).reshape(self.shape)
+
+    def sample(self, layers: Sequence[str]) -> Dict[str, ma.masked_array]:
+        """
+        Sample several layers at each point.
+
+        Parameters
+        ----------
+        layers: Sequence[str]
+            The names of the layers to sample.
+
+        Returns
+        -------
+        values: Dict[str, ma.masked_array]
+            The value of each layer at each point.
+        """
+        return {name: self.gather(name) for name in layers}
+
+    def save(self, filename: str) -> None:
+        """
+        Save the sampler to `filename` as a NPZ file.
+
+        Parameters
+        ----------
+        filename: str
+            The file to save the sampler into.
+        """
+        with open(filename, "wb") as f:
+            np.savez(f, index=self.index, valid=self.valid, shape=self.shape)
+
+    @classmethod
+    def load(cls, filename: str) -> "Sampler":
+        """
+        Load a sampler saved with `save`.
+
+        Parameters
+        ----------
+        filename: str
+            The file containing the sampler.
+
+        Returns
+        -------
+        sampler: Sampler
+            The loaded sampler.
+        """
+        sampler = cls.__new__(cls)
+        with np.load(filename) as f:
+            sampler.index = f["index"]
+            sampler.valid = f["valid"]
+            sampler.shape = tuple(int(n) for n in f["shape"])
+        return sampler
@@ -0,0 +1,428 @@
+"""
+A local sampling server that keeps the BEDMAP2 layers resident in memory.
+
+Clients send batches of coordinates over a Unix socket or a localhost TCP
+socket using a compact binary framing and receive the gathered layer
+values. Every frame starts with a fixed header (see `HEADER`):
+
+    magic (4s), opcode (B), mode (B), namelen (H), length (Q)
+
+`namelen` is the number of bytes of comma-separated layer names that
+follow the header - this is zero for every frame except a SAMPLE request.
+A SAMPLE request is followed by the layer names and `length` float64
+latitudes (or x) and then `length` float64 longitudes (or y), where
+`length` is at most `MAX_POINTS`. The response is followed by, for each
+requested layer, `length` float64 values and then `length` uint8 mask flags.
+A STATS request has no payload and the response is followed by `length`
+bytes of JSON. An ERROR response is followed by a `length` byte UTF-8
+message.
+
+All values are little-endian.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+from bedmap2.cli import register_sources, source_spec
+
+# the header of every frame
+HEADER = struct.Struct("<4sBBHQ")
+
+# the magic bytes at the start of every frame
+MAGIC = b"BM2S"
+
+# the largest number of points in a single SAMPLE request
+MAX_POINTS = 1 << 24
+
+# the opcodes of each frame
+SAMPLE = 1
+STATS = 2
+ERROR = 255
+
+# the coordinate modes
+MODES = ["latlon", "xy"]
+
+# a Unix socket path or a (host, port) pair
+Address = Union[str, Tuple[str, int]]
+
+
+def recv_into(sock: socket.socket, buffer: Any) -> None:
+    """
+    Receive exactly enough bytes from `sock` to fill `buffer`.
+
+    Parameters
+    ----------
+    sock: socket.socket
+        The socket to receive from.
+    buffer: Any
+        A writable buffer (i.e. a bytearray or a numpy array).
+    """
+    view = memoryview(buffer).cast("B")
+    while view.nbytes > 0:
+        nbytes = sock.recv_into(view)
+        if nbytes == 0:
+            raise ConnectionError("the connection was closed")
+        view = view[nbytes:]
+
+
+class Stats:
+    """
+    Thread-safe throughput and latency statistics for a server.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.points = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.busy = 0.0
+        self.max_latency = 0.0
+
+    def record(
+        self, points: int, bytes_in: int, bytes_out: int, latency: float
+    ) -> None:
+        """
+        Record a single completed request.
+        """
+        with self.lock:
+            self.requests += 1
+            self.points += points
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.busy += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return a snapshot of the statistics as a dictionary.
+        """
+        with self.lock:
+            return {
+                "uptime": time.time() - self.start,
+                "requests": self.requests,
+                "errors": self.errors,
+                "points": self.points,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "mean_latency": self.busy / max(self.requests, 1),
+                "max_latency": self.max_latency,
+                "throughput": self.points / self.busy if self.busy > 0 else 0.0,
+            }
+
+
+class Handler(socketserver.BaseRequestHandler):
+    """
+    Handle the frames sent over a single client connection.
+    """
+
+    server: "Server"
+
+    def handle(self) -> None:
+        header = bytearray(HEADER.size)
+        while True:
+            # wait for the next frame - the client may close at any time
+            try:
+                recv_into(self.request, header)
+            except ConnectionError:
+                return
+
+            start = time.perf_counter()
+            magic, opcode, mode, namelen, length = HEADER.unpack(header)
+
+            # we can't skip the payload of a frame that we can't parse
+            framed = magic == MAGIC and (opcode != SAMPLE or length <= MAX_POINTS)
+
+            try:
+                if magic != MAGIC:
+                    raise ValueError("invalid frame header")
+                elif opcode == SAMPLE:
+                    if length > MAX_POINTS:
+                        raise ValueError(f"{length} is more than {MAX_POINTS} points")
+                    self.sample(mode, namelen, length, start)
+                elif opcode == STATS:
+                    self.reply(STATS, json.dumps(self.server.stats.snapshot()).encode())
+                else:
+                    raise ValueError(f"{opcode} is not a valid opcode")
+            except ConnectionError:
+                return
+            except Exception as error:
+                with self.server.stats.lock:
+                    self.server.stats.errors += 1
+                self.reply(ERROR, str(error).encode())
+
+                # the rest of a bad frame can't be parsed so hang up
+                if not framed:
+                    return
+
+    def reply(self, opcode: int, payload: bytes) -> None:
+        """
+        Send a frame with a bytes payload.
+        """
+        self.request.sendall(HEADER.pack(MAGIC, opcode, 0, 0, len(payload)) + payload)
+
+    def sample(self, mode: int, namelen: int, length: int, start: float) -> None:
+        """
+        Sample the layers for a SAMPLE request.
+        """
+
+        # read the layer names and the coordinates directly into arrays
+        names = bytearray(namelen)
+        recv_into(self.request, names)
+        coords = np.empty((2, length), dtype="<f8")
+        recv_into(self.request, coords)
+
+        # sample every layer with a single projection
+        layers = names.decode().split(",") if namelen > 0 else []
+        values = data.sample(coords[0], coords[1], layers, mode=MODES[mode])
+
+        # send the header and then each layer without copying into a frame -
+        # float64 layers are sent as is and other layers are converted once
+        self.request.sendall(HEADER.pack(MAGIC, SAMPLE, mode, 0, length))
+        nbytes = HEADER.size
+        for name in layers:
+            value: ma.masked_array = ma.masked_array(values[name], dtype="<f8")
+            buffers = (
+                np.ascontiguousarray(ma.getdata(value)),
+                np.ascontiguousarray(ma.getmaskarray(value)).view(np.uint8),
+            )
+            for buffer in buffers:
+                self.request.sendall(buffer.data.cast("B"))
+                nbytes += buffer.nbytes
+
+        # and record the statistics for this request
+        self.server.stats.record(
+            length,
+            HEADER.size + namelen + coords.nbytes,
+            nbytes,
+            time.perf_counter() - start,
+        )
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.BaseServer):
+    """
+    The base class of the sampling servers.
+    """
+
+    daemon_threads = True
+    stats: Stats
+
+
+class UnixServer(Server, socketserver.UnixStreamServer):
+    """
+    A sampling server listening on a Unix socket.
+    """
+
+
+class TCPServer(Server, socketserver.TCPServer):
+    """
+    A sampling server listening on a TCP socket.
+    """
+
+    allow_reuse_address = True
+
+
+def make_server(address: Address, preload: Sequence[str] = ()) -> Server:
+    """
+    Create a sampling server listening on `address` and load `preload`.
+
+    Parameters
+    ----------
+    address: Address
+        A Unix socket path or a (host, port) pair.
+    preload: Sequence[str]
+        The layers to load before accepting connections.
+
+    Returns
+    -------
+    server: Server
+        The server - call `serve_forever()` to start serving.
+    """
+
+    # load all the requested layers once - they are shared by all clients
+    for name in preload:
+        data.load_data(name)
+
+    # create the server
+    server: Server
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixServer(address, Handler)
+    else:
+        server = TCPServer(address, Handler)
+    server.stats = Stats()
+
+    return server
+
+
+class Client:
+    """
+    A client of a running sampling server.
+
+    Parameters
+    ----------
+    address: Address
+        A Unix socket path or a (host, port) pair.
+    """
+
+    def __init__(self, address: Address) -> None:
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect(address)
+        self.header = bytearray(HEADER.size)
+
+    def sample(
+        self,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        layers: Sequence[str],
+        mode: str = "latlon",
+    ) -> Dict[str, ma.masked_array]:
+        """
+        Sample `layers` at each point - see `data.sample`.
+
+        Parameters
+        ----------
+        lat or x: np.ndarray
+            The latitude of each point in degrees or PS coordinate in meters.
+        lon or y: np.ndarray
+            The longitude of each point in degrees or PS coordinate in meters.
+        layers: Sequence[str]
+            The names of the datasets to load.
+        mode: str
+            Whether the coordinates are 'latlon' or 'xy' coordinates.
+
+        Returns
+        -------
+        values: Dict[str, ma.masked_array]
+            The values of each dataset at each location.
+        """
+
+        # the coordinates are sent as a single contiguous buffer
+        lat, lon = np.broadcast_arrays(lat, lon)
+        if lat.size > MAX_POINTS:
+            raise ValueError(f"a request can have at most {MAX_POINTS} points")
+        coords = np.empty((2, lat.size), dtype="<f8")
+        coords[0], coords[1] = lat.ravel(), lon.ravel()
+        names = ",".join(layers).encode()
+
+        # send the request
+        self.sock.sendall(
+            HEADER.pack(MAGIC, SAMPLE, MODES.index(mode), len(names), lat.size) + names
+        )
+        self.sock.sendall(coords.data.cast("B"))
+
+        # and read each layer directly into its output array
+        self.receive(SAMPLE)
+        values = {}
+        for name in layers:
+            value = np.empty(lat.size, dtype="<f8")
+            mask = np.empty(lat.size, dtype=bool)
+            recv_into(self.sock, value)
+            recv_into(self.sock, mask)
+            values[name] = ma.masked_array(value, mask=mask).reshape(lat.shape)
+
+        return values
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the throughput and latency statistics of the server.
+        """
+        self.sock.sendall(HEADER.pack(MAGIC, STATS, 0, 0, 0))
+        length = self.receive(STATS)
+        payload = bytearray(length)
+        recv_into(self.sock, payload)
+        return json.loads(payload.decode())
+
+    def receive(self, opcode: int) -> int:
+        """
+        Receive a response header and return the length of the response.
+        """
+        recv_into(self.sock, self.header)
+        magic, reply, _, _, length = HEADER.unpack(self.header)
+        if reply == ERROR:
+            message = bytearray(length)
+            recv_into(self.sock, message)
+            raise RuntimeError(message.decode())
+        if magic != MAGIC or reply != opcode:
+            raise ConnectionError("invalid response from server")
+        return length
+
+    def close(self) -> None:
+        """
+        Close the connection to the server.
+        """
+        self.sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Run a sampling server.
+
+    This is installed as the `bedmap2-server` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="bedmap2-server",
+        description="Serve BEDMAP2 layers from memory to local clients.",
+    )
+    parser.add_argument("--unix", help="listen on this Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument(
+        "-l", "--layers", nargs="*", default=["bed", "surface", "thickness"]
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        type=source_spec,
+        default=[],
+        help="register the raster at PATH as the layer NAME",
+        metavar="NAME=PATH",
+    )
+    args = parser.parse_args(argv)
+
+    # register any extra rasters
+    register_sources(args.source)
+
+    # create the server and load the layers
+    address: Address = args.unix if args.unix else (args.host, args.port)
+    server = make_server(address, args.layers)
+    print(f"Serving BEDMAP2 on {address}.", file=sys.stderr)
+
+    # and serve until we are interrupted
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
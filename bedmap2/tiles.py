@@ -0,0 +1,573 @@
+"""
+Render the BEDMAP2 layers into color-mapped PNG map tiles.
+
+The tiles form an XYZ pyramid over the polar stereographic BEDMAP2 grid.
+Zoom 0 is a single tile covering the whole grid, and each zoom level
+splits every tile of the level above into four. Tile (x, y) counts
+columns from the left (-x) and rows from the top (+y) of the grid.
+
+Each tile is rendered from the coarsest decimated overview of the layer
+that still has at least one cell per pixel, so rendering only touches
+`tilesize * tilesize` cells at every zoom level. The overviews are built
+once and memory-mapped from the on-disk cache, and the rendered tiles are
+kept in an on-disk least-recently-used cache.
+"""
+import argparse
+import io
+import os
+import sys
+from multiprocessing import Pool
+from os.path import dirname, join
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import numpy.ma as ma
+from cachetools import cached
+
+import bedmap2.data as data
+import bedmap2.instrument as instrument
+import bedmap2.transform as transform
+from bedmap2.cli import register_sources, source_spec
+
+# the width and height of each tile in pixels
+tilesize = 256
+
+# the factors that the overviews are decimated by along each axis
+overview_factors = [1, 2, 4, 8, 16, 32]
+
+# the layers that are decimated by sampling (instead of averaging) each block
+categorical_layers = [
+    "coverage",
+    "rockmask",
+    "icemask_grounded_and_shelves",
+    "lakemask_vostok",
+    "classification",
+]
+
+# the maximum size of the tile cache (in bytes)
+cache_size = int(os.environ.get("BEDMAP2_TILE_CACHE_SIZE", 2 ** 30))
+
+
+def tile_dir() -> str:
+    """
+    Return the directory where rendered tiles are cached.
+
+    If BEDMAP2_TILES is defined, use that - otherwise use
+    a `tiles` directory inside the derived layer cache.
+
+    Returns
+    -------
+    directory: str
+        The directory used to cache rendered tiles.
+    """
+    return os.environ.get("BEDMAP2_TILES", join(data.cache_dir(), "tiles"))
+
+
+class TileCache:
+    """
+    An on-disk least-recently-used cache of rendered tiles.
+
+    Reading a tile marks it as recently used by touching its modification
+    time. When the cache grows beyond `maxsize` bytes, the least recently
+    used tiles are removed until it is below three quarters of `maxsize`
+    so that we only scan the cache occasionally.
+
+    Parameters
+    ----------
+    directory: str
+        The directory that the tiles are stored in.
+    maxsize: int
+        The maximum size of the cache (in bytes).
+    """
+
+    def __init__(self, directory: str, maxsize: int) -> None:
+        self.directory = directory
+        self.maxsize = maxsize
+
+        # the size of the cache - this is only scanned when we first need it
+        self.size: Optional[int] = None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Return the tile stored under `key` or None if it is not cached.
+
+        Parameters
+        ----------
+        key: str
+            The relative path of the tile.
+
+        Returns
+        -------
+        png: Optional[bytes]
+            The PNG tile if it is cached.
+        """
+        path = join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                png = f.read()
+        except FileNotFoundError:
+            instrument.count("tiles.misses")
+            return None
+
+        # mark the tile as recently used - it may have just been evicted
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        instrument.count("tiles.hits")
+
+        return png
+
+    def put(self, key: str, png: bytes) -> None:
+        """
+        Store the tile `png` under `key` and evict old tiles if needed.
+
+        Parameters
+        ----------
+        key: str
+            The relative path of the tile.
+        png: bytes
+            The PNG tile.
+        """
+        path = join(self.directory, key)
+        os.makedirs(dirname(path), exist_ok=True)
+
+        # write to a temporary file and atomically move into place
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+
+        # keep track of the size of the cache
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.files())
+        else:
+            self.size += len(png)
+
+        # and evict the least recently used tiles if we are too big
+        if self.size > self.maxsize:
+            self.evict()
+
+    def files(self) -> List[Tuple[int, int, str]]:
+        """
+        Return the (mtime, size, path) of every tile in the cache.
+        """
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".png"):
+                    continue
+                path = join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return files
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used tiles until the cache
+        is below three quarters of its maximum size.
+        """
+        files = sorted(self.files())
+        size = sum(nbytes for _, nbytes, _ in files)
+        for _, nbytes, path in files:
+            if size <= 3 * self.maxsize // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= nbytes
+        self.size = size
+
+
+@cached(cache={})
+def tile_cache(directory: str) -> TileCache:
+    """
+    Return the tile cache in `directory` - this is shared by every call.
+    """
+    return TileCache(directory, cache_size)
+
+
+def overview_grid(name: str, factor: int) -> transform.Grid:
+    """
+    Return the geometry of the overview of `name` decimated by `factor`.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+    factor: int
+        The decimation factor along each axis.
+
+    Returns
+    -------
+    grid: transform.Grid
+        The geometry of the overview.
+    """
+    grid = data.layer_grid(name)
+    return transform.Grid(
+        grid.x0,
+        grid.y0,
+        grid.resolution * factor,
+        -(-grid.nrows // factor),
+        -(-grid.ncols // factor),
+    )
+
+
+@cached(cache={}, key=data.layer_hashkey)
+def load_overview(name: str, factor: int) -> ma.masked_array:
+    """
+    Load the layer `name` decimated by `factor` along each axis.
+
+    Each cell of the overview is the mean of the valid cells in a block
+    of `factor` x `factor` cells of the layer (or the first cell of the
+    block for the `categorical_layers`). The overviews are built once and
+    memory-mapped from the on-disk cache. The overview with a factor of 1
+    is the layer itself.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+    factor: int
+        One of the `overview_factors`.
+
+    Returns
+    -------
+    overview: ma.masked_array
+        The overview - masked where there is no valid data.
+    """
+    if factor not in overview_factors:
+        raise ValueError(f"{factor} is not a valid overview factor")
+
+    # the layer is its own overview
+    if factor == 1:
+        return data.load_data(name)
+
+    def build() -> np.ndarray:
+        # pad the layer with NaN to a whole number of blocks
+        layer = data.load_data(name)
+        nrows, ncols = layer.shape
+        grid = overview_grid(name, factor)
+        values = np.full(
+            (grid.nrows * factor, grid.ncols * factor), np.nan, dtype=np.float32
+        )
+        values[:nrows, :ncols] = ma.filled(
+            ma.masked_array(layer, dtype=np.float32), np.nan
+        )
+        blocks = values.reshape(grid.nrows, factor, grid.ncols, factor)
+
+        # categorical layers take the first cell of each block
+        if name in categorical_layers:
+            return np.ascontiguousarray(blocks[:, 0, :, 0])
+
+        # and the rest take the mean of the valid cells of each block
+        valid = ~np.isnan(blocks)
+        count = valid.sum(axis=(1, 3))
+        total = np.where(valid, blocks, 0.0).sum(axis=(1, 3), dtype=np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (total / count).astype(np.float32)
+
+    overview = data.load_cached(f"overview_{data.cache_key(name)}_{factor}.npy", build)
+    return ma.masked_invalid(overview, copy=False)
+
+
+def pixel_size(z: int) -> float:
+    """
+    Return the width of a pixel (in meters) at zoom level `z`.
+    """
+    grid = transform.bedmap_grid
+    extent = max(grid.nrows, grid.ncols) * grid.resolution
+    return extent / (tilesize * 2 ** z)
+
+
+def overview_factor(name: str, pixel: float) -> int:
+    """
+    Return the largest overview factor of `name` that has
+    at least one cell for every pixel of width `pixel` (m).
+    """
+    cells = pixel / data.layer_grid(name).resolution
+    return max(factor for factor in overview_factors if factor <= max(cells, 1))
+
+
+@cached(cache={}, key=data.layer_hashkey)
+def value_range(name: str) -> Tuple[float, float]:
+    """
+    Return the default (vmin, vmax) color range of `name`.
+
+    This is the range of the coarsest overview so that
+    every tile of a layer uses the same color range.
+    """
+    overview = load_overview(name, overview_factors[-1])
+    if overview.count() == 0:
+        return 0.0, 1.0
+    return float(overview.min()), float(overview.max())
+
+
+def tile_values(name: str, z: int, x: int, y: int) -> ma.masked_array:
+    """
+    Sample the layer `name` at the center of every pixel of a tile.
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+    z, x, y: int
+        The zoom level, column and row of the tile.
+
+    Returns
+    -------
+    values: ma.masked_array
+        The (tilesize, tilesize) values of the layer - masked where
+        there is no data or the pixel is off the layer.
+    """
+    if z < 0 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"({z}, {x}, {y}) is not a valid tile")
+
+    # the (x, y) coordinates of the center of every pixel
+    pixel = pixel_size(z)
+    centers = (np.arange(tilesize) + 0.5) * pixel
+    px, py = np.meshgrid(
+        transform.bedmap_grid.x0 + x * tilesize * pixel + centers,
+        transform.bedmap_grid.y0 - y * tilesize * pixel - centers,
+    )
+
+    # find each pixel in the coarsest overview that we can use
+    factor = overview_factor(name, pixel)
+    ix, iy, valid = overview_grid(name, factor).locate(px, py)
+
+    # and gather the overview at each pixel
+    with instrument.stage("tiles.gather"):
+        values: ma.masked_array = ma.masked_array(load_overview(name, factor)[iy, ix])
+        values[~valid] = ma.masked
+
+    return values
+
+
+def colorize(
+    values: ma.masked_array, cmap: str, vmin: float, vmax: float
+) -> np.ndarray:
+    """
+    Color-map `values` into a uint8 RGBA image - masked values are transparent.
+    """
+    import matplotlib
+
+    # scale the values into [0, 1]
+    scale = vmax - vmin if vmax != vmin else 1.0
+    scaled = (ma.masked_array(values, dtype=float) - vmin) / scale
+
+    # and map them through the colormap
+    colormap = matplotlib.colormaps[cmap].with_extremes(bad=(0, 0, 0, 0))
+    return colormap(scaled, bytes=True)
+
+
+def encode(rgba: np.ndarray) -> bytes:
+    """
+    Encode a uint8 RGBA image as a PNG.
+    """
+    import matplotlib.image
+
+    buffer = io.BytesIO()
+    matplotlib.image.imsave(buffer, rgba, format="png")
+    return buffer.getvalue()
+
+
+def render_tile(
+    name: str,
+    z: int,
+    x: int,
+    y: int,
+    cmap: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    cache: bool = True,
+) -> bytes:
+    """
+    Render a color-mapped PNG tile of the layer `name`.
+
+    Cells without data are transparent. If `cache` is True, the tile is
+    read from (or stored into) the on-disk tile cache in `tile_dir()`
+    which is limited to BEDMAP2_TILE_CACHE_SIZE bytes (1 GiB by default).
+
+    Parameters
+    ----------
+    name: str
+        The name of the layer.
+    z, x, y: int
+        The zoom level, column and row of the tile.
+    cmap: str
+        The name of the matplotlib colormap.
+    vmin, vmax: Optional[float]
+        The range of the colormap - by default, the range of the layer.
+    cache: bool
+        If True, use the on-disk tile cache.
+
+    Returns
+    -------
+    png: bytes
+        The PNG tile.
+    """
+
+    # every tile of a layer uses the same color range
+    if vmin is None or vmax is None:
+        low, high = value_range(name)
+        vmin = low if vmin is None else vmin
+        vmax = high if vmax is None else vmax
+
+    # tiles are cached by layer, style and tile
+    tiles = tile_cache(tile_dir()) if cache else None
+    style = f"{data.cache_key(name)}_{cmap}_{vmin:g}_{vmax:g}"
+    key = join(style, str(z), str(x), f"{y}.png")
+    if tiles is not None:
+        png = tiles.get(key)
+        if png is not None:
+            return png
+
+    # render the tile
+    with instrument.stage("tiles.render"):
+        png = encode(colorize(tile_values(name, z, x, y), cmap, vmin, vmax))
+    instrument.count("tiles.rendered")
+
+    # and store it in the cache
+    if tiles is not None:
+        tiles.put(key, png)
+
+    return png
+
+
+def _initialize(sources: Dict[str, data.Source]) -> None:
+    """
+    Share the registered layers with each seeding worker.
+    """
+    data.sources.update(sources)
+
+
+def _seed_tile(args: Tuple[Any, ...]) -> None:
+    """
+    Render a single (name, z, x, y, cmap, vmin, vmax) tile into the cache.
+    """
+    render_tile(*args)
+
+
+def seed(
+    names: Sequence[str],
+    zooms: Sequence[int],
+    workers: int = 1,
+    cmap: str = "viridis",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+) -> int:
+    """
+    Render every tile of several layers at several zoom levels into
+    the tile cache. Tiles that are already cached are not rendered again.
+
+    The overviews and color ranges are built before starting the
+    workers so that every worker memory-maps the same overviews.
+
+    Parameters
+    ----------
+    names: Sequence[str]
+        The names of the layers.
+    zooms: Sequence[int]
+        The zoom levels to render.
+    workers: int
+        The number of worker processes.
+    cmap: str
+        The name of the matplotlib colormap.
+    vmin, vmax: Optional[float]
+        The range of the colormap - by default, the range of each layer.
+
+    Returns
+    -------
+    ntiles: int
+        The number of tiles in the cache for these layers and zooms.
+    """
+
+    # the tiles that we render
+    jobs: List[Tuple[Any, ...]] = []
+    for name in names:
+        # build the color range and the overviews up front
+        low, high = value_range(name)
+        style = (cmap, low if vmin is None else vmin, high if vmax is None else vmax)
+        for z in zooms:
+            load_overview(name, overview_factor(name, pixel_size(z)))
+            jobs.extend(
+                (name, z, x, y, *style) for x in range(2 ** z) for y in range(2 ** z)
+            )
+
+    # and render them
+    if workers > 1:
+        with Pool(workers, _initialize, (dict(data.sources),)) as pool:
+            for _ in pool.imap_unordered(_seed_tile, jobs, chunksize=16):
+                pass
+    else:
+        for job in jobs:
+            _seed_tile(job)
+
+    return len(jobs)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Render BEDMAP2 layers into PNG map tiles.
+
+    This is installed as the `bedmap2-tiles` command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="bedmap2-tiles",
+        description="Render BEDMAP2 layers into PNG map tiles.",
+    )
+    parser.add_argument("--cmap", default="viridis")
+    parser.add_argument("--vmin", type=float, default=None)
+    parser.add_argument("--vmax", type=float, default=None)
+    parser.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        type=source_spec,
+        default=[],
+        help="register the raster at PATH as the layer NAME",
+        metavar="NAME=PATH",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # render a single tile into a file
+    render = commands.add_parser("render", help="render a single tile")
+    render.add_argument("layer")
+    render.add_argument("z", type=int)
+    render.add_argument("x", type=int)
+    render.add_argument("y", type=int)
+    render.add_argument("output", help="the output PNG file")
+
+    # pre-render tiles into the cache
+    seeder = commands.add_parser("seed", help="pre-render tiles into the cache")
+    seeder.add_argument(
+        "-l", "--layers", nargs="+", default=["bed", "surface", "thickness"]
+    )
+    seeder.add_argument("-z", "--zooms", nargs="+", type=int, default=[0, 1, 2, 3])
+    seeder.add_argument("-j", "--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    # register any extra rasters
+    register_sources(args.source)
+
+    if args.command == "render":
+        png = render_tile(
+            args.layer, args.z, args.x, args.y, args.cmap, args.vmin, args.vmax
+        )
+        with open(args.output, "wb") as f:
+            f.write(png)
+    else:
+        ntiles = seed(
+            args.layers, args.zooms, args.workers, args.cmap, args.vmin, args.vmax
+        )
+        print(f"Seeded {ntiles} tiles into {tile_dir()}.", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
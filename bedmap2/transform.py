@@ -1,8 +1,10 @@
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import numpy.ma as ma
 
+import bedmap2.instrument as instrument
+
 # the Earth eccentricity
 e = 0.081816153
 
@@ -22,6 +24,68 @@ psmin = -3333.5
 psmax = 3333.5
 
 
+class Grid(NamedTuple):
+    """
+    The geometry of a north-up raster in the South Polar Stereographic Projection.
+    """
+
+    # the x-coordinate of the left edge of the raster (m)
+    x0: float
+
+    # the y-coordinate of the top edge of the raster (m)
+    y0: float
+
+    # the width (and height) of each cell (m)
+    resolution: float
+
+    # the number of rows in the raster
+    nrows: int
+
+    # the number of columns in the raster
+    ncols: int
+
+    def locate(
+        self, x: np.ndarray, y: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Convert an array of x and y (in polar stereographic) coordinates
+        (in meters) into indices into this raster.
+
+        The cells follow the geotransform of the raster - for the BEDMAP2
+        geometry, these are half a cell from the cells of `xy_to_index`.
+
+        Parameters
+        ----------
+        x: np.ndarray
+            A N-length Numpy array of x-coordinates (m).
+        y: np.ndarray
+            A N-length Numpy array of y-coordinates (m).
+
+        Returns
+        -------
+        ix, iy, valid: np.ndarray
+            The (ix, iy) indices of each point and whether each point lies
+            on the raster - the indices of invalid points are zero.
+        """
+
+        # the fractional (column, row) of each point
+        u = (np.asarray(x, dtype=float) - self.x0) / self.resolution
+        v = (self.y0 - np.asarray(y, dtype=float)) / self.resolution
+        with np.errstate(invalid="ignore"):
+            valid = (u >= 0) & (u < self.ncols) & (v >= 0) & (v < self.nrows)
+
+        # and the index of the cell containing each valid point
+        ix = np.floor(u, where=valid, out=np.zeros(u.shape)).astype(np.intp)
+        iy = np.floor(v, where=valid, out=np.zeros(v.shape)).astype(np.intp)
+
+        return ix, iy, valid
+
+
+# the geometry of the BEDMAP2 rasters
+bedmap_grid = Grid(1e3 * psmin, 1e3 * psmax, 1e3, nrows, ncols)
+
+
+@instrument.timed("transform.xy_to_index")
 def xy_to_index(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
     Convert an array of x and y (in polar stereographic) coordinates
@@ -41,13 +105,73 @@ def xy_to_index(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
 
     # and get these are indices - since BEDMAP has a resolution of 1 km.
-    xi = np.asarray(1e-3 * np.abs(x - 1e3 * psmin) - 0.5, dtype=np.int)
-    yi = np.asarray(1e-3 * np.abs(y + 1e3 * psmin) - 0.5, dtype=np.int)
+    xi = np.asarray(1e-3 * np.abs(x - 1e3 * psmin) - 0.5, dtype=np.intp)
+    yi = np.asarray(1e-3 * np.abs(y + 1e3 * psmin) - 0.5, dtype=np.intp)
 
     # and we are done!
     return xi, yi
 
 
+def xy_to_grid(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert an array of x and y (in polar stereographic) coordinates
+    (in meters) into fractional BEDMAP2 grid coordinates.
+
+    The fractional coordinates are continuous and are defined so that
+    `floor(u), floor(v)` are the (ix, iy) indices returned by `xy_to_index`.
+    Each grid cell is therefore a unit square in (u, v).
+
+    Parameters
+    ----------
+    x: np.ndarray
+        A N-length Numpy array of x-coordinates (m).
+    y: np.ndarray
+        A N-length Numpy array of y-coordinates (m).
+
+    Returns
+    -------
+    u, v: np.ndarray
+        The fractional (column, row) coordinates into the BEDMAP2 dataset.
+    """
+
+    # the column increases with x and the row increases as y decreases
+    u = 1e-3 * (np.asarray(x, dtype=float) - 1e3 * psmin) - 0.5
+    v = 1e-3 * (1e3 * psmax - np.asarray(y, dtype=float)) - 0.5
+
+    # and we are done!
+    return u, v
+
+
+def index_to_xy(
+    ix: Union[int, np.ndarray], iy: Union[int, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert an array of BEDMAP2 1km data indices into the (x, y)
+    coordinates (in meters) of the center of each grid cell.
+
+    This is the inverse of `xy_to_index`.
+
+    Parameters
+    ----------
+    ix: np.ndarray
+        A N-length Numpy array of column indices.
+    iy: np.ndarray
+        A N-length Numpy array of row indices.
+
+    Returns
+    -------
+    x, y: np.ndarray
+        The (x, y) coordinates of each cell center (in m).
+    """
+
+    # the center of each cell is half a cell from the edge of its index
+    x = 1e3 * (psmin + 1.0) + 1e3 * np.asarray(ix, dtype=float)
+    y = 1e3 * (psmax - 1.0) - 1e3 * np.asarray(iy, dtype=float)
+
+    # and we are done!
+    return x, y
+
+
 def latlon_to_index(
     lat: np.ndarray, lon: np.ndarray
 ) -> Tuple[ma.masked_array, ma.masked_array]:
@@ -67,16 +191,61 @@ def latlon_to_index(
     ix, iy: np.ndarray
         The (ix, iy) indices into the BEDMAP2 dataset.
     """
-    # get the x,y locations into the grid in meters.
-    x, y = latlon_to_xy(lat, lon)
+    # get the x,y locations into the grid in meters - these aren't masked.
+    x, y = latlon_to_xy(lat, lon, out=_outputs(lat, lon, None))
 
     # and convert these to indices
     return xy_to_index(x, y)
 
 
+def float_dtype(*arrays: np.ndarray) -> np.dtype:
+    """
+    Return the floating point type used to compute with `arrays`.
+
+    This is float32 if all the arrays are float32 (so they are not
+    upcast) and float64 otherwise.
+
+    Parameters
+    ----------
+    arrays: np.ndarray
+        The input arrays.
+
+    Returns
+    -------
+    dtype: np.dtype
+        The floating point type.
+    """
+    return np.result_type(*(np.asarray(array).dtype for array in arrays), np.float32)
+
+
+def _outputs(
+    a: np.ndarray, b: np.ndarray, out: Optional[Tuple[np.ndarray, np.ndarray]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return `out` or allocate a pair of outputs for the broadcast of `a` and `b`.
+    """
+    if out is not None:
+        return out
+    shape = np.broadcast(a, b).shape
+    dtype = float_dtype(a, b)
+    return np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype)
+
+
+def _input_mask(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Return the combined mask of `a` and `b` if either is a masked array.
+    """
+    if not isinstance(a, ma.MaskedArray) and not isinstance(b, ma.MaskedArray):
+        return None
+    return ma.getmaskarray(a) | ma.getmaskarray(b)
+
+
+@instrument.timed("transform.latlon_to_xy")
 def latlon_to_xy(
-    lat: np.ndarray, lon: np.ndarray
-) -> Tuple[ma.masked_array, ma.masked_array]:
+    lat: np.ndarray,
+    lon: np.ndarray,
+    out: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Convert an array of latitude and longitude into (x, y) coordinates
     in the South Polar Stereographic Project (in m).
@@ -87,12 +256,19 @@ def latlon_to_xy(
         Stereographic Projections - starting pg. 154. Numerical example on pg. 315
         All page and equation numbers refer to Snyder
 
+    The inputs can be non-contiguous views (i.e. columns of a structured
+    array) and are never copied. float32 inputs are computed in float32.
+    If `out` is given, the coordinates are written into `out` (which must
+    not overlap the inputs) and are not masked outside the BEDMAP2 grid.
+
     Parameters
     ----------
     lat: np.ndarray
         A N-length Numpy array of latitudes (in degrees)
     lon: np.ndarray
         A N-length Numpy array of longitude (in degrees)
+    out: Optional[Tuple[np.ndarray, np.ndarray]]
+        The arrays to store the (x, y) coordinates in.
 
     Returns
     -------
@@ -100,17 +276,7 @@ def latlon_to_xy(
         The (x, y) coordinates in the South Pole Stereographic Projection (in m).
     """
 
-    # get references to latitude and longitude in radians
-    lat = np.radians(lat)
-    lon = np.radians(lon)
-
-    # compute t - Pg. 161 Eq. 15-9
-    t = np.tan(np.pi / 4.0 + lat / 2.0) / np.power(
-        (1.0 - e * np.sin(-lat)) / (1.0 + e * np.sin(-lat)), e / 2.0
-    )
-
     # this is the true-scale latitude
-    latc = -1.239183768915974
     latc = np.radians(-71.0)
 
     # this is t_c from Pg. 161, Eq., 21-34 in Snyder
@@ -123,26 +289,110 @@ def latlon_to_xy(
     m_c = np.cos(-latc) / np.sqrt(1.0 - e * e * np.power(np.sin(-latc), 2.0))
 
     # this is a*m_c/t_c - the scale factor multiplied by the coordinate transform
-    amtc = a * m_c / t_c
+    amtc = 1e3 * a * m_c / t_c
+
+    # the arrays that we compute into and a single work array
+    x, y = _outputs(lat, lon, out)
+    w = np.empty_like(y)
+
+    # get latitude in radians
+    np.radians(lat, out=y)
+
+    # compute e * sin(-lat)
+    np.sin(y, out=w)
+    w *= -e
+
+    # compute t - Pg. 161 Eq. 15-9 - using (1 - w)/(1 + w) = 2 / (1 + w) - 1
+    y *= 0.5
+    y += np.pi / 4.0
+    np.tan(y, out=y)
+    w += 1.0
+    np.divide(2.0, w, out=w)
+    w -= 1.0
+    np.power(w, e / 2.0, out=w)
+    y /= w
 
-    # we use t, a, t_c, and m_c to compute p.
-    p = t * amtc
+    # we use t, a, t_c, and m_c to compute p (in m) - this is stored in y
+    y *= amtc
 
     # we can then use p to find x, y relative to 0 degrees east.
-    # these are in km relative to the center of the Bedmap2 grid.
-    x = -p * np.sin(-lon)
-    y = p * np.cos(-lon)
+    np.radians(lon, out=w)
+    np.sin(w, out=x)
+    x *= y
+    np.cos(w, out=w)
+    y *= w
 
-    # we mask any coordinates outside the range of bedmap.
-    x = ma.masked_outside(x, psmin, psmax)
-    y = ma.masked_outside(y, psmin, psmax)
+    # if we were given outputs, we are done
+    if out is not None:
+        return x, y
 
-    # stack these into one array and return as meters
-    return 1e3 * x, 1e3 * y
+    # otherwise we mask any coordinates outside the range of bedmap.
+    x = ma.masked_outside(x, 1e3 * psmin, 1e3 * psmax, copy=False)
+    y = ma.masked_outside(y, 1e3 * psmin, 1e3 * psmax, copy=False)
 
+    # and any coordinates that were masked on input
+    mask = _input_mask(lat, lon)
+    if mask is not None:
+        x[mask], y[mask] = ma.masked, ma.masked
 
+    return x, y
+
+
+def scale_factor(lat: np.ndarray) -> np.ndarray:
+    """
+    Compute the scale factor of the South Polar Stereographic Projection
+    (true at 71 degrees S) at an array of latitudes.
+
+    Lengths in the projection are `scale_factor` times their true
+    length on the ellipsoid so the true area of a 1km x 1km grid cell
+    is 1 / scale_factor**2 square kilometers.
+
+    This uses Snyder Pg. 161, Eq. 21-32 (and Eq. 21-35 at the pole).
+
+    Parameters
+    ----------
+    lat: np.ndarray
+        A N-length Numpy array of latitudes (in degrees)
+
+    Returns
+    -------
+    k: np.ndarray
+        The scale factor at each latitude.
+    """
+
+    # work with the latitudes in the northern hemisphere
+    phi = -np.radians(lat)
+    phic = np.radians(71.0)
+
+    # the isometric latitude function - Pg. 161 Eq. 15-9
+    def tfn(phi: np.ndarray) -> np.ndarray:
+        esin = e * np.sin(phi)
+        return np.tan(np.pi / 4.0 - phi / 2.0) / np.power(
+            (1.0 - esin) / (1.0 + esin), e / 2.0
+        )
+
+    # and the radius of the parallel - Pg. 160 Eq. 14-15
+    def mfn(phi: np.ndarray) -> np.ndarray:
+        return np.cos(phi) / np.sqrt(1.0 - e * e * np.sin(phi) ** 2.0)
+
+    # compute the scale factor - this is undefined at the pole itself
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = mfn(phic) * tfn(phi) / (tfn(phic) * mfn(phi))
+
+    # and the limit at the pole - Pg. 161 Eq. 21-35
+    kp = (mfn(phic) / (2.0 * tfn(phic))) * np.sqrt(
+        np.power(1.0 + e, 1.0 + e) * np.power(1.0 - e, 1.0 - e)
+    )
+
+    return np.where(np.isclose(phi, np.pi / 2.0, rtol=0, atol=1e-12), kp, k)
+
+
+@instrument.timed("transform.xy_to_latlon")
 def xy_to_latlon(
-    x: np.ndarray, y: np.ndarray, lon0: float = 0.0
+    x: np.ndarray,
+    y: np.ndarray,
+    lon0: float = 0.0,
+    out: Optional[Tuple[np.ndarray, np.ndarray]] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     Convert an array of (x, y) in South Polar Stereographic Projection
@@ -154,6 +404,11 @@ def xy_to_latlon(
         Stereographic Projections - starting pg. 154. Numerical example on pg. 315
         All page and equation numbers refer to Snyder
 
+    The inputs can be non-contiguous views (i.e. columns of a structured
+    array) and are never copied. float32 inputs are computed in float32.
+    If `out` is given, the coordinates are written into `out` (which must
+    not overlap the inputs), otherwise masked inputs give masked outputs.
+
     Parameters
     ----------
     x: np.ndarray
@@ -162,6 +417,8 @@ def xy_to_latlon(
         A N-length Numpy array of y-coordinates of South Polar Stereographic
     lon0: float
         The longitude at true scale in degrees.
+    out: Optional[Tuple[np.ndarray, np.ndarray]]
+        The arrays to store the (lat, lon) coordinates in.
 
     Returns
     -------
@@ -169,10 +426,6 @@ def xy_to_latlon(
         The (lat, lon) coordinates in the degrees.
     """
 
-    # the reference uses -x and -y so inverte these here.
-    x = -x
-    y = -y
-
     # this is the true-scale latitude
     latc = np.radians(-71.0)
 
@@ -185,41 +438,69 @@ def xy_to_latlon(
     # and computed using 14-15 on Pg. 160
     m_c = np.cos(-latc) / np.sqrt(1.0 - e * e * np.power(np.sin(-latc), 2.0))
 
-    # compute r/rho
-    p = np.sqrt(x * x + y * y)
+    # the coefficients of the series solution to the latitude
+    series = [
+        (
+            2.0,
+            0.5 * (e ** 2)
+            + (5.0 / 24.0) * (e ** 4.0)
+            + (1.0 / 12.0) * (e ** 6.0)
+            + (13.0 / 360.0) * (e ** 8.0),
+        ),
+        (
+            4.0,
+            (7.0 / 48.0) * (e ** 4.0)
+            + (29.0 / 240.0) * (e ** 6.0)
+            + (811.0 / 11520.0) * (e ** 8.0),
+        ),
+        (6.0, (7.0 / 120.0) * (e ** 6.0) + (81.0 / 1120.0) * (e ** 8.0)),
+        (8.0, (4279.0 / 161280.0) * (e ** 8.0)),
+    ]
+
+    # the arrays that we compute into and a single work array
+    lat, lon = _outputs(x, y, out)
+    w = np.empty_like(lat)
+
+    # compute r/rho - the reference uses -x and -y but this doesn't change p
+    np.hypot(x, y, out=lon)
 
     # and compute t
-    t = p * t_c / (1e3 * a * m_c)
+    lon *= t_c / (1e3 * a * m_c)
 
     # there isn't an analytical solution to ps2ll - you can either use
     # an iterative or series solution - we use the series solution
-    chi = np.pi / 2.0 - 2 * np.arctan(t)
-
-    # the series solution to the latitude
-    lat = chi
-    lat += (
-        0.5 * (e ** 2)
-        + (5.0 / 24.0) * (e ** 4.0)
-        + (1.0 / 12.0) * (e ** 6.0)
-        + (13.0 / 360.0) * (e ** 8.0)
-    ) * np.sin(2 * chi)
-    lat += (
-        (7.0 / 48.0) * (e ** 4.0)
-        + (29.0 / 240.0) * (e ** 6.0)
-        + (811.0 / 11520.0) * (e ** 8.0)
-    ) * np.sin(4 * chi)
-    lat += ((7.0 / 120.0) * (e ** 6.0) + (81.0 / 1120.0) * (e ** 8.0)) * np.sin(6 * chi)
-    lat += ((4279.0 / 161280.0) * (e ** 8.0)) * np.sin(8 * chi)
-
-    # and the longitude
-    lon = lon0 + np.arctan2(x, -y)
-
-    # correct the signs
-    lat = -lat
-    lon = -lon
+    np.arctan(lon, out=lon)
+    lon *= -2.0
+    lon += np.pi / 2.0
+
+    # the series solution to the latitude - chi is stored in lon
+    lat[...] = lon
+    for k, coefficient in series:
+        np.multiply(lon, k, out=w)
+        np.sin(w, out=w)
+        w *= coefficient
+        lat += w
+
+    # correct the sign
+    np.negative(lat, out=lat)
+
+    # and the longitude - arctan2(-x, y) with the reference's -x and -y
+    # which is then negated to correct the sign
+    np.arctan2(x, y, out=lon)
+    lon -= lon0
 
     # and make sure the longitude is in -pi, pi
-    lon = np.mod(lon + np.pi, 2 * np.pi) - np.pi
+    lon += np.pi
+    np.mod(lon, 2 * np.pi, out=lon)
+    lon -= np.pi
+
+    # and convert into degrees
+    np.degrees(lat, out=lat)
+    np.degrees(lon, out=lon)
+
+    # masked inputs give masked outputs (unless we were given outputs)
+    mask = _input_mask(x, y) if out is None else None
+    if mask is not None:
+        return ma.masked_array(lat, mask), ma.masked_array(lon, mask.copy())
 
-    # stack these into one array and return as meters
-    return np.degrees(lat), np.degrees(lon)
+    return lat, lon
@@ -0,0 +1,167 @@
+"""
+Compute the visibility of the BEDMAP2 ice surface from an elevated observer.
+"""
+from functools import partial
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import numpy.ma as ma
+from cachetools import LRUCache, cached
+
+import bedmap2.data as data
+import bedmap2.geoid as geoid
+import bedmap2.transform as transform
+
+
+class Viewshed(NamedTuple):
+    """
+    The visibility of the surface around an observer.
+
+    `visible` is a boolean raster over the BEDMAP2 cells selected by
+    `window` (a pair of (row, column) slices into the full grid), so
+    `load_data("surface")[window]` has the same shape as `visible`.
+
+    `azimuth` is the angle (in degrees) of each radial ray measured
+    counter-clockwise from the +x axis of the South Polar Stereographic
+    Projection and `horizon` is the elevation angle (in degrees) of the
+    horizon seen by the observer along each ray.
+    """
+
+    visible: np.ndarray
+    window: Tuple[slice, slice]
+    azimuth: np.ndarray
+    horizon: np.ndarray
+
+
+@cached(cache=LRUCache(maxsize=16), key=partial(data.layer_hashkey, "surface"))
+def viewshed(
+    lat: float,
+    lon: float,
+    altitude: float,
+    radius: float = 200e3,
+    nazimuth: Optional[int] = None,
+    stepsize: float = 500.0,
+) -> Viewshed:
+    """
+    Compute the cells of the ice surface that are visible from an observer
+    at (`lat`, `lon`) at `altitude` meters relative to the GL04C geoid.
+
+    This uses a radial horizon algorithm: the surface is sampled along
+    `nazimuth` rays from the observer and a running maximum of the elevation
+    angle along each ray gives the horizon in front of every point. A cell
+    is visible if its own elevation angle is above the horizon of the
+    ray that it lies on. The curvature of the Earth is included by
+    dropping the surface by d^2 / 2R where R is given by `geoid.radius`.
+
+    The results of this function are cached for each observer position
+    (and version of the surface layer) so the returned arrays must not
+    be modified.
+
+    Parameters
+    ----------
+    lat: float
+        The latitude of the observer (in degrees).
+    lon: float
+        The longitude of the observer (in degrees).
+    altitude: float
+        The height of the observer (in meters) relative to the GL04C geoid.
+    radius: float
+        The maximum distance (in meters) from the observer to consider.
+    nazimuth: Optional[int]
+        The number of radial rays. Defaults to one ray per grid cell
+        at the edge of `radius`.
+    stepsize: float
+        The distance (in meters) between samples along each ray.
+
+    Returns
+    -------
+    viewshed: Viewshed
+        The visibility raster and horizon angles around the observer.
+    """
+
+    # get the location of the observer in polar stereographic
+    x0, y0 = (
+        float(v) for v in transform.latlon_to_xy(np.asarray(lat), np.asarray(lon))
+    )
+
+    # and the radius of the Earth underneath the observer
+    R = float(geoid.radius(np.asarray(lat)))
+
+    # by default, use rays that are at most one cell apart at `radius`
+    if nazimuth is None:
+        nazimuth = int(np.ceil(2.0 * np.pi * radius / 1e3))
+
+    # the angle of each ray and the distance of each sample along the ray
+    azimuth = np.linspace(0.0, 2.0 * np.pi, nazimuth, endpoint=False)
+    distance = np.arange(1, int(np.ceil(radius / stepsize)) + 1) * stepsize
+
+    # get the surface height at each sample along each ray
+    x = x0 + np.cos(azimuth)[:, None] * distance[None, :]
+    y = y0 + np.sin(azimuth)[:, None] * distance[None, :]
+    height = _surface(x, y)
+
+    # the slope of the line-of-sight to each sample including curvature
+    slope = (height - distance ** 2.0 / (2.0 * R) - altitude) / distance
+
+    # the horizon in front of (and including) every sample
+    horizon = np.maximum.accumulate(slope, axis=1)
+
+    # find the window of grid cells that lie within `radius`
+    (u0, u1), (v0, v1) = transform.xy_to_grid(
+        np.asarray([x0 - radius, x0 + radius]), np.asarray([y0 + radius, y0 - radius])
+    )
+    cols = slice(max(int(np.floor(u0)), 0), min(int(np.ceil(u1)), transform.ncols))
+    rows = slice(max(int(np.floor(v0)), 0), min(int(np.ceil(v1)), transform.nrows))
+
+    # the (x, y) location of the center of every cell in the window
+    xc, yc = transform.index_to_xy(
+        np.arange(cols.start, cols.stop), np.arange(rows.start, rows.stop)
+    )
+    dx, dy = xc[None, :] - x0, yc[:, None] - y0
+
+    # the distance and azimuth of each cell from the observer
+    dcell = np.hypot(dx, dy)
+    ray = np.rint(np.mod(np.arctan2(dy, dx), 2.0 * np.pi) * nazimuth / (2.0 * np.pi))
+    ray = ray.astype(np.intp) % nazimuth
+
+    # the index of the last sample strictly in front of each cell
+    before = np.floor(dcell / stepsize - 0.5).astype(np.intp) - 1
+
+    # the slope of the line-of-sight to each cell
+    surface = ma.filled(ma.masked_array(data.load_data("surface")[rows, cols]), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cslope = (surface - dcell ** 2.0 / (2.0 * R) - altitude) / dcell
+
+    # a cell is visible if it is above the horizon in front of it
+    blocking = np.where(
+        before >= 0,
+        horizon[ray, np.clip(before, 0, distance.size - 1)],
+        -np.inf,
+    )
+    visible = (cslope >= blocking) & (dcell <= radius)
+
+    # the observer can always see the cell that it is in
+    visible |= dcell < 0.5e3
+
+    # and we are done
+    return Viewshed(
+        visible,
+        (rows, cols),
+        np.degrees(azimuth),
+        np.degrees(np.arctan(horizon[:, -1])),
+    )
+
+
+def _surface(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Sample the surface height (in meters) at (x, y) treating
+    any missing data as sea level and clamping to the grid.
+    """
+
+    # convert to indices and clamp to the edge of the grid
+    ix, iy = transform.xy_to_index(x, y)
+    ix = np.clip(ix, 0, transform.ncols - 1)
+    iy = np.clip(iy, 0, transform.nrows - 1)
+
+    # and return the surface height at each location
+    return ma.filled(ma.masked_array(data.load_data("surface")[iy, ix]), 0.0)
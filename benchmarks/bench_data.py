@@ -0,0 +1,64 @@
+"""
+Benchmarks of loading and sampling the layers.
+"""
+import os
+import time
+
+import bedmap2.data as data
+
+from .common import random_latlon, use_synthetic
+
+
+class LoadData:
+    """
+    Time loading a layer from disk (cold) and from the cache (warm).
+    """
+
+    timeout = 600.0
+
+    def setup(self) -> None:
+        use_synthetic()
+        data.load_data.cache_clear()
+
+    def time_load_data_cold(self) -> None:
+        data.load_data.cache_clear()
+        data.load_data("bed")
+
+    def time_load_data_warm(self) -> None:
+        data.load_data("bed")
+
+    def peakmem_load_data(self) -> None:
+        data.load_data("bed")
+
+
+class Dataset:
+    """
+    Time sampling a layer at a varying number of points.
+    """
+
+    # 10^8 points needs several GB of memory so it is only run on request
+    params = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+    if os.environ.get("BEDMAP2_BENCH_LARGE"):
+        params.append(10 ** 8)
+    param_names = ["npoints"]
+    timeout = 600.0
+
+    def setup(self, n: int) -> None:
+        use_synthetic()
+        self.lat, self.lon = random_latlon(n)
+
+        # make sure the layer is loaded so we only time the sampling
+        data.load_data("bed")
+
+    def time_dataset(self, n: int) -> None:
+        data.dataset(self.lat, self.lon, "bed")
+
+    def peakmem_dataset(self, n: int) -> None:
+        data.dataset(self.lat, self.lon, "bed")
+
+    def track_dataset_throughput(self, n: int) -> float:
+        start = time.perf_counter()
+        data.dataset(self.lat, self.lon, "bed")
+        return n / (time.perf_counter() - start)
+
+    track_dataset_throughput.unit = "points/s"
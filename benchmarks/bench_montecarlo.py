@@ -0,0 +1,34 @@
+"""
+Benchmarks of drawing random points weighted by a layer.
+"""
+import time
+
+import bedmap2.montecarlo as montecarlo
+
+from .common import use_synthetic
+
+
+class RandomPoints:
+    """
+    Time drawing a varying number of points in proportion to the ice volume.
+    """
+
+    params = [10 ** 5, 10 ** 6, 10 ** 7]
+    param_names = ["npoints"]
+    timeout = 600.0
+
+    def setup(self, n: int) -> None:
+        use_synthetic()
+
+        # build the weight table so we only time the drawing
+        montecarlo.weight_table("thickness")
+
+    def time_random_points(self, n: int) -> None:
+        montecarlo.random_points(n, "thickness", seed=0)
+
+    def track_random_points_throughput(self, n: int) -> float:
+        start = time.perf_counter()
+        montecarlo.random_points(n, "thickness", seed=0)
+        return n / (time.perf_counter() - start)
+
+    track_random_points_throughput.unit = "points/s"
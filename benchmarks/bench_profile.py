@@ -0,0 +1,36 @@
+"""
+Benchmarks of the profile figures.
+"""
+import bedmap2.data as data
+import bedmap2.profile as profile
+
+from .common import use_synthetic
+
+
+class Profile:
+    """
+    Time producing a profile across the ice sheet.
+    """
+
+    timeout = 600.0
+
+    def setup(self) -> None:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        use_synthetic()
+
+        # make sure the layers are loaded so we only time the profile
+        for name in ("surface", "bed", "thickness"):
+            data.load_data(name)
+
+    def teardown(self) -> None:
+        import matplotlib.pyplot as plt
+
+        plt.close("all")
+
+    def time_flat_profile(self) -> None:
+        profile.flat_profile(-70.0, 0.0, -70.0, 180.0)
+
+    def time_curved_profile(self) -> None:
+        profile.curved_profile(-70.0, 0.0, -70.0, 180.0)
@@ -0,0 +1,42 @@
+"""
+Benchmarks of the coordinate transforms.
+"""
+import numpy as np
+
+import bedmap2.transform as transform
+
+from .common import random_latlon
+
+
+class Transform:
+    """
+    Time converting between (lat, lon), (x, y) and grid indices.
+    """
+
+    params = [10 ** 3, 10 ** 5, 10 ** 7]
+    param_names = ["npoints"]
+
+    def setup(self, n: int) -> None:
+        self.lat, self.lon = random_latlon(n)
+        self.x, self.y = np.asarray(transform.latlon_to_xy(self.lat, self.lon))
+
+    def time_latlon_to_xy(self, n: int) -> None:
+        transform.latlon_to_xy(self.lat, self.lon)
+
+    def time_xy_to_latlon(self, n: int) -> None:
+        transform.xy_to_latlon(self.x, self.y)
+
+    def time_xy_to_index(self, n: int) -> None:
+        transform.xy_to_index(self.x, self.y)
+
+    def peakmem_latlon_to_xy(self, n: int) -> None:
+        transform.latlon_to_xy(self.lat, self.lon)
+
+
+class Import:
+    """
+    Time importing bedmap2 in a fresh interpreter.
+    """
+
+    def timeraw_import(self) -> str:
+        return "import bedmap2, bedmap2.data, bedmap2.transform"
@@ -0,0 +1,44 @@
+"""
+Synthetic stand-in layers so the benchmarks run without downloading BEDMAP2.
+"""
+import os
+import sys
+import tempfile
+from os.path import abspath, dirname, join
+
+import numpy as np
+
+import bedmap2.data as data
+import bedmap2.downloader as downloader
+import bedmap2.transform as transform
+
+# the synthetic layers are shared with the tests and aren't part of the package
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "tests"))
+import synthetic  # noqa: E402 isort:skip
+
+# where we store the synthetic layers - these are reused between runs
+directory = os.environ.get(
+    "BEDMAP2_BENCH_DIR", join(tempfile.gettempdir(), "bedmap2-bench")
+)
+
+# the layers that the benchmarks use
+layers = ["surface", "bed", "thickness"]
+
+
+def use_synthetic() -> None:
+    """
+    Point bedmap2 at the synthetic layers, writing them if necessary.
+    """
+    if not all(downloader.data_exists(name, directory) for name in layers):
+        # int16 GeoTIFFs in the same format as BEDMAP2
+        synthetic.write_layers(directory, layers, dtype="int16")
+    data.bedmap_dir = directory
+
+
+def random_latlon(n: int, seed: int = 0) -> np.ndarray:
+    """
+    Draw `n` random points uniformly over the BEDMAP2 grid in (lat, lon).
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(1e3 * transform.psmin, 1e3 * transform.psmax, size=(2, n))
+    return np.stack(transform.xy_to_latlon(x, y))
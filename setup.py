@@ -26,14 +26,19 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Intended Audience :: Science/Research",
         "Topic :: Scientific/Engineering :: Physics",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
     ],
     keywords=["antarctica dem bedmap2 ice"],
     packages=["bedmap2"],
-    python_requires=">=3.6*, <4",
-    install_requires=["numpy", "rasterio", "cachetools", "wget", "matplotlib"],
+    python_requires=">=3.7, <4",
+    install_requires=[
+        "numpy",
+        "scipy",
+        "rasterio",
+        "cachetools",
+        "matplotlib>=3.5",
+    ],
     extras_require={
         "test": [
             "pytest",
@@ -44,8 +49,16 @@ setup(
             "pytest-cov",
             "flake8",
         ],
+        "bench": ["asv"],
     },
     scripts=[],
+    entry_points={
+        "console_scripts": [
+            "bedmap2-sample=bedmap2.cli:main",
+            "bedmap2-server=bedmap2.server:main",
+            "bedmap2-tiles=bedmap2.tiles:main",
+        ]
+    },
     project_urls={},
     include_package_data=True,
 )
@@ -0,0 +1,48 @@
+import sys
+from typing import Iterator
+
+import pytest
+from synthetic import write_layers
+
+import bedmap2.data as data
+
+
+@pytest.fixture(scope="session")
+def synthetic_dir(tmp_path_factory: pytest.TempPathFactory) -> str:
+    """
+    Write the synthetic layers into GeoTIFFs in a temporary directory.
+    """
+
+    # the directory where we store the synthetic layers
+    directory = tmp_path_factory.mktemp("bedmap2_tiff")
+
+    # write each layer with the same file names as BEDMAP2
+    write_layers(str(directory), compress="deflate")
+
+    return str(directory)
+
+
+def clear_caches() -> None:
+    """
+    Clear every in-memory cache in the bedmap2 package.
+    """
+    for name, module in list(sys.modules.items()):
+        if name.startswith("bedmap2"):
+            for value in vars(module).values():
+                if callable(getattr(value, "cache_clear", None)):
+                    value.cache_clear()
+
+
+@pytest.fixture
+def synthetic(synthetic_dir: str, monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    """
+    Load the synthetic layers instead of the BEDMAP2 dataset.
+    """
+
+    # point bedmap2 at the synthetic layers
+    monkeypatch.setattr(data, "bedmap_dir", synthetic_dir)
+
+    # make sure that nothing from the real dataset is cached
+    clear_caches()
+    yield synthetic_dir
+    clear_caches()
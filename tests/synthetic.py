@@ -0,0 +1,113 @@
+"""
+Synthetic stand-in layers so that bedmap2 can be tested and benchmarked
+without downloading the BEDMAP2 dataset.
+
+This lives with the tests rather than in the package - the benchmarks
+import it from here.
+"""
+import os
+from os.path import join
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bedmap2.downloader as downloader
+import bedmap2.transform as transform
+
+# the value used for nodata in the synthetic layers
+NODATA = -9999.0
+
+
+def synthetic_layers() -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Generate a simple synthetic stand-in for each BEDMAP2 layer.
+
+    The ice sheet is a parabolic dome of radius 2000 km centered on the pole
+    sitting on a bed that slopes downward away from the pole. The dome is
+    grounded inside 1500 km and floating beyond that. There is a rock
+    outcrop centered on (500, 500) km and a lake centered on (1000, -500) km.
+
+    Returns
+    -------
+    layers: Iterator[Tuple[str, np.ndarray]]
+        The name and (nrows, ncols) values of each layer.
+    """
+
+    # the (x, y) coordinates of every grid cell in km
+    x = np.linspace(transform.psmin + 0.5, transform.psmax - 0.5, transform.ncols)
+    x, y = np.meshgrid(x, -x)
+
+    # the distance of each cell from the pole (km)
+    r = np.hypot(x, y)
+
+    # the mask of the ice sheet and grounded ice
+    ice = r < 2000.0
+    grounded = r < 1500.0
+
+    # the surface of the dome and the bed below it
+    surface = np.where(
+        ice, 3000.0 * np.sqrt(np.clip(1.0 - (r / 2000.0) ** 2.0, 0, 1)), NODATA
+    )
+    bed = 500.0 - 0.5 * r
+
+    yield "surface", surface
+    yield "bed", bed
+    yield "thickness", np.where(ice, surface - bed, NODATA)
+    yield "icemask_grounded_and_shelves", np.where(
+        ice, np.where(grounded, 0, 1), NODATA
+    )
+    yield "rockmask", np.where(np.hypot(x - 500, y - 500) < 100, 0, NODATA)
+    yield "lakemask_vostok", np.where(np.hypot(x - 1000, y + 500) < 50, 1, NODATA)
+    yield "grounded_bed_uncertainty", np.where(ice, 100.0, NODATA)
+    yield "thickness_uncertainty_5km", np.where(ice, 100.0, NODATA)
+    yield "coverage", np.where(ice, 1, NODATA)
+    yield "gl04c_geiod_to_WGS84", np.full_like(r, -20.0)
+
+
+def write_layers(
+    directory: str,
+    layers: Optional[Sequence[str]] = None,
+    dtype: str = "float32",
+    compress: Optional[str] = None,
+) -> None:
+    """
+    Write a GeoTIFF for each synthetic layer with the same file names as BEDMAP2.
+
+    Each file is written atomically so that concurrent processes
+    never see a partially written layer.
+
+    Parameters
+    ----------
+    directory: str
+        The directory to write the layers into.
+    layers: Optional[Sequence[str]]
+        The names of the layers to write (default: every layer).
+    dtype: str
+        The data type of the GeoTIFFs.
+    compress: Optional[str]
+        The GDAL compression of the GeoTIFFs (default: uncompressed).
+    """
+    # rasterio (and GDAL) are slow to import so only import them when needed
+    import rasterio
+
+    os.makedirs(directory, exist_ok=True)
+    for name, values in synthetic_layers():
+        if layers is not None and name not in layers:
+            continue
+
+        # write into a temporary file and atomically move into place
+        filename = join(directory, downloader.layer_filename(name))
+        options = {} if compress is None else {"compress": compress}
+        with rasterio.open(
+            f"{filename}.tmp",
+            "w",
+            driver="GTiff",
+            width=transform.ncols,
+            height=transform.nrows,
+            count=1,
+            dtype=dtype,
+            nodata=NODATA,
+            **options,
+        ) as dataset:
+            dataset.write(values.astype(dtype), 1)
+        os.replace(f"{filename}.tmp", filename)
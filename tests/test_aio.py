@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.aio as aio
+import bedmap2.data as data
+
+
+def test_asample(synthetic: str) -> None:
+    """
+    Check that concurrent asynchronous requests are coalesced.
+    """
+
+    # some random requests of different sizes
+    points = [np.random.uniform(-3e6, 3e6, size=(2, n)) for n in range(1, 51)]
+
+    async def run() -> list:
+        # make sure the layers are loaded without blocking
+        await aio.aload("bed")
+
+        # sample all the requests concurrently
+        return await asyncio.gather(
+            *(bedmap2.asample(x, y, ["bed", "surface"], mode="xy") for x, y in points)
+        )
+
+    # run the requests
+    results = asyncio.run(run())
+
+    # and check each request against the synchronous interface
+    for (x, y), values in zip(points, results):
+        expected = data.sample(x, y, ["bed", "surface"], mode="xy")
+        for name in ("bed", "surface"):
+            np.testing.assert_array_equal(values[name], expected[name])
+            np.testing.assert_array_equal(
+                values[name].mask, np.ma.getmaskarray(expected[name])
+            )
+
+    # the requests should have been coalesced into a single batch
+    async def batches() -> tuple:
+        coalescer = aio.Coalescer(window=0.05)
+        await asyncio.gather(
+            *(coalescer.sample(x, y, ["bed"], mode="xy") for x, y in points)
+        )
+        return coalescer.batches, coalescer.requests
+
+    assert asyncio.run(batches()) == (1, len(points))
+
+
+def test_aload_coalesced(synthetic: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Check that batches that need the same layer at the same time load it once.
+    """
+
+    # count the (slow) loads of each layer from its file
+    loads: list = []
+    load_layer = data.load_layer
+
+    def counted(name: str) -> np.ma.masked_array:
+        loads.append(name)
+        return load_layer(name)
+
+    monkeypatch.setattr(data, "load_layer", counted)
+
+    # batches with different keys that both need the bed
+    async def run() -> list:
+        coalescer = aio.Coalescer(window=0.0)
+        return await asyncio.gather(
+            coalescer.sample(np.zeros(1), np.zeros(1), ["bed"], mode="xy"),
+            coalescer.sample(np.zeros(1), np.zeros(1), ["bed", "surface"], mode="xy"),
+            *(aio.aload("bed") for _ in range(4)),
+        )
+
+    asyncio.run(run())
+    assert sorted(loads) == ["bed", "surface"]
@@ -34,5 +34,5 @@ def test_values() -> None:
     x, y = bedmap2.transform.latlon_to_xy(lat, lon)
 
     # check that x and y match
-    np.testing.assert_allclose(np.asarray(x, dtype=np.int), data[:, 2], rtol=0.6e-2)
-    np.testing.assert_allclose(np.asarray(y, dtype=np.int), data[:, 3], rtol=0.6e-2)
+    np.testing.assert_allclose(np.asarray(x, dtype=np.intp), data[:, 2], rtol=0.6e-2)
+    np.testing.assert_allclose(np.asarray(y, dtype=np.intp), data[:, 3], rtol=0.6e-2)
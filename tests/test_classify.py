@@ -0,0 +1,40 @@
+import numpy as np
+
+import bedmap2
+import bedmap2.data as data
+
+
+def test_classify(synthetic: str) -> None:
+    """
+    Check the classification of the synthetic ice sheet.
+    """
+
+    # points on grounded ice, a shelf, the ocean, rock and the lake
+    x = np.asarray([0.0, 1800e3, 2500e3, 500e3, 1000e3])
+    y = np.asarray([0.0, 0.0, 0.0, 500e3, -500e3])
+
+    # classify each of the points
+    classes = bedmap2.classify(x, y, mode="xy")
+    assert classes.dtype == np.uint8
+
+    # and check each of the flags
+    np.testing.assert_array_equal(
+        classes,
+        [
+            data.GROUNDED,
+            data.FLOATING,
+            data.OCEAN,
+            data.GROUNDED | data.ROCK,
+            data.GROUNDED | data.VOSTOK,
+        ],
+    )
+
+    # and the layer should also be available through dataset
+    np.testing.assert_array_equal(
+        data.dataset(x, y, "classification", mode="xy"), classes
+    )
+
+    # the classification is memoized and its source layers aren't kept in memory
+    assert data.load_classification() is data.load_classification()
+    for name in data.classification_layers:
+        assert data.load_data.cache_key(name) not in data.load_data.cache
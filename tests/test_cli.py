@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import bedmap2.cli as cli
+import bedmap2.data as data
+
+
+def test_sample_cli(synthetic: str, tmp_path) -> None:
+    """
+    Sample layers at the coordinates in CSV and NPY files.
+    """
+
+    # some random points across the synthetic ice sheet
+    N = 1000
+    xy = np.random.uniform(-3e6, 3e6, size=(N, 2))
+
+    # the expected values of each layer
+    expected = data.sample(xy[:, 0], xy[:, 1], ["bed", "surface"], mode="xy")
+
+    # write the points to a CSV file with a header and an extra column
+    np.savetxt(
+        tmp_path / "points.csv",
+        np.column_stack((np.arange(N), xy)),
+        delimiter=",",
+        header="id,x,y",
+    )
+
+    # sample from CSV into NPY using multiple chunks and workers
+    assert (
+        cli.main(
+            [
+                str(tmp_path / "points.csv"),
+                str(tmp_path / "values.npy"),
+                *("--layers", "bed", "surface"),
+                *("--mode", "xy", "--columns", "1", "2", "--skiprows", "1"),
+                *("--chunksize", "128", "--workers", "2", "--quiet"),
+            ]
+        )
+        == 0
+    )
+
+    # and check the values
+    values = np.load(tmp_path / "values.npy")
+    np.testing.assert_allclose(values[:, :2], xy)
+    np.testing.assert_allclose(values[:, 2], expected["bed"].filled(np.nan))
+    np.testing.assert_allclose(values[:, 3], expected["surface"].filled(np.nan))
+
+    # and sample from NPY into CSV
+    np.save(tmp_path / "points.npy", xy)
+    cli.main(
+        [
+            str(tmp_path / "points.npy"),
+            str(tmp_path / "values.csv"),
+            *("-l", "surface", "-m", "xy", "--chunksize", "300", "-q"),
+        ]
+    )
+    values = np.loadtxt(tmp_path / "values.csv", delimiter=",", skiprows=1)
+    np.testing.assert_allclose(
+        values[:, 2], expected["surface"].filled(np.nan), rtol=1e-9
+    )
+
+    # comments and blank lines are skipped like np.loadtxt
+    with open(tmp_path / "comments.csv", "w") as f:
+        f.write("x,y\n# a comment\n1.0,2.0\n\n3.0,4.0  # trailing\n")
+    assert cli.count_rows(str(tmp_path / "comments.csv"), "csv", skiprows=1) == 2
+    chunks = list(
+        cli.read_chunks(str(tmp_path / "comments.csv"), "csv", [0, 1], 1, skiprows=1)
+    )
+    np.testing.assert_array_equal(np.concatenate(chunks), [[1.0, 2.0], [3.0, 4.0]])
+
+    # and a NPY output must be filled completely
+    writer = cli.Writer(str(tmp_path / "short.npy"), "npy", ["x", "y"], 3)
+    writer.write(np.zeros((2, 2)))
+    with pytest.raises(ValueError):
+        writer.close()
@@ -0,0 +1,76 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.contouring as contouring
+import bedmap2.data as data
+import bedmap2.transform as transform
+
+
+def test_contours(synthetic: str, tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Extract contours and feature boundaries from the synthetic ice sheet.
+    """
+
+    # the synthetic surface is 1500 m high at this radius (in m)
+    radius = 2000e3 * np.sqrt(0.75)
+
+    # the surface contour is a single closed circle
+    (contour,) = bedmap2.contours("surface", 1500.0)
+    assert contour.closed and contour.level == 1500.0
+    np.testing.assert_allclose(np.hypot(contour.x, contour.y), radius, atol=1.5e3)
+
+    # and its (lat, lon) are consistent with its (x, y)
+    x, y = transform.latlon_to_xy(contour.lat, contour.lon)
+    np.testing.assert_allclose(x, contour.x, atol=1.0)
+    np.testing.assert_allclose(y, contour.y, atol=1.0)
+
+    # the contours are cached on disk
+    key = data.cache_key("surface")
+    assert os.path.exists(os.path.join(data.cache_dir(), f"contours_{key}_1500.0.npy"))
+
+    # we can extract the grounding line and the ice front at once
+    lines = bedmap2.contours("grounding_line", 0.5) + bedmap2.contours("ice_edge", 0.5)
+    assert len(lines) == 2 and all(line.closed for line in lines)
+    np.testing.assert_allclose(np.hypot(lines[0].x, lines[0].y), 1500e3, atol=1.5e3)
+    np.testing.assert_allclose(np.hypot(lines[1].x, lines[1].y), 2000e3, atol=1.5e3)
+
+    # several levels in a window give open contours inside the window
+    window = (0.0, 2500e3, 0.0, 2500e3)
+    levels = [1000.0, 2000.0]
+    lines = bedmap2.contours("surface", levels, window=window)
+    assert [line.level for line in lines] == levels
+    for line in lines:
+        assert not line.closed
+        assert np.all((line.x > -1.5e3) & (line.y > -1.5e3))
+
+    # and trace matches the contours from matplotlib on a random field
+    z = np.random.default_rng(0).normal(size=(100, 120))
+    polylines = contouring.trace(z, 0.1)
+    reference = plt.contour(z, [0.1]).allsegs[0]
+    plt.close()
+    assert len(polylines) == len(reference)
+    assert sum(map(len, polylines)) == sum(map(len, reference))
+
+    # where every open polyline ends on the edge of the grid
+    for line in polylines:
+        if np.any(line[0] != line[-1]):
+            for col, row in (line[0], line[-1]):
+                assert col in (0, 119) or row in (0, 99)
+
+    # and the cached contours follow a layer when it is registered again
+    monkeypatch.setattr(data, "sources", {})
+    grid = transform.Grid(-1000e3, 1000e3, 5e3, 400, 400)
+    ix, iy = np.meshgrid(np.arange(grid.ncols), np.arange(grid.nrows))
+    for radius in (100.0, 200.0):
+        disk = np.where(np.hypot(ix - 199.5, iy - 199.5) < radius / 5, 1.0, 0.0)
+        np.save(tmp_path / f"{radius}.npy", disk)
+        data.register_layer("disk", str(tmp_path / f"{radius}.npy"), grid=grid)
+        (contour,) = bedmap2.contours("disk", 0.5)
+        np.testing.assert_allclose(
+            np.hypot(contour.x, contour.y), 1e3 * radius, atol=5e3
+        )
+        data.unregister_layer("disk")
@@ -0,0 +1,32 @@
+import numpy as np
+
+import bedmap2
+import bedmap2.data as data
+
+
+def test_dataset_out(synthetic: str) -> None:
+    """
+    Sample layers into caller-supplied buffers.
+    """
+
+    # the coordinates as the columns of a structured array
+    N = 10_000
+    points = np.zeros(N, dtype=[("lat", "f4"), ("lon", "f4"), ("z", "i4")])
+    points["lat"] = np.random.uniform(-60.0, -90.0, size=N)
+    points["lon"] = np.random.uniform(-180.0, 180.0, size=N)
+    expected = data.dataset(points["lat"], points["lon"], "surface")
+    assert np.ma.getmaskarray(expected).any()
+
+    # sample into a masked array - the same buffer is reused
+    out = np.ma.masked_array(np.empty(N, dtype=np.float32))
+    for i in range(2):
+        values = bedmap2.surface(points["lat"], points["lon"], out=out)
+        assert values is out
+        np.testing.assert_array_equal(out.mask, np.ma.getmaskarray(expected))
+        np.testing.assert_array_equal(out.compressed(), expected.compressed())
+
+    # and into a plain float64 array - masked values are NaN
+    out = np.empty(N)
+    data.dataset(points["lat"], points["lon"], "surface", out=out)
+    np.testing.assert_array_equal(np.isnan(out), np.ma.getmaskarray(expected))
+    np.testing.assert_array_equal(out[~np.isnan(out)], expected.compressed())
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+
+
+def test_distance(synthetic: str) -> None:
+    """
+    Check the distance fields of the synthetic ice sheet.
+    """
+
+    # some points along the x-axis at 1000, 1800, and 2500 km
+    x = np.asarray([1000e3, 1800e3, 2500e3])
+    y = np.zeros_like(x)
+
+    # the grounding line is at 1500 km and the ice edge is at 2000 km
+    np.testing.assert_allclose(
+        data.dataset(x, y, "signed_distance_to_grounding_line", mode="xy"),
+        [-500e3, 300e3, 1000e3],
+        atol=2e3,
+    )
+    np.testing.assert_allclose(
+        data.dataset(x, y, "distance_to_ice_edge", mode="xy"),
+        [1000e3, 200e3, 500e3],
+        atol=2e3,
+    )
+
+    # the distance fields should be cached on disk
+    key = data.cache_key("ice_edge")
+    assert os.path.exists(
+        os.path.join(data.cache_dir(), f"signed_distance_to_{key}.npy")
+    )
+
+    # under a key that changes when the source layer is replaced
+    path = data.layer_path("icemask_grounded_and_shelves")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    try:
+        assert data.cache_key("ice_edge") != key
+        assert data.cache_key("distance_to_ice_edge") != key
+    finally:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert data.cache_key("ice_edge") == key
+
+    # a failed build doesn't leave a temporary file in the cache
+    def fail() -> np.ndarray:
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        data.load_cached("failed.npy", fail)
+    assert not [f for f in os.listdir(data.cache_dir()) if f.startswith("failed")]
+
+    # the rock outcrop is a 100 km disk centered on (500, 500) km
+    xr, yr = bedmap2.nearest_feature(
+        np.asarray([500e3, 500e3]), np.asarray([1000e3, 500e3]), "rock", mode="xy"
+    )
+    np.testing.assert_allclose(xr, [500e3, 500e3], atol=2e3)
+    np.testing.assert_allclose(yr, [600e3, 500e3], atol=2e3)
+    np.testing.assert_allclose(
+        data.dataset(500e3, 1000e3, "distance_to_rock", mode="xy"), 400e3, atol=2e3
+    )
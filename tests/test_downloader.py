@@ -0,0 +1,117 @@
+import hashlib
+import http.server
+import io
+import os
+import threading
+import zipfile
+from typing import List
+
+import pytest
+
+import bedmap2.downloader as downloader
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve a single payload with support for range requests, failing
+    each range listed in `fail` the first time it is requested.
+    """
+
+    payload = b""
+    requests: List[str] = []
+    fail: List[str] = []
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        span = self.headers.get("Range", "")
+        self.requests.append(span)
+
+        # simulate a dropped connection
+        if span in self.fail:
+            self.fail.remove(span)
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        first, last = map(int, span.replace("bytes=", "").split("-"))
+        stop = last + 1
+        body = self.payload[first:stop]
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def test_download(tmp_path) -> None:
+    """
+    Resume an interrupted download and extract the archive.
+    """
+
+    # build a zip archive with a few members
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for i in range(3):
+            zf.writestr(f"bedmap2_tiff/member{i}.tif", os.urandom(100_000))
+    payload = buffer.getvalue()
+    sha256 = hashlib.sha256(payload).hexdigest()
+
+    # start a local server for the archive
+    chunksize = 16_384
+    RangeHandler.payload = payload
+    RangeHandler.fail = [f"bytes={3 * chunksize}-{4 * chunksize - 1}"]
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/bedmap2_tiff.zip"
+    filename = str(tmp_path / "bedmap2_tiff.zip")
+
+    try:
+        # the first attempt fails on one chunk and leaves a partial download
+        with pytest.raises(IOError):
+            downloader.download(url, filename, sha256, chunksize=chunksize, retries=0)
+        assert not os.path.exists(filename)
+        assert os.path.exists(f"{filename}.part")
+
+        # the second attempt only downloads the missing chunks
+        RangeHandler.requests.clear()
+        downloader.download(url, filename, sha256, chunksize=chunksize, retries=0)
+        assert len(RangeHandler.requests) < len(payload) // chunksize
+        with open(filename, "rb") as f:
+            assert f.read() == payload
+        assert not os.path.exists(f"{filename}.part")
+
+        # a wrong checksum is rejected
+        with pytest.raises(ValueError):
+            downloader.download(url, f"{filename}.bad", "0" * 64, chunksize=chunksize)
+        assert not os.path.exists(f"{filename}.bad")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # extract the archive and check that existing members are skipped
+    downloader.extract(filename, str(tmp_path))
+    member = tmp_path / "bedmap2_tiff" / "member0.tif"
+    mtime = member.stat().st_mtime_ns
+    (tmp_path / "bedmap2_tiff" / "member1.tif").unlink()
+    downloader.extract(filename, str(tmp_path))
+    assert member.stat().st_mtime_ns == mtime
+    assert (tmp_path / "bedmap2_tiff" / "member1.tif").exists()
+
+
+def test_download_checksum(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    The archive isn't downloaded if its checksum isn't available.
+    """
+    monkeypatch.setattr(downloader, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(downloader, "BEDMAP2_SHA256", None)
+    monkeypatch.setattr(downloader, "BEDMAP2_SHA256_URL", "http://127.0.0.1:9/x")
+    with pytest.raises(IOError):
+        downloader.download_archive()
+    assert os.listdir(tmp_path) == []
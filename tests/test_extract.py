@@ -0,0 +1,100 @@
+import os
+import zipfile
+
+import numpy as np
+import pytest
+import rasterio
+from conftest import clear_caches
+from synthetic import NODATA
+
+import bedmap2.data as data
+import bedmap2.downloader as downloader
+
+
+def test_extract_layer(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Extract and convert single layers from the BEDMAP2 archive on demand.
+    """
+
+    # write a small archive with the same layout as BEDMAP2
+    rng = np.random.default_rng(0)
+    layers = {}
+    with zipfile.ZipFile(tmp_path / "bedmap2_tiff.zip", "w") as zf:
+        for name in ("bed", "surface", "thickness"):
+            layer = rng.normal(size=(600, 500)).astype(np.float32)
+            layer[rng.random(layer.shape) < 0.1] = NODATA
+            layers[name] = layer
+            filename = tmp_path / downloader.layer_filename(name)
+            with rasterio.open(
+                filename,
+                "w",
+                driver="GTiff",
+                width=layer.shape[1],
+                height=layer.shape[0],
+                count=1,
+                dtype="float32",
+                nodata=NODATA,
+            ) as dataset:
+                dataset.write(layer, 1)
+            zf.write(filename, f"bedmap2_tiff/{filename.name}")
+            filename.unlink()
+
+    # point bedmap2 at the archive and an empty data directory
+    directory = str(tmp_path / "bedmap2_tiff")
+    monkeypatch.setattr(downloader, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(data, "bedmap_dir", directory)
+    clear_caches()
+
+    try:
+        # loading a layer only extracts that layer
+        bed = data.load_data("bed")
+        extracted = os.listdir(directory)
+        assert extracted == ["bedmap2_bed.tif"]
+        np.testing.assert_array_equal(bed.mask, layers["bed"] == NODATA)
+        np.testing.assert_array_equal(bed.compressed(), layers["bed"][~bed.mask])
+
+        # and layers can be converted straight into NPY files
+        monkeypatch.setattr(data, "layer_format", "npy")
+        surface = data.load_data("surface")
+        assert not downloader.data_exists("thickness", directory)
+        assert not os.path.exists(os.path.join(directory, "bedmap2_surface.tif"))
+        assert isinstance(surface.data, np.memmap)
+        np.testing.assert_array_equal(surface.mask, layers["surface"] == NODATA)
+        np.testing.assert_array_equal(
+            surface.compressed(), layers["surface"][~surface.mask]
+        )
+    finally:
+        clear_caches()
+
+
+def test_extract_corrupted(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Corrupted layers are rejected without leaving a partial file behind.
+    """
+
+    # an uncompressed archive with a single layer
+    filename = tmp_path / downloader.layer_filename("bed")
+    with rasterio.open(
+        filename, "w", driver="GTiff", width=50, height=40, count=1, dtype="float32"
+    ) as dataset:
+        dataset.write(np.ones((40, 50), dtype=np.float32), 1)
+    with zipfile.ZipFile(tmp_path / "bedmap2_tiff.zip", "w") as zf:
+        zf.write(filename, f"bedmap2_tiff/{filename.name}")
+        info = zf.infolist()[0]
+    filename.unlink()
+
+    # flip a byte in the middle of the stored member
+    with open(tmp_path / "bedmap2_tiff.zip", "r+b") as f:
+        offset = info.header_offset + 30 + len(info.filename) + info.file_size // 2
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    # both extracting and converting the layer check its CRC
+    directory = str(tmp_path / "bedmap2_tiff")
+    monkeypatch.setattr(downloader, "DATA_DIR", str(tmp_path))
+    for convert in (False, True):
+        with pytest.raises(ValueError):
+            downloader.extract_layer("bed", directory, convert=convert)
+        assert os.listdir(directory) == []
@@ -0,0 +1,44 @@
+import numpy as np
+import numpy.ma as ma
+
+import bedmap2.data as data
+import bedmap2.transform as transform
+
+
+def test_footprint(synthetic: str) -> None:
+    """
+    Average layers over a footprint with summed-area tables.
+    """
+
+    # random cells - including near the edge of the ice and of the grid
+    rng = np.random.default_rng(2)
+    ix = np.concatenate([rng.integers(0, transform.ncols, 200), [0, 6666, 3333]])
+    iy = np.concatenate([rng.integers(0, transform.nrows, 200), [0, 6666, 1333]])
+    x, y = transform.index_to_xy(ix, iy)
+
+    # compare against averaging each box directly
+    surface = data.load_data("surface")
+    for footprint in (0.0, 3e3, 10e3):
+        h = int(round(footprint / 1e3))
+        values = data.dataset(x, y, "surface", mode="xy", footprint=footprint)
+        for i in range(ix.size):
+            rows = slice(max(iy[i] - h, 0), iy[i] + h + 1)
+            cols = slice(max(ix[i] - h, 0), ix[i] + h + 1)
+            box = surface[rows, cols]
+            if box.count() == 0:
+                assert values[i] is ma.masked
+            else:
+                np.testing.assert_allclose(values[i], box.mean(dtype=float), rtol=1e-6)
+
+    # with no footprint we get the values of the cells themselves
+    np.testing.assert_allclose(
+        data.dataset(x, y, "surface", mode="xy", footprint=0.0),
+        data.dataset(x, y, "surface", mode="xy"),
+    )
+
+    # and we can store the averages in a buffer
+    out = np.empty(ix.size)
+    data.dataset(x, y, "surface", mode="xy", footprint=3e3, out=out)
+    expected = data.dataset(x, y, "surface", mode="xy", footprint=3e3)
+    np.testing.assert_array_equal(np.isnan(out), ma.getmaskarray(expected))
+    np.testing.assert_array_equal(out[~np.isnan(out)], expected.compressed())
@@ -0,0 +1,59 @@
+import numpy as np
+
+import bedmap2.geoid as geoid
+import bedmap2.transform as transform
+
+
+def test_ecef() -> None:
+    """
+    Check that the ECEF conversions are self-consistent and
+    agree with the geocentric radius.
+    """
+
+    # the number of elements we try
+    N = 10_000
+
+    # generate lat, lon, height triplets
+    lat = np.random.uniform(-90.0, -60.0, size=N)
+    lon = np.random.uniform(-180.0, 180.0, size=N)
+    height = np.random.uniform(-5e3, 1e5, size=N)
+
+    # convert them to ECEF
+    X, Y, Z = geoid.geodetic_to_ecef(lat, lon, height)
+
+    # on the ellipsoid, the distance from the center is the geocentric radius
+    R = np.sqrt(np.sum(np.square(geoid.geodetic_to_ecef(lat, lon)), axis=0))
+    np.testing.assert_allclose(R, geoid.radius(lat), rtol=1e-6)
+
+    # convert them back into user-supplied buffers
+    out = (np.empty(N), np.empty(N), np.empty(N))
+    latc, lonc, heightc = geoid.ecef_to_geodetic(X, Y, Z, out=out)
+    assert latc is out[0]
+
+    # and make sure they match
+    np.testing.assert_allclose(latc, lat, atol=1e-9)
+    np.testing.assert_allclose(lonc, lon, atol=1e-9)
+    np.testing.assert_allclose(heightc, height, atol=1e-4)
+
+
+def test_grids() -> None:
+    """
+    Check the cached radius grid against the per-point radius.
+    """
+
+    # get the radius of every cell - this is cached
+    R = geoid.radius_grid()
+    assert R is geoid.radius_grid()
+    assert R.shape == (transform.nrows, transform.ncols)
+
+    # pick some random cells and compare against direct computation
+    ix = np.random.randint(0, transform.ncols, size=100)
+    iy = np.random.randint(0, transform.nrows, size=100)
+    lat, _ = transform.xy_to_latlon(*transform.index_to_xy(ix, iy))
+    np.testing.assert_allclose(R[iy, ix], geoid.radius(lat))
+
+    # and the cells of the grid should be at the expected latitudes
+    glat, _ = geoid.latlon_grid()
+    np.testing.assert_allclose(glat[iy, ix], lat)
+    geoid.latlon_grid.cache_clear()
+    geoid.radius_grid.cache_clear()
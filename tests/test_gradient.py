@@ -0,0 +1,60 @@
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.transform as transform
+
+
+def test_gradient(synthetic: str, tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Check the gradient layers of the synthetic bed and surface.
+    """
+
+    # some random cells across the synthetic ice sheet - at least 100 km from
+    # the apex of the bed at the pole where the differences are inaccurate
+    rng = np.random.default_rng(29)
+    x, y = transform.index_to_xy(*rng.integers(1500, 5000, size=(2, 1000)))
+    r = np.hypot(x, y)
+    x, y, r = x[r > 100e3], y[r > 100e3], r[r > 100e3]
+
+    # the synthetic bed slopes down away from the pole at 0.5 m/km
+    np.testing.assert_allclose(
+        bedmap2.data.dataset(x, y, "bed_dx", mode="xy"), -5e-4 * x / r, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        bedmap2.data.dataset(x, y, "bed_dy", mode="xy"), -5e-4 * y / r, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        data.dataset(x, y, "bed_slope", mode="xy"),
+        np.degrees(np.arctan(5e-4)),
+        rtol=1e-3,
+    )
+
+    # and the downslope direction points away from the pole
+    aspect = data.dataset(x, y, "bed_aspect", mode="xy")
+    delta = np.mod(aspect - np.degrees(np.arctan2(y, x)) + 180.0, 360.0) - 180.0
+    np.testing.assert_allclose(delta, 0.0, atol=1.0)
+
+    # the normal vector tilts away from the pole
+    nx, ny, nz = bedmap2.normal(x, y, name="bed", mode="xy")
+    np.testing.assert_allclose(nx * nx + ny * ny + nz * nz, 1.0)
+    np.testing.assert_allclose(nx, 5e-4 * x / r, atol=1e-5)
+
+    # the gradient is defined everywhere that the surface is defined
+    surface = data.load_data("surface")
+    dzdx, dzdy = data.load_gradient("surface")
+    np.testing.assert_array_equal(ma.getmaskarray(dzdx), ma.getmaskarray(surface))
+    np.testing.assert_array_equal(ma.getmaskarray(dzdy), ma.getmaskarray(surface))
+
+    # the gradient of a layer follows the layer when it is registered again
+    monkeypatch.setattr(data, "sources", {})
+    grid = transform.Grid(-1000e3, 1000e3, 5e3, 400, 400)
+    for slope in (1.0, 2.0):
+        ramp = np.tile(slope * np.arange(grid.ncols, dtype=float), (grid.nrows, 1))
+        np.save(tmp_path / f"{slope}.npy", ramp)
+        data.register_layer("ramp", str(tmp_path / f"{slope}.npy"), grid=grid)
+        dzdx, _ = data.load_gradient("ramp")
+        np.testing.assert_allclose(dzdx, 1e-3 * slope)
+        data.unregister_layer("ramp")
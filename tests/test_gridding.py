@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.transform as transform
+
+
+def test_grid_points(synthetic: str) -> None:
+    """
+    Bin scattered observations onto the grid.
+    """
+
+    # many observations in a few cells - and some off the grid
+    rng = np.random.default_rng(1)
+    ix, iy = rng.integers(3000, 3010, size=(2, 20_000))
+    x, y = transform.index_to_xy(ix, iy)
+    x += rng.uniform(-400, 400, size=x.size)
+    y += rng.uniform(-400, 400, size=y.size)
+    values = rng.normal(1000.0, 10.0, size=x.size)
+    x[:10] = 1e8
+    values[10:20] = np.nan
+
+    # the expected statistics in each cell
+    valid = np.arange(x.size) >= 20
+    cells = iy[valid] * transform.ncols + ix[valid]
+    unique, inverse = np.unique(cells, return_inverse=True)
+    count = np.bincount(inverse)
+    mean = np.bincount(inverse, values[valid]) / count
+    std = np.sqrt(np.bincount(inverse, values[valid] ** 2) / count - mean ** 2)
+
+    # bin them into dense and sparse grids over several chunks
+    stats = ["count", "sum", "mean", "min", "max", "std"]
+    dense = bedmap2.grid_points(
+        x, y, values, stats, mode="xy", layer="bed", chunksize=3000
+    )
+    sparse = bedmap2.grid_points(
+        x, y, values, stats, mode="xy", layer="bed", sparse=True, chunksize=7000
+    )
+
+    # check the sparse grids
+    np.testing.assert_array_equal(sparse["iy"] * transform.ncols + sparse["ix"], unique)
+    np.testing.assert_array_equal(sparse["count"], count)
+    np.testing.assert_allclose(sparse["mean"], mean)
+    np.testing.assert_allclose(sparse["sum"], mean * count)
+    np.testing.assert_allclose(sparse["std"], std, rtol=1e-6)
+    np.testing.assert_array_equal(
+        sparse["max"], [values[valid][inverse == i].max() for i in range(unique.size)]
+    )
+    bed = data.load_data("bed")[sparse["iy"], sparse["ix"]]
+    np.testing.assert_allclose(sparse["residual"], mean - bed)
+
+    # and that the dense grids match
+    assert dense["count"].sum() == valid.sum()
+    assert dense["mean"].count() == unique.size
+    for stat in stats + ["residual"]:
+        np.testing.assert_allclose(
+            dense[stat][sparse["iy"], sparse["ix"]], sparse[stat], rtol=1e-9
+        )
+
+    with pytest.raises(ValueError):
+        bedmap2.grid_points(x, y, values, ["median"], mode="xy")
+
+    # a subset of the statistics only needs some of the accumulators
+    subset = bedmap2.grid_points(x, y, values, ["count", "max"], mode="xy")
+    assert sorted(subset) == ["count", "max"]
+    np.testing.assert_array_equal(subset["max"], dense["max"])
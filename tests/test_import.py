@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+# the heavy dependencies that must only be imported when they are used
+heavy = ["rasterio", "scipy", "matplotlib", "asyncio", "urllib.request"]
+
+
+def test_import() -> None:
+    """
+    Check that importing bedmap2 doesn't import any heavy dependencies.
+    """
+
+    # import bedmap2 in a fresh interpreter and report what was imported
+    script = (
+        "import sys; "
+        "import bedmap2, bedmap2.data, bedmap2.transform, bedmap2.profile; "
+        f"print(*[m for m in {heavy!r} if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+
+    # check that nothing heavy was imported
+    assert output.split() == []
+
+    # and the public functions are still available
+    import bedmap2
+
+    assert callable(bedmap2.sample)
+    assert "viewshed" in dir(bedmap2)
@@ -0,0 +1,59 @@
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.instrument as instrument
+import bedmap2.transform as transform
+
+
+def test_instrument(synthetic: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Record the timings and counters of the hot paths.
+    """
+
+    # enable instrumentation with a hook that records every measurement
+    monkeypatch.setattr(instrument, "enabled", True)
+    events: List[Tuple[str, str, float]] = []
+    instrument.add_hook(lambda *event: events.append(event))
+    instrument.reset()
+
+    try:
+        # load a layer and sample it twice
+        lat = np.random.uniform(-90, -60, size=1000)
+        lon = np.random.uniform(-180, 180, size=1000)
+        data.dataset(lat, lon, "bed")
+        data.sample(lat, lon, ["bed", "surface"])
+
+        stats = bedmap2.stats()
+        assert stats["enabled"]
+
+        # check that each stage was timed
+        for name in ("load_data.decode", "transform.latlon_to_xy", "data.gather"):
+            assert stats["timings"][name]["calls"] > 0
+            assert stats["timings"][name]["total"] >= stats["timings"][name]["max"]
+
+        # and the counters
+        counters = stats["counters"]
+        assert counters["points_sampled"] == 2000
+        assert counters["bytes_loaded"] == 2 * 4 * transform.nrows * transform.ncols
+        assert counters["load_data.misses"] == 2
+        assert counters["load_data.hits"] == 1
+
+        # and that the hook saw every measurement
+        assert ("count", "points_sampled", 1000) in events
+        assert sum(kind == "time" for kind, _, _ in events) == sum(
+            timing["calls"] for timing in stats["timings"].values()
+        )
+
+        # nothing is recorded while disabled
+        instrument.enable(False)
+        instrument.reset()
+        data.dataset(lat, lon, "bed")
+        assert bedmap2.stats()["timings"] == {}
+        assert bedmap2.stats()["counters"] == {}
+    finally:
+        instrument.hooks.clear()
+        instrument.reset()
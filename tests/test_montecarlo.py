@@ -0,0 +1,86 @@
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.montecarlo as montecarlo
+import bedmap2.transform as transform
+
+
+def test_random_points(
+    synthetic: str, tmp_path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Check that random points are drawn in proportion to the weights.
+    """
+
+    # draw points in proportion to the ice volume
+    N = 200_000
+    lat, lon, x, y, values = bedmap2.random_points(
+        N, "thickness", layers=["thickness"], seed=1
+    )
+
+    # the points should all be on the ice and consistent with each other
+    r = np.hypot(x, y)
+    assert np.all(r < 2001e3)
+    np.testing.assert_allclose(transform.latlon_to_xy(lat, lon), (x, y), rtol=1e-6)
+    np.testing.assert_allclose(values["thickness"], data.thickness(x, y, mode="xy"))
+
+    # compute the expected fraction of the volume inside 1000 km
+    xc, yc = transform.index_to_xy(np.arange(transform.ncols), np.arange(6667))
+    volume = data.load_data("thickness").filled(0.0) * montecarlo.cell_area()
+    inside = np.hypot(xc[None, :], yc[:, None]) < 1000e3
+    expected = volume[inside].sum() / volume.sum()
+
+    # and compare against the points we drew
+    np.testing.assert_allclose(np.mean(r < 1000e3), expected, atol=5e-3)
+
+    # any function of the layers can be used as a weight
+    _, _, x, y, _ = bedmap2.random_points(
+        1000, lambda: data.load_data("lakemask_vostok"), seed=2
+    )
+    assert np.all(np.hypot(x - 1000e3, y + 500e3) < 51e3)
+
+    # draws near the end of the table stay inside it
+    def single() -> np.ndarray:
+        weights = np.zeros((transform.nrows, transform.ncols))
+        weights[100, 200] = 1.0
+        return weights
+
+    cells, cdf, guide = montecarlo.weight_table(single)
+    assert np.all(guide < cells.size)
+    _, _, x, y, _ = bedmap2.random_points(100, single, seed=3)
+    np.testing.assert_allclose(transform.xy_to_index(x, y), [[200] * 100, [100] * 100])
+
+    # layers on other grids are sampled at the points but can't be weights
+    monkeypatch.setattr(data, "sources", {})
+    grid = transform.Grid(-1000e3, 1000e3, 5e3, 400, 400)
+    np.save(tmp_path / "coarse.npy", np.ones((grid.nrows, grid.ncols)))
+    data.register_layer("coarse", str(tmp_path / "coarse.npy"), grid=grid)
+    _, _, x, y, values = bedmap2.random_points(1000, layers=["coarse"], seed=4)
+    inside = (np.abs(x) < 1000e3) & (np.abs(y) < 1000e3)
+    np.testing.assert_array_equal(ma.getmaskarray(values["coarse"]), ~inside)
+    with pytest.raises(ValueError):
+        bedmap2.random_points(10, "coarse")
+    with pytest.raises(ValueError):
+        bedmap2.random_points(10, lambda: np.ones((10, 10)))
+
+    # the table of a layer follows the layer when it is registered again
+    for row in (100, 200):
+        weights = np.zeros((transform.nrows, transform.ncols), dtype=np.uint8)
+        weights[row, 300] = 1
+        np.save(tmp_path / f"{row}.npy", weights)
+        data.register_layer("single", str(tmp_path / f"{row}.npy"))
+        _, _, x, y, _ = bedmap2.random_points(10, "single", seed=5)
+        np.testing.assert_array_equal(transform.xy_to_index(x, y)[1], row)
+        data.unregister_layer("single")
+
+    # the tables of functions aren't cached but can be reused
+    table = montecarlo.weight_table(single)
+    assert montecarlo.weight_table(single) is not table
+    assert montecarlo.weight_table(table) is table
+    _, _, xt, yt, _ = bedmap2.random_points(100, table, seed=6)
+    _, _, xs, ys, _ = bedmap2.random_points(100, single, seed=6)
+    np.testing.assert_array_equal(xt, xs)
+    np.testing.assert_array_equal(yt, ys)
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.raytrace as raytrace
+import bedmap2.transform as transform
+
+
+def test_ice_path_length(synthetic: str) -> None:
+    """
+    Check the in-ice path length along vertical and horizontal chords
+    through the synthetic ice dome.
+    """
+
+    # a vertical chord through the whole ice column at a few locations
+    x = np.asarray([0.0, 250e3, -800e3, 1200e3, 2500e3])
+    y = np.asarray([0.0, -400e3, 100e3, 900e3, 0.0])
+    length = bedmap2.ice_path_length(x, y, -1e4, x, y, 1e4)
+
+    # this should be the ice thickness (with zero outside the ice sheet)
+    thickness = data.thickness(x, y, mode="xy").filled(0.0)
+    np.testing.assert_allclose(length, thickness, rtol=1e-5)
+
+    # a horizontal chord across the dome at a height of 1 km - the weights
+    # are a read-only view of a single value so we don't allocate the grid
+    weights = np.broadcast_to(2.0, (transform.nrows, transform.ncols))
+    length, weighted = bedmap2.ice_path_length(
+        -3e6, 0.0, 1e3, 3e6, 0.0, 1e3, weights=weights
+    )
+
+    # the dome surface crosses 1 km at a radius of 2000 * sqrt(8/9) km
+    np.testing.assert_allclose(length, 4e6 * np.sqrt(8.0 / 9.0), atol=2e3)
+    np.testing.assert_allclose(weighted, 2.0 * length)
+
+    # and compare a batch of random slanted chords against dense sampling
+    N = 20
+    rng = np.random.default_rng(26)
+    start = rng.uniform(-2.5e6, 2.5e6, size=(2, N))
+    end = rng.uniform(-2.5e6, 2.5e6, size=(2, N))
+    zstart = rng.uniform(-1e3, 3e3, size=N)
+    zend = rng.uniform(-1e3, 3e3, size=N)
+    length = bedmap2.ice_path_length(*start, zstart, *end, zend, batch_size=7)
+
+    # sample each chord densely (every ~10 m)
+    t = np.linspace(0.0, 1.0, 100_000)[:, None]
+    xs = start[0] + t * (end[0] - start[0])
+    ys = start[1] + t * (end[1] - start[1])
+    zs = zstart + t * (zend - zstart)
+    surface = data.surface(xs.ravel(), ys.ravel(), mode="xy").reshape(xs.shape)
+    thickness = data.thickness(xs.ravel(), ys.ravel(), mode="xy").reshape(xs.shape)
+    inside = ((zs <= surface) & (zs >= surface - thickness)).filled(False)
+    chord = np.sqrt(np.sum((end - start) ** 2.0, axis=0) + (zend - zstart) ** 2.0)
+    np.testing.assert_allclose(length, inside.mean(axis=0) * chord, atol=5e3)
+
+    # the ice column is rebuilt when the surface layer changes
+    column = raytrace.ice_column()
+    assert raytrace.ice_column() is column
+    path = data.layer_path("surface")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    try:
+        assert raytrace.ice_column() is not column
+    finally:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
@@ -0,0 +1,99 @@
+import numpy as np
+import numpy.ma as ma
+import pytest
+import rasterio
+from affine import Affine
+from conftest import clear_caches
+
+import bedmap2.data as data
+import bedmap2.transform as transform
+from bedmap2.sampler import Sampler
+
+
+def test_registry(
+    synthetic: str, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Register extra rasters as layers and sample them.
+    """
+    monkeypatch.setattr(data, "sources", {})
+
+    # a coarse 5 km raster covering part of the grid with a hole in it
+    grid = transform.Grid(-1000e3, 1000e3, 5e3, 300, 400)
+    coarse = np.arange(grid.nrows * grid.ncols, dtype=np.float32).reshape(300, 400)
+    coarse[100:110, 200:210] = -1.0
+    with rasterio.open(
+        f"{tmp_path}/coarse.tif",
+        "w",
+        driver="GTiff",
+        width=grid.ncols,
+        height=grid.nrows,
+        count=1,
+        dtype="float32",
+        nodata=-1.0,
+        transform=Affine(grid.resolution, 0, grid.x0, 0, -grid.resolution, grid.y0),
+    ) as raster:
+        raster.write(coarse, 1)
+
+    # and a NPY file on the BEDMAP2 grid
+    double = 2.0 * data.load_data("bed").filled(np.nan)
+    np.save(f"{tmp_path}/double.npy", double)
+
+    # the geometry and nodata are read from the GeoTIFF
+    source = data.register_layer("coarse", f"{tmp_path}/coarse.tif")
+    assert source.grid == grid and source.nodata == -1.0
+    data.register_layer("double", f"{tmp_path}/double.npy", nodata=np.nan)
+    assert data.layer_grid("double") == transform.bedmap_grid
+
+    # we can't register a layer twice or shadow a builtin layer
+    for name in ("coarse", "bed", "surface_slope"):
+        with pytest.raises(ValueError):
+            data.register_layer(name, f"{tmp_path}/double.npy")
+
+    # the center of every coarse cell and some points that are off the raster
+    ix, iy = np.meshgrid(np.arange(grid.ncols), np.arange(grid.nrows))
+    x = grid.x0 + grid.resolution * (ix.ravel() + 0.5)
+    y = grid.y0 - grid.resolution * (iy.ravel() + 0.5)
+    x, y = np.append(x, [-1500e3, 2000e3]), np.append(y, [0.0, -2000e3])
+    expected = ma.masked_equal(np.append(coarse.ravel(), [-1.0, -1.0]), -1.0)
+
+    # sample the coarse layer by (x, y) and by (lat, lon)
+    values = data.dataset(x, y, "coarse", mode="xy")
+    np.testing.assert_array_equal(ma.getmaskarray(values), ma.getmaskarray(expected))
+    np.testing.assert_array_equal(values.compressed(), expected.compressed())
+    lat, lon = transform.xy_to_latlon(x, y)
+    np.testing.assert_array_equal(data.dataset(lat, lon, "coarse"), values)
+
+    # sampling several grids at once matches sampling each layer
+    sampled = data.sample(lat, lon, ["bed", "coarse", "double"])
+    np.testing.assert_array_equal(sampled["coarse"], values)
+    np.testing.assert_allclose(
+        sampled["double"], 2.0 * data.dataset(lat, lon, "bed"), rtol=1e-6
+    )
+
+    # points off the raster are NaN in a floating point buffer
+    out = np.empty(x.size)
+    data.dataset(x, y, "coarse", mode="xy", out=out)
+    np.testing.assert_array_equal(np.isnan(out), ma.getmaskarray(expected))
+
+    # footprints are measured in the cells of the raster
+    means = data.dataset(x, y, "coarse", mode="xy", footprint=5e3)
+    assert means[-1] is ma.masked
+    np.testing.assert_allclose(means[401], coarse[:3, :3].mean())
+
+    # only layers on the BEDMAP2 grid can be used with a sampler
+    sampler = Sampler(lat, lon)
+    np.testing.assert_array_equal(sampler.gather("double"), sampled["double"])
+    with pytest.raises(ValueError):
+        sampler.gather("coarse")
+
+    # converted rasters are memory-mapped from the cache
+    monkeypatch.setattr(data, "layer_format", "npy")
+    clear_caches()
+    assert isinstance(ma.getdata(data.load_data("coarse")), np.memmap)
+    np.testing.assert_array_equal(data.dataset(x, y, "coarse", mode="xy"), values)
+
+    # and we can remove a layer
+    data.unregister_layer("coarse")
+    with pytest.raises(ValueError):
+        data.load_data("coarse")
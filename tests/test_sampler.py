@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import bedmap2
+import bedmap2.data as data
+
+
+def test_sampler(synthetic: str, tmp_path) -> None:
+    """
+    Sample layers with a precompiled sampler.
+    """
+
+    # a set of points on the grid and a few off the grid
+    lat = np.random.uniform(-90, -60, size=(50, 20))
+    lon = np.random.uniform(-180, 180, size=(50, 20))
+    sampler = bedmap2.Sampler(lat, lon)
+    offgrid = bedmap2.Sampler([0.0, 5e6, np.nan], [0.0, 0.0, 0.0], mode="xy")
+    assert sampler.index.dtype == np.int32
+
+    # check against sampling each layer directly
+    for name in ("bed", "surface", "thickness"):
+        values = sampler.gather(name)
+        expected = data.dataset(lat, lon, name)
+        assert values.shape == lat.shape
+        np.testing.assert_array_equal(values.mask, np.ma.getmaskarray(expected))
+        np.testing.assert_array_equal(values.compressed(), expected.compressed())
+
+    # points off the grid are masked
+    np.testing.assert_array_equal(offgrid.gather("bed").mask, [False, True, True])
+
+    # we can sample our own (i.e. perturbed) layers
+    perturbed = data.load_data("bed") + 10.0
+    np.testing.assert_allclose(
+        sampler.gather(perturbed), sampler.gather("bed") + 10.0, rtol=1e-6
+    )
+    with pytest.raises(ValueError):
+        sampler.gather(np.zeros((10, 10)))
+
+    # and save and reload the sampler
+    sampler.save(str(tmp_path / "sampler.npz"))
+    loaded = bedmap2.Sampler.load(str(tmp_path / "sampler.npz"))
+    assert loaded.shape == sampler.shape
+    values = loaded.sample(["bed", "surface"])
+    np.testing.assert_array_equal(values["bed"], sampler.gather("bed"))
+    np.testing.assert_array_equal(
+        values["surface"].mask, sampler.gather("surface").mask
+    )
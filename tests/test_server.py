@@ -0,0 +1,60 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+import bedmap2.data as data
+import bedmap2.server as server
+
+
+def test_server(synthetic: str, tmp_path) -> None:
+    """
+    Sample layers through a local sampling server.
+    """
+
+    # start a server on a Unix socket with the layers preloaded
+    address = str(tmp_path / "bedmap2.sock")
+    srv = server.make_server(address, preload=["bed", "surface"])
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with server.Client(address) as client:
+            # send a few batches over the same connection
+            for n in (1, 1000, 10_000):
+                x, y = np.random.uniform(-3e6, 3e6, size=(2, n))
+                values = client.sample(x, y, ["bed", "surface"], mode="xy")
+                expected = data.sample(x, y, ["bed", "surface"], mode="xy")
+                for name in ("bed", "surface"):
+                    np.testing.assert_array_equal(
+                        values[name].mask, np.ma.getmaskarray(expected[name])
+                    )
+                    np.testing.assert_allclose(
+                        values[name].compressed(), expected[name].compressed()
+                    )
+
+            # an invalid layer should raise an error but keep the connection
+            with pytest.raises(RuntimeError):
+                client.sample(0.0, 0.0, ["not_a_layer"], mode="xy")
+
+            # and check the statistics
+            stats = client.stats()
+            assert stats["requests"] == 3
+            assert stats["errors"] == 1
+            assert stats["points"] == 11_001
+
+        # a request that is too large gets an error and the server hangs up
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(address)
+            length = server.MAX_POINTS + 1
+            sock.sendall(server.HEADER.pack(server.MAGIC, server.SAMPLE, 1, 0, length))
+            header = bytearray(server.HEADER.size)
+            server.recv_into(sock, header)
+            magic, opcode, _, namelen, length = server.HEADER.unpack(header)
+            assert opcode == server.ERROR and namelen == 0
+            server.recv_into(sock, bytearray(length))
+            assert sock.recv(1) == b""
+    finally:
+        srv.shutdown()
+        srv.server_close()
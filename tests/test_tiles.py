@@ -0,0 +1,73 @@
+import io
+import os
+
+import matplotlib.image
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+import bedmap2.data as data
+import bedmap2.tiles as tiles
+import bedmap2.transform as transform
+
+
+def test_tiles(synthetic: str, tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Render, cache and seed map tiles from the layer overviews.
+    """
+    monkeypatch.setenv("BEDMAP2_TILES", str(tmp_path / "tiles"))
+
+    # an overview is the mean of the valid cells in each block
+    surface = data.load_data("surface")
+    overview = tiles.load_overview("surface", 16)
+    assert overview.shape == (417, 417)
+    for row, col in [(0, 0), (208, 208), (208, 100), (416, 416)]:
+        rows, cols = slice(16 * row, 16 * row + 16), slice(16 * col, 16 * col + 16)
+        block = surface[rows, cols]
+        if block.count() == 0:
+            assert overview[row, col] is ma.masked
+        else:
+            np.testing.assert_allclose(overview[row, col], block.mean(), rtol=1e-5)
+
+    # tiles at high zoom levels sample the layer itself
+    values = tiles.tile_values("surface", 6, 32, 32)
+    assert tiles.overview_factor("surface", tiles.pixel_size(6)) == 1
+    corner = transform.bedmap_grid.x0 + 32 * 256 * tiles.pixel_size(6)
+    ix, iy, _ = transform.bedmap_grid.locate(corner + 1.0, -corner - 1.0)
+    assert values[0, 0] == surface[iy, ix]
+
+    # the zoom 0 tile is transparent off the ice sheet and opaque on it
+    png = tiles.render_tile("surface", 0, 0, 0)
+    image = matplotlib.image.imread(io.BytesIO(png))
+    assert image.shape == (256, 256, 4)
+    assert image[0, 0, 3] == 0 and image[128, 128, 3] == 1
+
+    # the second time we render a tile it comes from the cache
+    assert os.path.exists(tmp_path / "tiles")
+    assert tiles.render_tile("surface", 0, 0, 0) == png
+    with pytest.raises(ValueError):
+        tiles.render_tile("surface", 1, 2, 0)
+
+    # the cache evicts the least recently used tiles
+    cache = tiles.TileCache(str(tmp_path / "lru"), maxsize=4000)
+    for i in range(4):
+        cache.put(f"{i}.png", bytes(1000))
+    assert cache.get("0.png") is not None
+    cache.put("4.png", bytes(1000))
+    assert cache.get("1.png") is None and cache.get("0.png") is not None
+    assert cache.size is not None and cache.size <= 3000
+
+    # and we can seed tiles with several workers
+    assert tiles.main(["seed", "-l", "bed", "-z", "0", "1", "-j", "2"]) == 0
+    seeded = [name for _, _, names in os.walk(tmp_path / "tiles") for name in names]
+    assert len(seeded) == 1 + 1 + 4
+
+    # the in-memory caches follow a layer when it is registered again
+    monkeypatch.setattr(data, "sources", {})
+    grid = transform.Grid(-1000e3, 1000e3, 5e3, 400, 400)
+    for value in (1.0, 2.0):
+        np.save(tmp_path / f"{value}.npy", np.full((grid.nrows, grid.ncols), value))
+        data.register_layer("constant", str(tmp_path / f"{value}.npy"), grid=grid)
+        assert tiles.value_range("constant") == (value, value)
+        assert tiles.load_overview("constant", 16).max() == value
+        data.unregister_layer("constant")
@@ -27,3 +27,83 @@ def test_consistent():
     # and make sure they match
     np.testing.assert_allclose(lat, latc)
     np.testing.assert_allclose(lon, lonc)
+
+
+def test_out():
+    """
+    Convert strided and float32 coordinates into caller-supplied buffers.
+    """
+
+    # the coordinates as the columns of a structured array
+    N = 10_000
+    points = np.zeros(N, dtype=[("lat", "f8"), ("lon", "f8"), ("z", "i4")])
+    points["lat"] = np.random.uniform(-70.0, -90.0, size=N)
+    points["lon"] = np.random.uniform(-180.0, 180.0, size=N)
+
+    # convert them into buffers and check against the default outputs
+    out = (np.empty(N), np.empty(N))
+    x, y = transform.latlon_to_xy(points["lat"], points["lon"], out=out)
+    assert x is out[0] and y is out[1]
+    expected = transform.latlon_to_xy(np.copy(points["lat"]), np.copy(points["lon"]))
+    np.testing.assert_array_equal(x, expected[0])
+    np.testing.assert_array_equal(y, expected[1])
+
+    # and back again
+    lat, lon = transform.xy_to_latlon(x, y, out=(np.empty(N), np.empty(N)))
+    np.testing.assert_allclose(lat, points["lat"])
+    np.testing.assert_allclose(lon, points["lon"])
+
+    # float32 inputs are computed in float32
+    lat32, lon32 = points["lat"].astype(np.float32), points["lon"].astype(np.float32)
+    x32, y32 = transform.latlon_to_xy(lat32, lon32)
+    assert x32.dtype == np.float32 and y32.dtype == np.float32
+    np.testing.assert_allclose(x32, x, atol=10.0)
+    lat, lon = transform.xy_to_latlon(x32, y32)
+    assert lat.dtype == np.float32
+    np.testing.assert_allclose(lat, lat32, atol=1e-3)
+
+
+def test_grid_conventions():
+    """
+    Check how the BEDMAP2 indices relate to the geotransform of the grid.
+    """
+
+    # random points away from the edges of the grid
+    rng = np.random.default_rng(45)
+    x, y = rng.uniform(
+        1e3 * transform.psmin + 1e3, 1e3 * transform.psmax - 1e3, (2, 1000)
+    )
+
+    # the BEDMAP2 cells are offset by half a cell from the geotransform
+    ix, iy = transform.xy_to_index(x, y)
+    gx, gy, valid = transform.bedmap_grid.locate(x - 500.0, y + 500.0)
+    assert np.all(valid)
+    np.testing.assert_array_equal(ix, gx)
+    np.testing.assert_array_equal(iy, gy)
+
+    # and the BEDMAP2 indices mirror points past the edge of the grid
+    x, y = np.asarray([1e3 * transform.psmin - 2500.0]), np.zeros(1)
+    assert transform.xy_to_index(x, y)[0][0] == 2
+    assert not transform.bedmap_grid.locate(x, y)[2][0]
+
+
+def test_masked_inputs():
+    """
+    Check that masked coordinates stay masked through the transforms.
+    """
+    x = np.ma.masked_array([100e3, 200e3, 300e3], mask=[False, True, False])
+    y = np.asarray([100e3, -100e3, 0.0])
+
+    # masked (x, y) give masked (lat, lon)
+    lat, lon = transform.xy_to_latlon(x, y)
+    np.testing.assert_array_equal(np.ma.getmaskarray(lat), x.mask)
+    np.testing.assert_array_equal(np.ma.getmaskarray(lon), x.mask)
+    np.testing.assert_allclose(
+        lat.compressed(), transform.xy_to_latlon(x[~x.mask], y[~x.mask])[0]
+    )
+
+    # and masked (lat, lon) give masked (x, y)
+    xc, yc = transform.latlon_to_xy(lat, lon)
+    np.testing.assert_array_equal(np.ma.getmaskarray(xc), x.mask)
+    np.testing.assert_allclose(xc.compressed(), x.compressed())
+    np.testing.assert_allclose(yc.compressed(), y[~x.mask], atol=1e-6)
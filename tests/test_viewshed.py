@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+import bedmap2
+import bedmap2.data as data
+import bedmap2.transform as transform
+
+
+def test_viewshed(synthetic: str) -> None:
+    """
+    Check the visibility of the synthetic ice dome from above the pole.
+    """
+
+    # an observer 10 m above the top of the dome
+    view = bedmap2.viewshed(-90.0, 0.0, 3010.0, radius=50e3)
+
+    # the viewshed should be cached for each observer position
+    assert view is bedmap2.viewshed(-90.0, 0.0, 3010.0, radius=50e3)
+
+    # and for each version of the surface layer
+    path = data.layer_path("surface")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    try:
+        assert view is not bedmap2.viewshed(-90.0, 0.0, 3010.0, radius=50e3)
+    finally:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    # get the distance of each cell in the window from the pole
+    rows, cols = view.window
+    x, y = transform.index_to_xy(
+        np.arange(cols.start, cols.stop), np.arange(rows.start, rows.stop)
+    )
+    r = np.hypot(x[None, :], y[:, None])
+
+    # the dome and the Earth curve away so the horizon is ~11 km away
+    assert view.visible.shape == r.shape
+    assert np.all(view.visible[r < 9e3])
+    assert not np.any(view.visible[r > 14e3])
+    assert np.all(view.horizon < 0.0)
+
+    # and an observer high above the dome can see everything in range
+    view = bedmap2.viewshed(-90.0, 0.0, 100e3, radius=50e3)
+    np.testing.assert_array_equal(view.visible, r <= 50e3)
+    assert view.azimuth.size == view.horizon.size